@@ -2,6 +2,7 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from fastapi import HTTPException, Depends
 from django.conf import settings
+from django.contrib.auth import get_user_model
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -12,4 +13,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise HTTPException(status_code=401, detail="Invalid token")
         return user_id
     except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+async def get_current_admin_user(user_id: int = Depends(get_current_user)):
+    user = await get_user_model().objects.filter(id=user_id, is_active=True).afirst()
+    if user is None or not user.is_staff:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return user
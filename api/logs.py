@@ -0,0 +1,93 @@
+import atexit
+import itertools
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+REDACTED_KEYS = frozenset({"first_name", "last_name", "username", "phone_number"})
+REDACTED = "***"
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as compact single-line JSON, including any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that leaves all formatting to the listener thread.
+
+    The stock `QueueHandler.prepare` formats the record in the calling thread,
+    which would put message interpolation and JSON encoding back on the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class PayloadSampler:
+    """Selects 1 in `rate` events for full payload logging (0 disables sampling)."""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._counter = itertools.count()
+
+    def sample(self) -> bool:
+        return self.rate > 0 and next(self._counter) % self.rate == 0
+
+
+def redact(payload: Any) -> Any:
+    """Return a copy of a JSON-like payload with names and usernames masked."""
+    if isinstance(payload, dict):
+        return {
+            key: REDACTED if key in REDACTED_KEYS and value is not None else redact(value)
+            for key, value in payload.items()
+        }
+    if isinstance(payload, list):
+        return [redact(item) for item in payload]
+    return payload
+
+
+def configure_logging(level: str = "INFO") -> None:
+    """Route all logging through a queue drained by a background listener thread.
+
+    Log calls on the event loop only enqueue the record; formatting as JSON lines
+    and writing to stdout happen in the listener thread. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
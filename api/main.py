@@ -7,8 +7,13 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_app.settings")
 import django
 django.setup()
 
+# Configure logging before anything else logs
+from django.conf import settings
+from api.logs import configure_logging
+configure_logging(settings.LOG_LEVEL)
+
 # Now import your routers
-# from api.routers import finance
+from api.routers import finance
 from api.routers import telegram
 from api.routers.telegram import lifespan
 
@@ -30,4 +35,4 @@ app.add_middleware(
 
 # Include routers
 app.include_router(telegram.router, prefix="/api", tags=["telegram"])
-# app.include_router(finance.router)
\ No newline at end of file
+app.include_router(finance.router, prefix="/api")
\ No newline at end of file
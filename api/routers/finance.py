@@ -1,10 +1,42 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from django.conf import settings
+from core.reference import currency_cache
 from api.dependencies import get_current_user
 from api.services import FinanceService
+from api.services.export import EXPORT_FORMATS, ExportBusy, export_filename, stream_export
 
 router = APIRouter(prefix="/finance", tags=["finance"])
 
 @router.get("/currencies")
 async def list_currencies():
-    # Implement currency listing
-    pass
\ No newline at end of file
+    """List the currencies, ordered by code (served from the reference cache)."""
+    return [
+        {"code": currency.code, "name": currency.name, "symbol": currency.symbol, "is_default": currency.is_default}
+        for currency in await currency_cache.aall()
+    ]
+
+@router.get("/export")
+async def export_transactions(format: str = "csv", gzip: bool = False, user_id: int = Depends(get_current_user)):
+    """Stream the current user's incomes and expenses as CSV or JSON Lines, optionally gzipped."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}")
+    
+    filename = export_filename(format, gzip)
+    chunks = stream_export(user_id, format, gzip, chunk_size=settings.EXPORT_CHUNK_SIZE)
+    # Start the export before answering, so a full export pool is reported as such
+    try:
+        first = await anext(chunks, b"")
+    except ExportBusy:
+        raise HTTPException(status_code=503, detail="Too many exports are running, please try again later")
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(
+        body(),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,17 +1,30 @@
 import os
+import json
+import asyncio
 import logging
 from contextlib import asynccontextmanager
-from fastapi import APIRouter, Request, FastAPI, HTTPException
-from api.schemas import TelegramUpdate
+from asgiref.sync import sync_to_async
+from fastapi import APIRouter, Depends, Request, FastAPI, HTTPException
+from api.dependencies import get_current_admin_user
+from api.schemas import BroadcastRequest
+from api.logs import PayloadSampler, redact
 from api.services.telegram import TelegramService
 from api.services.finance import FinanceService
+from api.services.dispatcher import UpdateDispatcher
+from api.services.dedup import DatabaseDedupBackend, UpdateDeduplicator
+from api.services.bulk import BulkUpdateIngestor, NDJSONStreamingResponse
+from api.services.inline_reply import capture_inline_reply, inline_stats
+from api.services.identity import identity_cache
+from api.services.categories import category_resolver
+from api.services.scheduler import recurring_scheduler
+from api.services.broadcast import broadcasts, notifier
+from django.conf import settings
+from core.models import Broadcast
+from core.partitions import ensure_partitions
 from django.contrib.auth import get_user_model
 from dotenv import load_dotenv
+from telegram import Update
 
-# Configure logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -21,12 +34,25 @@ router = APIRouter()
 token = os.environ.get("TELEGRAM_BOT_TOKEN")
 webhook_url = os.environ.get("WEBHOOK_URL")
 telegram_service = TelegramService(token=token)
+dispatcher = UpdateDispatcher(
+    telegram_service.process_update,
+    workers=settings.WEBHOOK_WORKERS,
+    queue_size=settings.WEBHOOK_QUEUE_SIZE,
+)
+payload_sampler = PayloadSampler(settings.LOG_PAYLOAD_SAMPLE_RATE)
+deduplicator = UpdateDeduplicator(
+    window=settings.WEBHOOK_DEDUP_WINDOW,
+    backend=DatabaseDedupBackend() if settings.WEBHOOK_DEDUP_PERSIST else None,
+)
 
 help_text = (
 """*FinanceBot Help:*\n
 Use the following commands:
 `/add_income [amount] [category] [description]` - Log an income
 `/add_expense [amount] [category] [description]` - Log an expense
+`/budget [category] [amount]` - Set a monthly budget
+`/search [text]` - Find transactions by description
+`/recurring [income|expense] [amount] [category] [schedule]` - Record a transaction on a schedule
 `/help` - Show this message again"""
 )
     
@@ -46,15 +72,38 @@ async def lifespan(app: FastAPI):
     else:
         logger.info("Webhook already set correctly")
     
+    # Rows beyond the last monthly partition land in the default one until this runs again
+    created = await sync_to_async(ensure_partitions)(settings.TRANSACTION_PARTITIONS_AHEAD)
+    if created:
+        logger.info(f"Created transaction partitions: {', '.join(created)}")
+    
+    await deduplicator.start()
+    if settings.WEBHOOK_MODE == "queue":
+        await dispatcher.start()
+    if settings.RECURRING_SCHEDULER:
+        await recurring_scheduler.start(on_recorded=telegram_service.send_recurring_notices)
+    # Broadcasts interrupted by a restart carry on from their last finished chunk
+    resumed = await broadcasts.resume(telegram_service.bulk_bot)
+    if resumed:
+        logger.info(f"Resuming broadcasts: {', '.join(map(str, resumed))}")
+    
     logger.info("Bot and application initialized successfully")
     
     yield  # This is where the app runs
     
+    await recurring_scheduler.stop()
+    await broadcasts.stop()
+    # Let queued updates finish before the bot goes away
+    await dispatcher.stop()
+    await deduplicator.stop()
+    
     # Shutdown: Remove webhook and shutdown application
     if telegram_service.bot and telegram_service.bot._initialized:
         await telegram_service.bot.delete_webhook()
         await telegram_service.bot.shutdown()
         logger.info("Bot shut down")
+    if telegram_service.bulk_bot._initialized:
+        await telegram_service.bulk_bot.shutdown()
     
     if telegram_service.application and telegram_service.application._initialized:
         await telegram_service.application.shutdown()
@@ -70,28 +119,57 @@ async def telegram_webhook(request: Request):
     financial transactions through an interactive menu system.
     """
     try:
-        update_data = await request.json()
-        logger.info(f"Received webhook update: {update_data}")
+        body = await request.body()
         
         # Validate update data
-        if not update_data:
+        if not body:
             logger.error("Empty update data received")
             raise HTTPException(status_code=400, detail="Empty update data")
             
-        # Create TelegramUpdate object
+        # Decode the raw body straight into a telegram Update
         try:
-            update = TelegramUpdate(**update_data)
-        except Exception as e:
-            logger.error(f"Error parsing update data: {str(e)}")
+            update = telegram_service.decode_update(body)
+        except ValueError as e:
+            logger.error("Error parsing update data", extra={"error": str(e), "size": len(body)})
             raise HTTPException(status_code=400, detail=f"Invalid update format: {str(e)}")
         
+        update_type = next((name for name in Update.ALL_TYPES if getattr(update, name, None)), None)
+        logger.info("Received webhook update", extra={"update_id": update.update_id, "update_type": update_type})
+        if payload_sampler.sample():
+            logger.info("Sampled webhook payload", extra={"update_id": update.update_id, "payload": redact(update.to_dict())})
+        
+        # Drop redeliveries of updates that were already accepted
+        if deduplicator.seen(update.update_id):
+            logger.info("Dropping duplicate update", extra={"update_id": update.update_id})
+            return {"status": "duplicate"}
+        
+        # In queue mode, acknowledge right away and let the worker pool process it
+        if dispatcher.running:
+            try:
+                dispatcher.submit_nowait(TelegramService.ordering_key(update), update)
+            except asyncio.QueueFull:
+                logger.warning("Update queue full, rejecting update", extra={"update_id": update.update_id})
+                deduplicator.forget(update.update_id)
+                raise HTTPException(status_code=503, detail="Update queue is full")
+            return {"status": "queued"}
+        
         # Process the update through the Telegram service
         try:
-            result = await telegram_service.process_update(update)
-            logger.info(f"Update processed successfully: {result}")
+            if settings.WEBHOOK_INLINE_REPLY:
+                # Return the handler's last Bot API call in the response instead of sending it
+                with capture_inline_reply() as capture:
+                    result = await telegram_service.process_update(update)
+                if (reply := capture.to_response()) is not None:
+                    logger.info("Update processed", extra={"update_id": update.update_id, "status": result.status, "inline_reply": reply["method"]})
+                    return reply
+            else:
+                result = await telegram_service.process_update(update)
+            logger.info("Update processed", extra={"update_id": update.update_id, "status": result.status})
             return {"status": "success", "details": result.details}
         except Exception as e:
-            logger.error(f"Error processing update: {str(e)}")
+            logger.error("Error processing update", extra={"update_id": update.update_id, "error": str(e)})
+            # Telegram will redeliver it, so let the retry through
+            deduplicator.forget(update.update_id)
             raise HTTPException(status_code=500, detail=f"Error processing update: {str(e)}")
             
     except HTTPException:
@@ -100,6 +178,81 @@ async def telegram_webhook(request: Request):
         logger.error(f"Unexpected error in webhook: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/webhook/bulk")
+async def telegram_webhook_bulk(request: Request, admin=Depends(get_current_admin_user)):
+    """
+    Replay saved Telegram updates, e.g. for backfill after an outage (admin only).
+    
+    The request body is NDJSON with one update per line. It is parsed incrementally
+    and processed with bounded concurrency, keeping updates from the same user in
+    order. One NDJSON result line per update is streamed back as updates complete.
+    """
+    logger.info(f"Bulk update ingestion started by {admin}")
+    ingestor = BulkUpdateIngestor(
+        telegram_service,
+        deduplicator=deduplicator,
+        concurrency=settings.BULK_INGEST_CONCURRENCY,
+    )
+    
+    async def results():
+        async for result in ingestor.run(request.stream()):
+            yield json.dumps(result) + "\n"
+    
+    return NDJSONStreamingResponse(results())
+
+@router.post("/broadcasts")
+async def create_broadcast(payload: BroadcastRequest, admin=Depends(get_current_admin_user)):
+    """Send a message to every Telegram user in the background (admin only).
+    
+    Delivery is rate limited (see `api.services.broadcast`); poll the
+    returned broadcast for progress.
+    """
+    broadcast = await broadcasts.create(payload.text, created_by=admin)
+    broadcasts.start(telegram_service.bulk_bot, broadcast.pk)
+    logger.info(f"Broadcast {broadcast.pk} started by {admin}")
+    return {"id": broadcast.pk, "status": broadcast.status}
+
+@router.get("/broadcasts/{broadcast_id}")
+async def get_broadcast(broadcast_id: int, admin=Depends(get_current_admin_user)):
+    """Progress of a broadcast (admin only)."""
+    broadcast = await Broadcast.objects.filter(pk=broadcast_id).afirst()
+    if broadcast is None:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return {
+        "id": broadcast.pk,
+        "status": broadcast.status,
+        "sent": broadcast.sent,
+        "blocked": broadcast.blocked,
+        "failed": broadcast.failed,
+        "last_user_id": broadcast.last_user_id,
+        "created_at": broadcast.created_at,
+        "finished_at": broadcast.finished_at,
+    }
+
+@router.delete("/broadcasts/{broadcast_id}")
+async def cancel_broadcast(broadcast_id: int, admin=Depends(get_current_admin_user)):
+    """Stop a broadcast after the chunk being sent (admin only)."""
+    if not await broadcasts.cancel(broadcast_id):
+        raise HTTPException(status_code=409, detail="Broadcast is not pending or running")
+    return {"id": broadcast_id, "status": Broadcast.CANCELLED}
+
+@router.get("/metrics")
+async def metrics(admin=Depends(get_current_admin_user)):
+    """Expose webhook ingestion metrics to staff users."""
+    return {
+        "dispatcher": dispatcher.stats(),
+        "dedup": deduplicator.stats(),
+        "inline_reply": inline_stats,
+        "identity_cache": identity_cache.stats(),
+        "category_cache": category_resolver.stats(),
+        "recurring_scheduler": recurring_scheduler.stats(),
+        "notifier": notifier.stats(),
+        "bot_http": {
+            "interactive": telegram_service.bot.request.metrics.stats(),
+            "bulk": telegram_service.bulk_bot.request.metrics.stats(),
+        },
+    }
+
 @router.get("/")
 async def home(request: Request):
     """Health check endpoint."""
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, with_config
+from typing import Any, Optional, List
+from typing_extensions import NotRequired, TypedDict
 
 class MessageEntity(BaseModel):
     offset: int
@@ -41,6 +42,26 @@ class TelegramUpdate(BaseModel):
     message: Optional[TelegramMessage] = None
     callback_query: Optional[CallbackQuery] = None
 
+@with_config(ConfigDict(extra="allow"))
+class TelegramUpdatePayload(TypedDict):
+    """Raw Telegram update, validated straight from the request body.
+
+    Only the envelope is checked here; the nested objects are kept as the plain
+    dicts python-telegram-bot's `Update.de_json` expects (with the original
+    `from` keys). Update types not listed are passed through untouched.
+    """
+    update_id: int
+    message: NotRequired[dict[str, Any]]
+    edited_message: NotRequired[dict[str, Any]]
+    channel_post: NotRequired[dict[str, Any]]
+    edited_channel_post: NotRequired[dict[str, Any]]
+    callback_query: NotRequired[dict[str, Any]]
+    inline_query: NotRequired[dict[str, Any]]
+    my_chat_member: NotRequired[dict[str, Any]]
+    chat_member: NotRequired[dict[str, Any]]
+
+update_payload_adapter = TypeAdapter(TelegramUpdatePayload)
+
 class FinancialRecord(BaseModel):
     amount: float
     currency_code: str
@@ -50,4 +71,7 @@ class FinancialRecord(BaseModel):
 class CommandResponse(BaseModel):
     status: str
     details: dict
-    chat_id: Optional[int] = None  
\ No newline at end of file
+    chat_id: Optional[int] = None  
+
+class BroadcastRequest(BaseModel):
+    text: str = Field(min_length=1, max_length=4096)  # Telegram's message length limit
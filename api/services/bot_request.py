@@ -0,0 +1,171 @@
+import logging
+import time
+from collections import defaultdict
+from typing import Optional
+import httpx
+from django.conf import settings
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# httpcore trace events that mean a request got a connection from the pool:
+# it starts opening a new one, or starts sending on an existing one
+_CONNECTED_EVENTS = ("connect_tcp.started", "send_connection_init.started", "send_request_headers.started")
+
+
+class RequestMetrics:
+    """In-flight requests, connection pool waits and per-method latency of one Bot API client."""
+
+    def __init__(self, name: str, pool_size: int, http_version: str):
+        self.name = name
+        self.pool_size = pool_size
+        self.http_version = http_version
+        self.in_flight = 0
+        self.in_flight_max = 0
+        self.waiting = 0  # Requests waiting for a pooled connection
+        self.pool_waits = 0
+        self.pool_timeouts = 0
+        self._pool_wait_total = 0.0
+        self._pool_wait_max = 0.0
+        self._methods = defaultdict(lambda: {"count": 0, "errors": 0, "total": 0.0, "max": 0.0})
+
+    def record_pool_wait(self, wait: float) -> None:
+        self.pool_waits += 1
+        self._pool_wait_total += wait
+        self._pool_wait_max = max(self._pool_wait_max, wait)
+
+    def record_call(self, method: str, latency: float, ok: bool) -> None:
+        calls = self._methods[method]
+        calls["count"] += 1
+        calls["errors"] += not ok
+        calls["total"] += latency
+        calls["max"] = max(calls["max"], latency)
+
+    def stats(self) -> dict:
+        """Snapshot of the client's metrics."""
+        return {
+            "pool_size": self.pool_size,
+            "http_version": self.http_version,
+            "in_flight": self.in_flight,
+            "in_flight_max": self.in_flight_max,
+            "waiting_for_connection": self.waiting,
+            "pool_wait_avg_ms": round(self._pool_wait_total / self.pool_waits * 1000, 3) if self.pool_waits else 0.0,
+            "pool_wait_max_ms": round(self._pool_wait_max * 1000, 3),
+            "pool_timeouts": self.pool_timeouts,
+            "methods": {
+                method: {
+                    "count": calls["count"],
+                    "errors": calls["errors"],
+                    "avg_ms": round(calls["total"] / calls["count"] * 1000, 3),
+                    "max_ms": round(calls["max"] * 1000, 3),
+                }
+                for method, calls in sorted(self._methods.items())
+            },
+        }
+
+
+class TracingTransport(httpx.AsyncHTTPTransport):
+    """Connection pool transport that measures how long each request waits for a connection.
+
+    httpcore reports (through the `trace` request extension) when a request
+    starts connecting or sending on a connection; until then it was queued
+    in the pool.
+    """
+
+    def __init__(self, metrics: RequestMetrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        waiting = True
+        self.metrics.waiting += 1
+
+        async def trace(event: str, info: dict) -> None:
+            nonlocal waiting
+            if waiting and event.endswith(_CONNECTED_EVENTS):
+                waiting = False
+                self.metrics.waiting -= 1
+                self.metrics.record_pool_wait(time.perf_counter() - started)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            return await super().handle_async_request(request)
+        except httpx.PoolTimeout:
+            self.metrics.pool_timeouts += 1
+            raise
+        finally:
+            if waiting:
+                self.metrics.waiting -= 1
+
+
+class MeteredHTTPXRequest(HTTPXRequest):
+    """python-telegram-bot's httpx client with a tunable pool and metrics (see `RequestMetrics`)."""
+
+    def __init__(self, name: str, pool_size: int, keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: float = 5.0, http_version: str = "1.1", connect_timeout: float = 5.0,
+                 read_timeout: float = 5.0, write_timeout: float = 5.0, pool_timeout: float = 1.0):
+        """Create a client.
+
+        Args:
+            name (str): Name of the client in the metrics
+            pool_size (int): Connections open at once
+            keepalive_connections (int, optional): Idle connections kept open, defaults to `pool_size`
+            keepalive_expiry (float): Seconds an idle connection is kept open
+            http_version (str): "1.1" or "2" (needs the `h2` package, `pip install "httpx[http2]"`)
+            connect_timeout (float): Seconds to wait for a new connection
+            read_timeout (float): Seconds to wait for a response
+            write_timeout (float): Seconds to wait for a request to be sent
+            pool_timeout (float): Seconds to wait for a free connection before failing with `TimedOut`
+        """
+        self.metrics = RequestMetrics(name, pool_size, http_version)
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size if keepalive_connections is None else keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        super().__init__(
+            connection_pool_size=pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            pool_timeout=pool_timeout,
+            http_version=http_version,
+            httpx_kwargs={"limits": limits},
+        )
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # A fresh transport every time, since the client closes its transport on shutdown.
+        # The client ignores its pool options when given a transport, so they go to the transport.
+        kwargs = self._client_kwargs
+        transport = TracingTransport(self.metrics, limits=kwargs["limits"], http1=kwargs["http1"], http2=kwargs["http2"])
+        return httpx.AsyncClient(**{**kwargs, "transport": transport})
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        self.metrics.in_flight += 1
+        self.metrics.in_flight_max = max(self.metrics.in_flight_max, self.metrics.in_flight)
+        started = time.perf_counter()
+        ok = False
+        try:
+            status, content = await super().do_request(url, method, *args, **kwargs)
+            ok = status < 400
+            return status, content
+        finally:
+            self.metrics.in_flight -= 1
+            self.metrics.record_call(endpoint, time.perf_counter() - started, ok)
+
+
+def bot_request(name: str, pool_size: int, pool_timeout: float) -> MeteredHTTPXRequest:
+    """A Bot API client with the pool settings shared by every client (`BOT_HTTP_*`)."""
+    return MeteredHTTPXRequest(
+        name,
+        pool_size=pool_size,
+        keepalive_connections=settings.BOT_HTTP_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.BOT_HTTP_KEEPALIVE_EXPIRY,
+        http_version=settings.BOT_HTTP_VERSION,
+        connect_timeout=settings.BOT_HTTP_CONNECT_TIMEOUT,
+        read_timeout=settings.BOT_HTTP_READ_TIMEOUT,
+        write_timeout=settings.BOT_HTTP_WRITE_TIMEOUT,
+        pool_timeout=pool_timeout,
+    )
@@ -0,0 +1,327 @@
+"""Rate-limited delivery of bot messages to many users.
+
+`Notifier.send` keeps every message within Telegram's flood limits (about
+30 messages a second overall and one a second per chat): it takes a token
+from a global bucket and from the chat's own bucket, bounds the number of
+requests in flight, and when Telegram still answers 429 it pauses the
+global bucket for the `retry_after` it asks for before retrying.
+
+`BroadcastRunner` fans a `Broadcast` out to every Telegram user through a
+notifier, reading recipients from the database in chunks by user id and
+recording progress after each chunk, so an interrupted broadcast resumes
+where it stopped.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+from typing import Callable, Optional
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F, Q
+from django.utils import timezone
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from core.models import Broadcast
+
+logger = logging.getLogger(__name__)
+
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+
+class TokenBucket:
+    """Refills at `rate` tokens a second, up to `capacity`.
+
+    Tokens are reserved rather than waited for: `reserve` takes one straight
+    away, letting the balance go negative, and returns how long the caller
+    has to wait before using it. Concurrent callers are served in order
+    without a lock.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, capacity or rate)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()  # Time `_tokens` was counted at; in the future while paused
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self) -> float:
+        """Take a token, returning the seconds to wait before it may be used."""
+        now = self.clock()
+        self._refill(now)
+        self._tokens -= 1
+        return max(0.0, self._updated + max(0.0, -self._tokens) / self.rate - now)
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for `seconds` and restart without a burst after that."""
+        now = self.clock()
+        self._refill(now)
+        if now + seconds > self._updated:
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = now + seconds
+
+    def idle(self) -> bool:
+        """Whether the bucket is full, i.e. forgetting it changes nothing."""
+        return self._tokens + (self.clock() - self._updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """A global token bucket plus one bucket per chat.
+
+    Idle chat buckets are dropped once more than `max_chats` are held.
+    """
+
+    def __init__(self, rate: float, chat_rate: float, chat_burst: float = 3, max_chats: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.bucket = TokenBucket(rate, clock=clock)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self.clock = clock
+        self._chats: dict[int, TokenBucket] = {}
+
+    def _chat(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                self._chats = {key: bucket for key, bucket in self._chats.items() if not bucket.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self.clock)
+        return bucket
+
+    async def acquire(self, chat_id: int) -> None:
+        """Wait until a message may be sent to `chat_id`.
+
+        The chat's token is taken first, so a chat that is sent to too often
+        waits without holding up the global budget.
+        """
+        if delay := self._chat(chat_id).reserve():
+            await asyncio.sleep(delay)
+        if delay := self.bucket.reserve():
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        self.bucket.pause(seconds)
+
+
+class Notifier:
+    """Sends bot messages within Telegram's flood limits, with bounded concurrency and retries."""
+
+    def __init__(self, rate: float = 25, chat_rate: float = 1, concurrency: int = 10, max_retries: int = 3):
+        """Create a notifier.
+
+        Args:
+            rate (float): Messages per second overall
+            chat_rate (float): Messages per second to one chat
+            concurrency (int): Requests in flight at once
+            max_retries (int): Retries of a message after 429s, timeouts or network errors
+        """
+        self.limiter = RateLimiter(rate, chat_rate)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+        # Metrics
+        self.sent = 0
+        self.blocked = 0
+        self.failed = 0
+        self.retried = 0
+        self.throttled = 0
+
+    def _slots(self) -> asyncio.Semaphore:
+        # A semaphore belongs to one event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore, self._loop = asyncio.Semaphore(self.concurrency), loop
+        return self._semaphore
+
+    async def send(self, bot: Bot, chat_id: int, text: str, **kwargs) -> str:
+        """Send a message, waiting for the rate limits and retrying transient errors.
+
+        Args:
+            bot (Bot): The bot to send with
+            chat_id (int): Recipient chat
+            text (str): Message text
+            **kwargs: Further `Bot.send_message` arguments
+
+        Returns:
+            str: `SENT`, `BLOCKED` (the user blocked the bot or is gone) or `FAILED`
+        """
+        async with self._slots():
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    self.retried += 1
+                await self.limiter.acquire(chat_id)
+                try:
+                    await bot.send_message(chat_id, text, **kwargs)
+                    self.sent += 1
+                    return SENT
+                except RetryAfter as e:
+                    # Telegram's flood limits are mostly global: hold everything back
+                    self.throttled += 1
+                    retry_after = e.retry_after
+                    self.limiter.pause(retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after)
+                    error = e
+                except Forbidden:
+                    self.blocked += 1
+                    return BLOCKED
+                except BadRequest as e:
+                    error = e
+                    break
+                except NetworkError as e:
+                    error = e
+                    if attempt < self.max_retries:
+                        await asyncio.sleep(0.5 * 2 ** attempt)
+                except TelegramError as e:
+                    error = e
+                    break
+            self.failed += 1
+            logger.warning(f"Could not send message to {chat_id}: {str(error)}")
+            return FAILED
+
+    def stats(self) -> dict:
+        """Snapshot of delivery counters."""
+        return {
+            "sent": self.sent,
+            "blocked": self.blocked,
+            "failed": self.failed,
+            "retried": self.retried,
+            "throttled": self.throttled,
+            "chat_buckets": len(self.limiter._chats),
+        }
+
+
+class BroadcastRunner:
+    """Sends broadcasts to every Telegram user, resumably.
+
+    A process runs a broadcast only after claiming it: a pending broadcast,
+    or a running one whose owner has not recorded progress for `lease`
+    seconds (it stopped or crashed). Progress is recorded only while the
+    claim holds, so a broadcast that was cancelled or taken over stops
+    after its current chunk. Recipients of a chunk that was interrupted
+    before its progress was recorded get the message again on resume.
+    """
+
+    def __init__(self, notifier: Notifier, chunk_size: int = 500, lease: float = 300.0):
+        """Create a runner.
+
+        Args:
+            notifier (Notifier): Sends the messages
+            chunk_size (int): Recipients read and sent to between progress updates
+            lease (float): Seconds without progress after which another process may resume a broadcast
+        """
+        self.notifier = notifier
+        self.chunk_size = chunk_size
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.tasks = set()
+
+    @staticmethod
+    async def create(text: str, created_by=None) -> Broadcast:
+        return await Broadcast.objects.acreate(text=text, created_by=created_by)
+
+    @staticmethod
+    async def cancel(broadcast_id: int) -> bool:
+        """Stop a broadcast after its current chunk; returns whether it was still pending or running."""
+        return await Broadcast.objects.filter(
+            pk=broadcast_id, status__in=[Broadcast.PENDING, Broadcast.RUNNING]
+        ).aupdate(status=Broadcast.CANCELLED, owner="", finished_at=timezone.now()) > 0
+
+    def start(self, bot: Bot, broadcast_id: int) -> asyncio.Task:
+        """Run a broadcast in the background, keeping a reference to the task."""
+        task = asyncio.create_task(self._run_logged(bot, broadcast_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def resume(self, bot: Bot) -> list[int]:
+        """Start every broadcast that is pending or was left running by a stopped process.
+
+        Returns:
+            list[int]: Ids of the broadcasts started (each one is still claimed before it runs)
+        """
+        ids = [pk async for pk in self._claimable().values_list("pk", flat=True)]
+        for pk in ids:
+            self.start(bot, pk)
+        return ids
+
+    async def stop(self) -> None:
+        """Cancel the running tasks; their broadcasts resume after the lease lapses."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def _claimable(self):
+        stale = timezone.now() - timedelta(seconds=self.lease)
+        return Broadcast.objects.filter(
+            Q(status=Broadcast.PENDING) | Q(status=Broadcast.RUNNING, heartbeat_at__lt=stale)
+        )
+
+    def _owned(self, broadcast_id: int):
+        return Broadcast.objects.filter(pk=broadcast_id, status=Broadcast.RUNNING, owner=self.owner)
+
+    async def _run_logged(self, bot: Bot, broadcast_id: int) -> None:
+        try:
+            await self.run(bot, broadcast_id)
+        except Exception as e:
+            logger.error(f"Error sending broadcast {broadcast_id}: {str(e)}", exc_info=True)
+
+    async def run(self, bot: Bot, broadcast_id: int) -> Optional[Broadcast]:
+        """Claim a broadcast and send it to the remaining recipients.
+
+        Returns:
+            Optional[Broadcast]: The finished broadcast, or None if it could not be
+            claimed or was cancelled or taken over while sending
+        """
+        claimed = await self._claimable().filter(pk=broadcast_id).aupdate(
+            status=Broadcast.RUNNING, owner=self.owner, heartbeat_at=timezone.now()
+        )
+        if not claimed:
+            return None
+        broadcast = await Broadcast.objects.aget(pk=broadcast_id)
+        logger.info(f"Sending broadcast {broadcast_id} after user {broadcast.last_user_id}")
+        recipients = get_user_model().objects.filter(
+            is_telegram_user=True, is_active=True, telegram_id__isnull=False
+        ).order_by("pk").values_list("pk", "telegram_id")
+
+        last_user_id = broadcast.last_user_id
+        while chunk := [row async for row in recipients.filter(pk__gt=last_user_id)[:self.chunk_size]]:
+            outcomes = await asyncio.gather(
+                *(self.notifier.send(bot, chat_id, broadcast.text) for _, chat_id in chunk),
+                return_exceptions=True,
+            )
+            last_user_id = chunk[-1][0]
+            sent, blocked = outcomes.count(SENT), outcomes.count(BLOCKED)
+            recorded = await self._owned(broadcast_id).aupdate(
+                last_user_id=last_user_id,
+                sent=F("sent") + sent,
+                blocked=F("blocked") + blocked,
+                failed=F("failed") + len(outcomes) - sent - blocked,
+                heartbeat_at=timezone.now(),
+            )
+            if not recorded:
+                logger.info(f"Broadcast {broadcast_id} was cancelled or taken over, stopping")
+                return None
+
+        await self._owned(broadcast_id).aupdate(status=Broadcast.DONE, owner="", finished_at=timezone.now())
+        broadcast = await Broadcast.objects.aget(pk=broadcast_id)
+        logger.info(f"Broadcast {broadcast_id} done: {broadcast.sent} sent, {broadcast.blocked} blocked, {broadcast.failed} failed")
+        return broadcast
+
+
+notifier = Notifier(
+    rate=settings.BROADCAST_RATE,
+    chat_rate=settings.BROADCAST_CHAT_RATE,
+    concurrency=settings.BROADCAST_CONCURRENCY,
+)
+broadcasts = BroadcastRunner(notifier, chunk_size=settings.BROADCAST_CHUNK_SIZE, lease=settings.BROADCAST_LEASE)
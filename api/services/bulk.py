@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from api.services.dedup import UpdateDeduplicator
+from api.services.dispatcher import UpdateDispatcher
+from api.services.telegram import TelegramService
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes], max_line_size: int = 1024 * 1024) -> AsyncIterator[tuple[int, bytes]]:
+    """Split a stream of byte chunks into NDJSON lines without buffering the whole body.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The raw body stream
+        max_line_size (int): Longest accepted line in bytes
+
+    Yields:
+        tuple[int, bytes]: The 1-based line number and the line, for non-blank lines
+
+    Raises:
+        ValueError: If a line exceeds `max_line_size`
+    """
+    buffer = b""
+    line_no = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, line
+        if len(buffer) > max_line_size:
+            raise ValueError(f"Line {line_no + 1} exceeds {max_line_size} bytes")
+    if buffer.strip():
+        yield line_no + 1, buffer
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """Streaming response that can be sent while the request body is still being read.
+
+    Starlette's `StreamingResponse` listens for client disconnects by calling
+    `receive()` alongside the response on ASGI servers older than spec 2.4, which
+    would swallow request body chunks. Disconnects still surface through
+    `Request.stream()` raising `ClientDisconnect`.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+class BulkUpdateIngestor:
+    """Replays a stream of saved updates through `TelegramService.process_update`.
+
+    Updates are processed with bounded concurrency through a dedicated
+    `UpdateDispatcher`, so updates from the same user keep their order. Reading
+    the body pauses whenever the dispatcher's shards are full.
+    """
+
+    def __init__(
+        self,
+        telegram_service: TelegramService,
+        deduplicator: Optional[UpdateDeduplicator] = None,
+        concurrency: int = 8,
+        queue_size: int = 50,
+    ):
+        self.telegram_service = telegram_service
+        self.deduplicator = deduplicator
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+
+    async def run(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+        """Ingest an NDJSON body and yield one result per update as it completes.
+
+        Results have the form ``{"line": 3, "update_id": 123, "status": "success"}``
+        with status one of "success", "duplicate" or "error" (plus a "detail").
+        """
+        results: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(self._produce(chunks, results))
+        try:
+            while (result := await results.get()) is not None:
+                yield result
+        finally:
+            if not producer.done():
+                producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    async def _produce(self, chunks: AsyncIterator[bytes], results: asyncio.Queue) -> None:
+        async def process(item: tuple[int, Update]) -> None:
+            line_no, update = item
+            result = {"line": line_no, "update_id": update.update_id, "status": "success"}
+            try:
+                await self.telegram_service.process_update(update)
+            except Exception as e:
+                result.update(status="error", detail=e.detail if isinstance(e, HTTPException) else str(e))
+                if self.deduplicator:
+                    self.deduplicator.forget(update.update_id)
+            results.put_nowait(result)
+
+        dispatcher = UpdateDispatcher(process, workers=self.concurrency, queue_size=self.queue_size)
+        await dispatcher.start()
+        try:
+            async for line_no, line in iter_ndjson(chunks):
+                try:
+                    update = self.telegram_service.decode_update(line)
+                except ValueError as e:
+                    results.put_nowait({"line": line_no, "status": "error", "detail": f"Invalid update format: {str(e)}"})
+                    continue
+
+                if self.deduplicator and self.deduplicator.seen(update.update_id):
+                    results.put_nowait({"line": line_no, "update_id": update.update_id, "status": "duplicate"})
+                    continue
+
+                await dispatcher.submit(TelegramService.ordering_key(update), (line_no, update))
+        except ValueError as e:
+            results.put_nowait({"status": "error", "detail": str(e)})
+        except ClientDisconnect:
+            logger.warning("Client disconnected during bulk ingestion, finishing queued updates")
+        finally:
+            # Every queued update reports its result before the stream is closed
+            await dispatcher.stop(timeout=None)
+            results.put_nowait(None)
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterator, Optional
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded in-process mapping with least-recently-used eviction and an optional TTL.
+
+    Guarded by a lock, since Django signal handlers invalidating entries run in
+    the `sync_to_async` thread rather than on the event loop.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        """Create a cache.
+
+        Args:
+            maxsize (int): Maximum number of entries kept
+            ttl (float, optional): Seconds after which an entry expires, or None to never expire
+            on_evict (Callable, optional): Called with the key and value of each entry dropped
+                because the cache is full or the entry expired (under the cache's lock)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                if self.on_evict:
+                    self.on_evict(key, value)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted, (_, old) = self._data.popitem(last=False)
+                if self.on_evict:
+                    self.on_evict(evicted, old)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def items(self) -> Iterator[tuple[Hashable, Any]]:
+        """Iterate over a snapshot of the entries (including expired ones) without touching recency."""
+        with self._lock:
+            snapshot = list(self._data.items())
+        return ((key, value) for key, (_, value) in snapshot)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
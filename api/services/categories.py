@@ -0,0 +1,131 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from api.services.cache import LRUCache
+from core.models import Category
+
+_table = Category._meta.db_table
+
+# Insert the category unless it exists, and return its id either way. When a
+# concurrent transaction commits the same row between our snapshot and the
+# insert, neither branch returns a row and the statement is simply retried.
+UPSERT_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO {_table} (user_id, name, description, is_active, created_at, updated_at)
+        VALUES (%(user_id)s, %(name)s, '', TRUE, %(now)s, %(now)s)
+        ON CONFLICT (user_id, name) DO NOTHING
+        RETURNING id
+    )
+    SELECT id FROM inserted
+    UNION ALL
+    SELECT id FROM {_table} WHERE user_id = %(user_id)s AND name = %(name)s
+    LIMIT 1
+"""
+
+
+class CategoryResolver:
+    """Resolves (user, category name) to a category id, creating the category if needed.
+
+    Ids are kept in a bounded LRU cache, so the common case costs no query; a
+    miss costs a single upsert statement, which is also safe against two
+    concurrent requests creating the same category.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    async def resolve(self, user_id: int, name: str) -> int:
+        """Return the id of the user's category `name`, creating it if it does not exist.
+
+        Args:
+            user_id (int): Primary key of the owning user
+            name (str): Category name, matched exactly
+
+        Returns:
+            int: Primary key of the category
+        """
+        category_id = self._cache.get((user_id, name))
+        if category_id is None:
+            category_id = await sync_to_async(self._upsert)(user_id, name)
+            self._cache.set((user_id, name), category_id)
+        return category_id
+
+    def resolve_many(self, user_id: int, names) -> dict:
+        """Resolve several category names for one user in at most two queries.
+
+        Synchronous, for batch code already running outside the event loop.
+        Missing categories are created; entries are only cached once the
+        surrounding transaction commits.
+
+        Args:
+            user_id (int): Primary key of the owning user
+            names: Category names, matched exactly
+
+        Returns:
+            dict: Category id by name
+        """
+        resolved, missing = {}, []
+        for name in set(names):
+            category_id = self._cache.get((user_id, name))
+            if category_id is None:
+                missing.append(name)
+            else:
+                resolved[name] = category_id
+        if not missing:
+            return resolved
+
+        Category.objects.bulk_create(
+            [Category(user_id=user_id, name=name) for name in missing],
+            ignore_conflicts=True,
+        )
+        loaded = dict(
+            Category.objects.filter(user_id=user_id, name__in=missing).values_list("name", "id")
+        )
+
+        def cache_loaded():
+            for name, category_id in loaded.items():
+                self._cache.set((user_id, name), category_id)
+
+        transaction.on_commit(cache_loaded)
+        resolved.update(loaded)
+        return resolved
+
+    @staticmethod
+    def _upsert(user_id: int, name: str) -> int:
+        params = {"user_id": user_id, "name": name, "now": timezone.now()}
+        with connection.cursor() as cursor:
+            for _ in range(3):
+                cursor.execute(UPSERT_SQL, params)
+                row = cursor.fetchone()
+                if row is not None:
+                    return row[0]
+        raise RuntimeError(f"Could not resolve category {name!r}")
+
+    def forget(self, user_id: int, name: str) -> None:
+        self._cache.pop((user_id, name))
+
+    def invalidate(self, category) -> None:
+        """Drop any entry pointing at `category`, including one under a previous name."""
+        if self._cache.pop((category.user_id, category.name)) == category.pk:
+            return
+        for key, category_id in self._cache.items():
+            if category_id == category.pk:
+                self._cache.pop(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+category_resolver = CategoryResolver(maxsize=settings.CATEGORY_CACHE_SIZE)
+
+
+@receiver(post_save, sender=Category, dispatch_uid="category_resolver_category_saved")
+@receiver(post_delete, sender=Category, dispatch_uid="category_resolver_category_deleted")
+def invalidate_cached_category(sender, instance, **kwargs):
+    category_resolver.invalidate(instance)
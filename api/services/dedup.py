@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+from core.models import ProcessedUpdate
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseDedupBackend:
+    """Persists seen update ids in the `ProcessedUpdate` table.
+
+    Writes are buffered and flushed in batches by the deduplicator, so recording
+    an update never waits on the database.
+    """
+
+    def __init__(self):
+        self._pending: set[int] = set()
+        self._discarded: set[int] = set()
+
+    async def load(self, window: int) -> list[int]:
+        """Return the most recent `window` update ids, oldest first."""
+        ids = [
+            update_id
+            async for update_id in ProcessedUpdate.objects.order_by("-update_id").values_list("update_id", flat=True)[:window]
+        ]
+        return ids[::-1]
+
+    def add(self, update_id: int) -> None:
+        self._discarded.discard(update_id)
+        self._pending.add(update_id)
+
+    def discard(self, update_id: int) -> None:
+        if update_id in self._pending:
+            self._pending.remove(update_id)
+        else:
+            self._discarded.add(update_id)
+
+    async def flush(self, oldest: Optional[int]) -> None:
+        """Write buffered ids and prune rows that fell out of the window."""
+        pending, self._pending = self._pending, set()
+        discarded, self._discarded = self._discarded, set()
+        if pending:
+            await ProcessedUpdate.objects.abulk_create(
+                [ProcessedUpdate(update_id=update_id) for update_id in pending],
+                ignore_conflicts=True,
+            )
+        if discarded:
+            await ProcessedUpdate.objects.filter(update_id__in=discarded).adelete()
+        if pending and oldest is not None:
+            # Telegram update ids are increasing, so anything below the window's oldest id is stale
+            await ProcessedUpdate.objects.filter(update_id__lt=oldest).adelete()
+
+
+class UpdateDeduplicator:
+    """Fixed-size window of recently seen Telegram update ids.
+
+    A ring buffer (deque with maxlen) remembers arrival order and a set gives
+    O(1) membership checks; when the buffer is full the oldest id is evicted
+    from both.
+    """
+
+    def __init__(self, window: int = 10000, backend: Optional[DatabaseDedupBackend] = None, flush_interval: float = 1.0):
+        """Create a deduplicator.
+
+        Args:
+            window (int): Number of update ids to remember
+            backend (DatabaseDedupBackend, optional): Persistent store so the window survives restarts
+            flush_interval (float): Seconds between backend flushes
+        """
+        self.window = window
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self._order: deque[int] = deque(maxlen=window)
+        self._ids: set[int] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.checked = 0
+        self.duplicates = 0
+
+    async def start(self) -> None:
+        """Load the persisted window and start the background flusher."""
+        if not self.backend:
+            return
+        for update_id in await self.backend.load(self.window):
+            self._remember(update_id)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Loaded {len(self._ids)} update ids into the dedup window")
+
+    async def stop(self) -> None:
+        """Stop the flusher and write any buffered ids."""
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        if self.backend:
+            await self.backend.flush(self._oldest())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.backend.flush(self._oldest())
+            except Exception as e:
+                logger.error(f"Error persisting dedup window: {str(e)}")
+
+    def _oldest(self) -> Optional[int]:
+        if len(self._order) < self.window:
+            return None
+        return self._order[0]
+
+    def _remember(self, update_id: int) -> None:
+        if len(self._order) == self.window:
+            self._ids.discard(self._order[0])
+        self._order.append(update_id)
+        self._ids.add(update_id)
+
+    def seen(self, update_id: int) -> bool:
+        """Check an update id and record it.
+
+        Returns:
+            bool: True if the id is already in the window (a duplicate delivery)
+        """
+        self.checked += 1
+        if update_id in self._ids:
+            self.duplicates += 1
+            return True
+        self._remember(update_id)
+        if self.backend:
+            self.backend.add(update_id)
+        return False
+
+    def forget(self, update_id: int) -> None:
+        """Allow an update to be processed again, e.g. after it failed and Telegram will retry.
+
+        This is O(window), but only runs on the failure path.
+        """
+        if update_id not in self._ids:
+            return
+        self._ids.remove(update_id)
+        self._order.remove(update_id)
+        if self.backend:
+            self.backend.discard(update_id)
+
+    def stats(self) -> dict:
+        """Snapshot of dedup counters."""
+        return {
+            "window": self.window,
+            "size": len(self._ids),
+            "persistent": self.backend is not None,
+            "checked": self.checked,
+            "duplicates_dropped": self.duplicates,
+        }
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDispatcher:
+    """Worker pool that processes updates in the background, ordered per user.
+
+    Updates are sharded across a fixed number of bounded queues by a key
+    (normally the Telegram user id). Each queue is drained by exactly one
+    worker, so updates sharing a key are handled strictly in arrival order
+    while different users are processed concurrently.
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable[Any]], workers: int = 8, queue_size: int = 100):
+        """Create a dispatcher.
+
+        Args:
+            handler (Callable): Coroutine function called with each queued item
+            workers (int): Number of shards / worker tasks
+            queue_size (int): Maximum number of pending items per shard
+        """
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self._queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+
+        # Metrics
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._last_wait = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        """Create the shard queues and start one worker per shard."""
+        if self.running:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"update-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        logger.info(f"UpdateDispatcher started with {self.workers} workers")
+
+    async def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Wait for pending updates to drain (up to `timeout` seconds, or indefinitely if None),
+        then stop the workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)), timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"UpdateDispatcher stopped with {self.depth()} updates still queued")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+        logger.info("UpdateDispatcher stopped")
+
+    def _queue_for(self, key: Hashable) -> asyncio.Queue:
+        return self._queues[hash(key) % self.workers]
+
+    def submit_nowait(self, key: Hashable, item: Any) -> None:
+        """Queue an item without waiting.
+
+        Raises:
+            asyncio.QueueFull: If the shard for `key` is full
+            RuntimeError: If the dispatcher has not been started
+        """
+        if not self.running:
+            raise RuntimeError("UpdateDispatcher is not running")
+        try:
+            self._queue_for(key).put_nowait((time.monotonic(), item))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+
+    async def submit(self, key: Hashable, item: Any) -> None:
+        """Queue an item, waiting for room in its shard (backpressure for bulk producers)."""
+        if not self.running:
+            raise RuntimeError("UpdateDispatcher is not running")
+        await self._queue_for(key).put((time.monotonic(), item))
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            enqueued_at, item = await queue.get()
+            wait = time.monotonic() - enqueued_at
+            self._last_wait = wait
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing queued update: {str(e)}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    def depth(self) -> int:
+        """Total number of items waiting across all shards."""
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> dict:
+        """Snapshot of queue depth and wait time metrics."""
+        handled = self.processed + self.failed
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "depth": self.depth(),
+            "shard_depths": [queue.qsize() for queue in self._queues],
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_avg_ms": round(self._wait_total / handled * 1000, 3) if handled else 0.0,
+            "wait_max_ms": round(self._wait_max * 1000, 3),
+            "wait_last_ms": round(self._last_wait * 1000, 3),
+        }
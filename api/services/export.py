@@ -0,0 +1,250 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional
+from django.conf import settings
+from django.db import connection
+from core.models import Transaction
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+EXPORT_FIELDS = ("type", "date", "amount", "currency", "category", "description")
+
+_DONE = object()
+
+
+class ExportBusy(Exception):
+    """Raised when as many exports as allowed are running or waiting."""
+
+
+class ExportPool:
+    """Runs exports on a bounded pool of threads, each holding a database connection.
+
+    Up to `workers` exports run at once and `queue_size` more wait for a
+    thread; beyond that new exports are rejected with `ExportBusy`.
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 16):
+        """Create a pool.
+
+        Args:
+            workers (int): Exports running at once
+            queue_size (int): Exports waiting for a thread before new ones are rejected
+        """
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self.rejected = 0
+
+    def reserve(self) -> None:
+        """Take a slot for an export, to be freed by `release`.
+
+        Raises:
+            ExportBusy: If every slot is taken
+        """
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ExportBusy("Too many exports are running")
+
+    def release(self) -> None:
+        self._slots.release()
+
+    async def run(self, function: Callable, *args):
+        """Run a function on the pool in a slot of its own, freed when it returns.
+
+        Raises:
+            ExportBusy: If every slot is taken
+        """
+        self.reserve()
+
+        def task():
+            try:
+                return function(*args)
+            finally:
+                self.release()
+
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, task)
+        except BaseException:
+            self.release()
+            raise
+        return await future
+
+
+export_pool = ExportPool(workers=settings.EXPORT_CONCURRENCY, queue_size=settings.EXPORT_QUEUE_SIZE)
+
+
+def iter_transaction_rows(user_id: int, chunk_size: int = 2000) -> Iterator[tuple]:
+    """Yield a user's transactions, oldest first, as tuples of `EXPORT_FIELDS`.
+
+    Rows are read from a single server-side cursor `chunk_size` rows at a
+    time, so memory use does not depend on the size of the history.
+    """
+    return (
+        Transaction.objects.filter(user_id=user_id)
+        .values_list("kind", "date", "amount", "currency__code", "category__name", "description")
+        .order_by("date", "id")
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def encode_csv(rows: Iterator[tuple], rows_per_chunk: int = 500) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, (kind, date, amount, currency, category, description) in enumerate(rows, 1):
+        writer.writerow((kind, date.isoformat(), amount, currency, category or "", description))
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def encode_jsonl(rows: Iterator[tuple], rows_per_chunk: int = 500) -> Iterator[bytes]:
+    lines = []
+    for kind, date, amount, currency, category, description in rows:
+        lines.append(json.dumps({
+            "type": kind,
+            "date": date.isoformat(),
+            "amount": str(amount),
+            "currency": currency,
+            "category": category,
+            "description": description,
+        }, ensure_ascii=False))
+        if len(lines) == rows_per_chunk:
+            lines.append("")
+            yield "\n".join(lines).encode()
+            lines = []
+    if lines:
+        lines.append("")
+        yield "\n".join(lines).encode()
+
+
+def gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Compress a byte stream incrementally into the gzip format."""
+    compressor = zlib.compressobj(wbits=31)  # 16 + MAX_WBITS: gzip header and trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(user_id: int, export_format: str = "csv", compress: bool = False,
+                  chunk_size: int = 2000) -> Iterator[bytes]:
+    """Encode a user's transactions as a stream of bytes (synchronous; uses the database).
+
+    Args:
+        user_id (int): Primary key of the user
+        export_format (str): "csv" or "jsonl"
+        compress (bool): Gzip the output
+        chunk_size (int): Rows fetched from the server-side cursor at a time
+
+    Returns:
+        Iterator[bytes]: The encoded export
+    """
+    encode = encode_jsonl if export_format == "jsonl" else encode_csv
+    chunks = encode(iter_transaction_rows(user_id, chunk_size))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def write_export(path: str, user_id: int, export_format: str = "csv", compress: bool = False,
+                 chunk_size: int = 2000) -> int:
+    """Write an export to a file from a worker thread; returns the number of bytes written."""
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            for chunk in export_chunks(user_id, export_format, compress, chunk_size):
+                out.write(chunk)
+                size += len(chunk)
+    finally:
+        connection.close()
+    return size
+
+
+def export_filename(export_format: str, compress: bool) -> str:
+    return f"transactions.{export_format}" + (".gz" if compress else "")
+
+
+async def stream_export(user_id: int, export_format: str = "csv", compress: bool = False,
+                        chunk_size: int = 2000, buffer: int = 8,
+                        pool: Optional[ExportPool] = None) -> AsyncIterator[bytes]:
+    """Stream an export to async consumers.
+
+    The cursor lives on one thread of the export pool for the whole export
+    (Django connections are per thread), which hands encoded chunks over
+    through a bounded queue, so a slow client slows the query down instead
+    of piling up memory. Stopping early (e.g. a client disconnect) releases
+    the cursor.
+
+    Args:
+        user_id (int): Primary key of the user
+        export_format (str): "csv" or "jsonl"
+        compress (bool): Gzip the output
+        chunk_size (int): Rows fetched from the server-side cursor at a time
+        buffer (int): Encoded chunks allowed to wait for the consumer
+        pool (ExportPool, optional): Pool to run on, defaults to `export_pool`
+
+    Yields:
+        bytes: The encoded export
+
+    Raises:
+        ExportBusy: On the first iteration, if the pool has no room for the export
+    """
+    pool = pool or export_pool
+    pool.reserve()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+    cancelled = threading.Event()
+
+    def put(item) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce() -> None:
+        if cancelled.is_set():
+            # The consumer went away while the export waited for a thread
+            pool.release()
+            return
+        chunks = export_chunks(user_id, export_format, compress, chunk_size)
+        try:
+            for chunk in chunks:
+                if cancelled.is_set():
+                    break
+                if chunk:
+                    put(chunk)
+        except Exception as e:
+            logger.error(f"Export failed: {str(e)}", exc_info=True)
+            if not cancelled.is_set():
+                put(e)
+        finally:
+            chunks.close()
+            connection.close()
+            pool.release()
+            if not cancelled.is_set():
+                put(_DONE)
+
+    try:
+        pool.executor.submit(produce)
+    except BaseException:
+        pool.release()
+        raise
+    try:
+        while (item := await queue.get()) is not _DONE:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        # Unblock a producer waiting for room in the queue
+        while not queue.empty():
+            queue.get_nowait()
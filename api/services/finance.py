@@ -1,6 +1,22 @@
 from api.schemas import CommandResponse
-from core.models import Category, Expense, get_default_currency, Income, User
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Iterable
+import numpy as np
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from core import analytics, budgets, recurrence
+from core.models import Category, Expense, Income, MonthlyRollup, RecurringRule, Transaction
+from core.rollups import RollupDelta
+from core.reference import currency_cache, exchange_rate_cache
+from api.services import history, search
+from api.services.categories import category_resolver
+from api.services.identity import identity_cache
+from api.services.menu import MenuService
+from api.services.scheduler import recurring_scheduler
 
 class FinanceService:
     @staticmethod
@@ -38,8 +54,8 @@ class FinanceService:
             "description": description
         }
 
-        user_id = await User.objects.aget(telegram_id=user_id)
-        response = await FinanceService.create_income(record_data, user_id.id)
+        user_pk = await identity_cache.get_user_id(user_id)
+        response = await FinanceService.create_income(record_data, user_pk)
         
         if response.status == "success":
             response.details["message"] = (
@@ -82,13 +98,15 @@ class FinanceService:
             "description": description,
         }
 
-        user = await User.objects.aget(telegram_id=user_id)
-        response = await FinanceService.create_expense(record_data, user.id)
+        user_pk = await identity_cache.get_user_id(user_id)
+        response = await FinanceService.create_expense(record_data, user_pk)
 
         if response.status == "success":
             response.details["message"] = (
                 f"💸 Expense of {response.details['currency']}{amount} has been recorded under '{category_name}'."
             )
+            for alert in response.details["budget_alerts"]:
+                response.details["message"] += "\n" + MenuService.get_budget_alert_message(alert)
         else:
             response.details["message"] = (
                 f"❌ Failed to record expense: {response.details.get('detail', 'Unknown error.')}"
@@ -99,73 +117,653 @@ class FinanceService:
           
     @staticmethod
     async def create_income(record_data: dict, user_id: int) -> CommandResponse:
-        try:
-            user = await User.objects.aget(id=user_id)
+        return await FinanceService._create_transaction(Income, "income", record_data, user_id)
+        
+    @staticmethod
+    async def create_expense(record_data: dict, user_id: int) -> CommandResponse:
+        return await FinanceService._create_transaction(Expense, "expense", record_data, user_id)
+    
+    @staticmethod
+    async def _create_transaction(model, kind: str, record_data: dict, user_id: int) -> CommandResponse:
+        """Create an income or expense record, resolving its category through the category cache.
 
-            category, _ = await Category.objects.aget_or_create(
-                user=user,
-                name=record_data["category_name"],
-                defaults={'is_active': True}
-            )
-            
-            currency = await sync_to_async(get_default_currency)()
+        Args:
+            model: `Income` or `Expense`
+            kind (str): "income" or "expense", reported back in the response
+            record_data (dict): amount, category_name and an optional description
+            user_id (int): Primary key of the user
+
+        Returns:
+            CommandResponse: The created record's details, or the error
+        """
+        category_name = record_data["category_name"]
+        try:
+            category_id = await category_resolver.resolve(user_id, category_name)
+            currency = await currency_cache.aget_default()
             
-            income = await Income.objects.acreate(
-                user=user,
+            alerts = await sync_to_async(FinanceService._save_new)(model(
+                user_id=user_id,
                 amount=record_data["amount"],
-                category=category,
+                category_id=category_id,
                 currency=currency,
                 description=record_data.get("description", "")
-            )
+            ))
             
             return CommandResponse(
                 status="success",
                 details={
-                    "type": "income",
+                    "type": kind,
                     "amount": record_data["amount"],
-                    "category": category.name,
+                    "category": category_name,
                     "currency": currency.code,
+                    "budget_alerts": alerts,
                 }
             )
 
         except Exception as e:
-            print("Error creating income:", str(e))
+            # The cached category may have been deleted by another process
+            if isinstance(e, IntegrityError):
+                category_resolver.forget(user_id, category_name)
+            print(f"Error creating {kind}:", str(e))
+            return CommandResponse(status="error", details={"detail": str(e)})
+
+    @staticmethod
+    def _save_new(obj) -> list:
+        """Insert an income or expense and count it in the monthly rollups, atomically.
+
+        Returns:
+            list: Budget alerts raised by the write (see `core.budgets.track_spend`)
+        """
+        with transaction.atomic():
+            obj.save(force_insert=True)
+            return RollupDelta().created([obj]).apply()
+
+    @staticmethod
+    async def update_transaction(kind: str, transaction_id: int, user_id: int, changes: dict) -> CommandResponse:
+        """Change the amount, category, description or date of one of the user's records.
+
+        Args:
+            kind (str): "income" or "expense"
+            transaction_id (int): Primary key of the record
+            user_id (int): Primary key of the owning user
+            changes (dict): Any of `amount`, `category_name`, `description` and `date`
+
+        Returns:
+            CommandResponse: The updated record's details, or the error
+        """
+        model = {"income": Income, "expense": Expense}.get(kind)
+        if model is None:
+            return CommandResponse(status="error", details={"detail": f"Unknown type {kind!r}"})
+        try:
+            if "amount" in changes:
+                try:
+                    amount = Decimal(str(changes["amount"]))
+                except InvalidOperation:
+                    amount = None
+                if amount is None or not amount.is_finite() or amount <= 0:
+                    detail = "Amount must be a positive number."
+                    return CommandResponse(status="error", details={"detail": detail, "message": f"❌ {detail}"})
+                changes = dict(changes, amount=amount)
+            if "category_name" in changes:
+                changes = dict(changes, category_id=await category_resolver.resolve(user_id, changes["category_name"]))
+            obj = await sync_to_async(FinanceService._save_changes)(model, transaction_id, user_id, changes)
             return CommandResponse(
-                status="error",
-                details={"detail": str(e)}
+                status="success",
+                details={"type": kind, "id": obj.pk, "amount": obj.amount, "currency": obj.currency.code}
             )
-        
+        except model.DoesNotExist:
+            return CommandResponse(status="error", details={"detail": f"{kind.capitalize()} not found"})
+        except Exception as e:
+            print(f"Error updating {kind}:", str(e))
+            return CommandResponse(status="error", details={"detail": str(e)})
+
     @staticmethod
-    async def create_expense(record_data: dict, user_id: int) -> CommandResponse:
+    def _save_changes(model, transaction_id: int, user_id: int, changes: dict):
+        with transaction.atomic():
+            obj = model.objects.select_for_update().select_related("currency").get(pk=transaction_id, user_id=user_id)
+            old = Transaction(
+                kind=obj.kind, user_id=obj.user_id, amount=obj.amount, date=obj.date,
+                category_id=obj.category_id, currency_id=obj.currency_id
+            )
+            for field in ("amount", "category_id", "description", "date"):
+                if field in changes:
+                    setattr(obj, field, changes[field])
+            obj.save()
+            RollupDelta().updated(old, obj).apply()
+            return obj
+
+    @staticmethod
+    async def delete_transaction(kind: str, transaction_id: int, user_id: int) -> CommandResponse:
+        """Delete one of the user's records.
+
+        Args:
+            kind (str): "income" or "expense"
+            transaction_id (int): Primary key of the record
+            user_id (int): Primary key of the owning user
+
+        Returns:
+            CommandResponse: The deleted record's id, or the error
+        """
+        model = {"income": Income, "expense": Expense}.get(kind)
+        if model is None:
+            return CommandResponse(status="error", details={"detail": f"Unknown type {kind!r}"})
         try:
-            user = await User.objects.aget(id=user_id)
+            await sync_to_async(FinanceService._delete)(model, transaction_id, user_id)
+            return CommandResponse(status="success", details={"type": kind, "id": transaction_id})
+        except model.DoesNotExist:
+            return CommandResponse(status="error", details={"detail": f"{kind.capitalize()} not found"})
+        except Exception as e:
+            print(f"Error deleting {kind}:", str(e))
+            return CommandResponse(status="error", details={"detail": str(e)})
 
-            category, _ = await sync_to_async(Category.objects.get_or_create)(
-                user=user,
-                name=record_data["category_name"],
-                defaults={'is_active': True}
-            )
-            
-            currency = await sync_to_async(get_default_currency)()
+    @staticmethod
+    def _delete(model, transaction_id: int, user_id: int) -> None:
+        with transaction.atomic():
+            obj = model.objects.select_for_update().get(pk=transaction_id, user_id=user_id)
+            obj.delete()
+            RollupDelta().deleted([obj]).apply()
 
-            expense = await Expense.objects.acreate(
-                user=user,
-                amount=record_data["amount"],
-                category=category,
-                currency=currency,
-                description=record_data.get("description", "")
-            )
+    @staticmethod
+    async def handle_budget_command(args: list, user_id: int) -> CommandResponse:
+        """Handle `/budget` (list budgets) and `/budget [category] [amount]` (set one).
+
+        Args:
+            args (list): Command arguments
+            user_id (int): Telegram id of the user
+
+        Returns:
+            CommandResponse: `budgets` after the change, and a `message` for the chat
+        """
+        error_message = (
+        """❌ Invalid format for `/budget` command.
+        Usage: `/budget [category] [monthly amount]`
+        Example: `/budget Groceries 300`
+        """
+        )
+
+        user_pk = await identity_cache.get_user_id(user_id)
+        if args:
+            if len(args) < 2:
+                return CommandResponse(status="error", details={"message": error_message})
+            try:
+                amount = Decimal(args[-1])
+                if not amount.is_finite() or amount <= 0:
+                    raise ValueError("Amount must be positive.")
+            except (InvalidOperation, ValueError):
+                return CommandResponse(status="error", details={"message": error_message})
+            response = await FinanceService.set_budget(user_pk, " ".join(args[:-1]), amount)
+            if response.status != "success":
+                response.details["message"] = (
+                    f"❌ Failed to set budget: {response.details.get('detail', 'Unknown error.')}"
+                )
+                return response
+
+        budget_list = await FinanceService.get_budgets(user_pk)
+        message, _ = MenuService.get_budgets_message(budget_list)
+        return CommandResponse(status="success", details={"budgets": budget_list, "message": message})
 
+    @staticmethod
+    async def set_budget(user_id: int, category_name: str, amount) -> CommandResponse:
+        """Set the monthly budget of an expense category, in the default currency.
+
+        Args:
+            user_id (int): Primary key of the user
+            category_name (str): Category name; created if the user has none by that name
+            amount: Monthly limit
+
+        Returns:
+            CommandResponse: The budget's details, including this month's spend so far, or the error
+        """
+        try:
+            category_id = await category_resolver.resolve(user_id, category_name)
+            currency = await currency_cache.aget_default()
+            budget = await sync_to_async(budgets.set_budget)(user_id, category_id, currency.id, Decimal(str(amount)))
             return CommandResponse(
                 status="success",
                 details={
-                    "type": "expense",
-                    "amount": expense.amount,
-                    "category": category.name,
-                    "currency": currency.code
+                    "category": category_name,
+                    "currency": currency.code,
+                    "amount": budget.amount,
+                    "spent": budget.spent,
                 }
             )
+        except Exception as e:
+            if isinstance(e, IntegrityError):
+                category_resolver.forget(user_id, category_name)
+            print("Error setting budget:", str(e))
+            return CommandResponse(status="error", details={"detail": str(e)})
+
+    @staticmethod
+    async def get_budgets(user_id: int) -> list:
+        """A user's budgets with this month's spend, read from the budget counters."""
+        return await sync_to_async(budgets.budget_status)(user_id)
+
+    @staticmethod
+    async def handle_recurring_command(args: list, user_id: int) -> CommandResponse:
+        """Handle `/recurring` (list rules), `/recurring stop [id]` and
+        `/recurring [income|expense] [amount] [category] [schedule] [description]`.
+
+        The schedule is `daily`, `weekly`, `monthly` or `cron` followed by the
+        five fields of a cron expression.
+
+        Args:
+            args (list): Command arguments
+            user_id (int): Telegram id of the user
+
+        Returns:
+            CommandResponse: `rules` after the change, and a `message` for the chat
+        """
+        error_message = (
+        """❌ Invalid format for `/recurring` command.
+        Usage: `/recurring [income|expense] [amount] [category] [daily|weekly|monthly|cron m h dom mon dow] [description (optional)]`
+        Example: `/recurring expense 1200 Rent monthly Flat rent`
+        Stop a rule with `/recurring stop [id]`
+        """
+        )
+
+        user_pk = await identity_cache.get_user_id(user_id)
+        notice = None
+        if args and args[0].lower() == "stop":
+            if len(args) != 2 or not args[1].isdigit():
+                return CommandResponse(status="error", details={"message": error_message})
+            stopped = await FinanceService.stop_recurring_rule(user_pk, int(args[1]))
+            notice = f"⏹ Stopped rule {args[1]}." if stopped else f"❌ You have no active rule {args[1]}."
+        elif args:
+            if len(args) < 4:
+                return CommandResponse(status="error", details={"message": error_message})
+            kind, frequency = args[0].lower(), args[3].lower()
+            cron = " ".join(args[4:9]) if frequency == RecurringRule.CRON else ""
+            try:
+                amount = Decimal(args[1])
+                if kind not in (Transaction.INCOME, Transaction.EXPENSE) or not amount.is_finite() or amount <= 0:
+                    raise ValueError("Invalid kind or amount.")
+            except (InvalidOperation, ValueError):
+                return CommandResponse(status="error", details={"message": error_message})
+            response = await FinanceService.create_recurring_rule(user_pk, {
+                "type": kind, "amount": amount, "category_name": args[2], "frequency": frequency,
+                "cron": cron, "description": " ".join(args[9:] if cron else args[4:]),
+            })
+            if response.status != "success":
+                response.details["message"] = (
+                    f"❌ Failed to add recurring {kind}: {response.details.get('detail', 'Unknown error.')}"
+                )
+                return response
+            notice = f"🔁 Added rule {response.details['id']}, first recorded {response.details['next_run']:%Y-%m-%d %H:%M}."
+
+        rules = await FinanceService.get_recurring_rules(user_pk)
+        message, _ = MenuService.get_recurring_message(rules)
+        if notice:
+            message = f"{notice}\n\n{message}"
+        return CommandResponse(status="success", details={"rules": rules, "message": message})
+
+    @staticmethod
+    async def create_recurring_rule(user_id: int, record_data: dict) -> CommandResponse:
+        """Create a recurring income or expense in the default currency and schedule it.
+
+        Args:
+            user_id (int): Primary key of the user
+            record_data (dict): `type` ("income" or "expense"), `amount`, `category_name`,
+                `frequency` ("daily", "weekly", "monthly" or "cron"), `cron` (the expression,
+                for the cron frequency) and `description`
 
+        Returns:
+            CommandResponse: The rule's `id` and first `next_run`, or the error
+        """
+        try:
+            category_id = await category_resolver.resolve(user_id, record_data["category_name"])
+            currency = await currency_cache.aget_default()
+            rule = await sync_to_async(recurrence.create_rule)(
+                user_id, record_data["type"], Decimal(str(record_data["amount"])), currency.id, category_id,
+                record_data.get("frequency"), record_data.get("cron", ""), record_data.get("description", ""),
+            )
+            recurring_scheduler.schedule(rule.pk, rule.next_run)
+            return CommandResponse(
+                status="success",
+                details={
+                    "id": rule.pk,
+                    "type": rule.kind,
+                    "amount": rule.amount,
+                    "currency": currency.code,
+                    "next_run": rule.next_run,
+                }
+            )
         except Exception as e:
-            print("Error creating expense:", str(e))
+            if isinstance(e, IntegrityError):
+                category_resolver.forget(user_id, record_data["category_name"])
+            print("Error creating recurring rule:", str(e))
             return CommandResponse(status="error", details={"detail": str(e)})
+
+    @staticmethod
+    async def stop_recurring_rule(user_id: int, rule_id: int) -> bool:
+        """Deactivate one of a user's recurring rules; returns whether it was active."""
+        stopped = await sync_to_async(recurrence.stop_rule)(user_id, rule_id)
+        if stopped:
+            recurring_scheduler.unschedule(rule_id)
+        return stopped
+
+    @staticmethod
+    async def get_recurring_rules(user_id: int) -> list:
+        """A user's active recurring rules, next due first."""
+        return await sync_to_async(recurrence.user_rules)(user_id)
+
+    @staticmethod
+    async def get_history(user_id: int, cursor: str = None, direction: str = history.OLDER) -> dict:
+        """One page of a user's incomes and expenses, newest first (see `api.services.history`).
+
+        Args:
+            user_id (int): Primary key of the user
+            cursor (str, optional): Cursor from a previous page; the newest page if omitted
+            direction (str): `history.OLDER` or `history.NEWER` than the cursor
+
+        Returns:
+            dict: `rows` and the `older` and `newer` cursors
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        return await sync_to_async(history.history_page)(user_id, cursor, direction, settings.HISTORY_PAGE_SIZE)
+
+    @staticmethod
+    async def search_transactions(user_id: int, query: str, page: int = 0) -> dict:
+        """One page of a user's transactions whose description matches `query` (see `api.services.search`).
+
+        Args:
+            user_id (int): Primary key of the user
+            query (str): Query from `search.normalize_query`
+            page (int): Zero-based page number
+
+        Returns:
+            dict: `query`, `page`, `rows` and `more`
+        """
+        return await sync_to_async(search.search_transactions)(user_id, query, page, settings.SEARCH_PAGE_SIZE)
+
+    @staticmethod
+    async def bulk_create_transactions(user, records: Iterable[dict], chunk_size: int = None) -> list:
+        """Create many income and expense records for one user in a single transaction.
+
+        Categories and currencies for the whole batch are resolved up front in a
+        fixed number of queries, then rows are inserted with `bulk_create` in
+        chunks of `chunk_size`. Invalid records are reported and skipped; if the
+        insert itself fails, nothing is written and every record reports the error.
+
+        Args:
+            user: The owning user, or its primary key
+            records (Iterable[dict]): Records with `type` ("income" or "expense"),
+                `amount`, `category_name` and optional `description`, `currency`
+                (code, defaults to the default currency), `date` (datetime or ISO 8601)
+                and `import_hash` (records whose hash is already stored are skipped)
+            chunk_size (int, optional): Rows per INSERT, defaults to `BULK_CREATE_CHUNK_SIZE`
+
+        Returns:
+            list: One result per record, in input order: `{"index", "status": "success",
+            "type", "id"}`, `{"index", "status": "duplicate"}` or `{"index", "status": "error", "detail"}`
+        """
+        user_id = getattr(user, "pk", user)
+        return await sync_to_async(FinanceService._bulk_create_transactions)(
+            user_id, list(records), chunk_size or settings.BULK_CREATE_CHUNK_SIZE
+        )
+
+    @staticmethod
+    def _bulk_create_transactions(user_id: int, records: list, chunk_size: int) -> list:
+        results = [None] * len(records)
+        valid = []
+        for index, record in enumerate(records):
+            try:
+                valid.append((index, FinanceService._clean_record(record)))
+            except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+                detail = f"Missing field {e}" if isinstance(e, KeyError) else str(e) or "Invalid value"
+                results[index] = {"index": index, "status": "error", "detail": detail}
+
+        try:
+            with transaction.atomic():
+                valid = FinanceService._skip_duplicates(user_id, valid, results)
+                category_ids = category_resolver.resolve_many(
+                    user_id, {cleaned["category_name"] for _, cleaned in valid}
+                )
+                objects = Transaction.objects.bulk_create(
+                    [
+                        Transaction(
+                            kind=cleaned["type"],
+                            user_id=user_id,
+                            amount=cleaned["amount"],
+                            category_id=category_ids[cleaned["category_name"]],
+                            currency=cleaned["currency"],
+                            date=cleaned["date"],
+                            description=cleaned["description"],
+                            import_hash=cleaned["import_hash"],
+                        )
+                        for _, cleaned in valid
+                    ],
+                    batch_size=chunk_size,
+                )
+                for (index, _), obj in zip(valid, objects):
+                    results[index] = {"index": index, "status": "success", "type": obj.kind, "id": obj.pk}
+                RollupDelta().created(objects).apply()
+        except Exception as e:
+            print("Error bulk creating transactions:", str(e))
+            for index, _ in valid:
+                results[index] = {"index": index, "status": "error", "detail": str(e)}
+
+        return results
+
+    @staticmethod
+    def _skip_duplicates(user_id: int, valid: list, results: list) -> list:
+        """Drop records whose `import_hash` is already stored or repeats earlier in the batch."""
+        hashes = {cleaned["import_hash"] for _, cleaned in valid if cleaned["import_hash"]}
+        if not hashes:
+            return valid
+        seen = set(
+            Transaction.objects.filter(user_id=user_id, import_hash__in=hashes)
+            .values_list("import_hash", flat=True).order_by()
+        )
+
+        remaining = []
+        for index, cleaned in valid:
+            import_hash = cleaned["import_hash"]
+            if import_hash in seen:
+                results[index] = {"index": index, "status": "duplicate"}
+                continue
+            if import_hash:
+                seen.add(import_hash)
+            remaining.append((index, cleaned))
+        return remaining
+
+    @staticmethod
+    def _clean_record(record: dict) -> dict:
+        """Validate one bulk record and resolve its currency from the reference cache."""
+        kind = record["type"]
+        if kind not in dict(Transaction.KIND_CHOICES):
+            raise ValueError(f"Unknown type {kind!r}")
+
+        amount = Decimal(str(record["amount"])).quantize(Decimal("0.01"))
+        if amount <= 0:
+            raise ValueError("Amount must be positive.")
+        if amount.adjusted() >= 8:
+            raise ValueError("Amount is too large.")
+
+        category_name = str(record["category_name"]).strip()
+        if not category_name or len(category_name) > 100:
+            raise ValueError("Category name must be 1-100 characters.")
+
+        code = record.get("currency")
+        currency = currency_cache.get(code) if code else currency_cache.get_default()
+        if currency is None:
+            raise ValueError(f"Unknown currency {code!r}" if code else "No currency configured.")
+
+        date = record.get("date") or timezone.now()
+        if isinstance(date, str):
+            date = parse_datetime(date)
+            if date is None:
+                raise ValueError(f"Invalid date {record['date']!r}")
+        if not isinstance(date, datetime):
+            raise TypeError("Date must be a datetime or an ISO 8601 string.")
+        if settings.USE_TZ and timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        elif not settings.USE_TZ and timezone.is_aware(date):
+            date = timezone.make_naive(date)
+
+        return {
+            "type": kind,
+            "amount": amount,
+            "category_name": category_name,
+            "currency": currency,
+            "date": date,
+            "description": record.get("description") or "",
+            "import_hash": record.get("import_hash") or None,
+        }
+
+    @staticmethod
+    async def get_summary(user_id: int, today: date = None) -> dict:
+        """Summarize a user's incomes and expenses for this month, last month and the year to date.
+
+        Reads the monthly rollups since the earlier of January 1st and the
+        start of last month, with their categories and currencies, in one
+        query: the cost depends on the number of months and categories, not
+        on how many transactions the user has.
+
+        Args:
+            user_id (int): Primary key of the user
+            today (date, optional): Reference day, defaults to today
+
+        Returns:
+            dict: `{"periods": [...]}`, one entry per period with `key`, `label`,
+            `start`, `end`, `totals` (per currency code: symbol, income, expense,
+            net), `categories` (kind, category, currency, total), largest first,
+            and `converted`: when several currencies are involved, the totals in
+            the default currency (code, symbol, income, expense, net and `missing`,
+            the codes that had no exchange rate), otherwise None
+        """
+        today = today or (timezone.localdate() if settings.USE_TZ else timezone.now().date())
+        this_month = today.replace(day=1)
+        last_month = (this_month.replace(year=this_month.year - 1, month=12) if this_month.month == 1
+                      else this_month.replace(month=this_month.month - 1))
+        next_month = (this_month.replace(year=this_month.year + 1, month=1) if this_month.month == 12
+                      else this_month.replace(month=this_month.month + 1))
+        year_start = today.replace(month=1, day=1)
+        periods = [
+            {"key": "this_month", "label": "This month", "start": this_month, "end": next_month},
+            {"key": "last_month", "label": "Last month", "start": last_month, "end": this_month},
+            {"key": "year_to_date", "label": "Year to date", "start": year_start, "end": next_month},
+        ]
+
+        rollups = [
+            rollup async for rollup in MonthlyRollup.objects.filter(
+                user_id=user_id,
+                month__gte=min(last_month, year_start),
+                month__lt=next_month,
+            ).select_related("category", "currency").order_by()
+        ]
+
+        for period in periods:
+            totals, categories = {}, {}
+            for rollup in rollups:
+                if not period["start"] <= rollup.month < period["end"]:
+                    continue
+                code = rollup.currency.code
+                currency_totals = totals.setdefault(code, {
+                    "symbol": rollup.currency.symbol, "income": Decimal(0), "expense": Decimal(0)
+                })
+                currency_totals[rollup.kind] += rollup.total
+                key = (rollup.kind, rollup.category.name if rollup.category else "Uncategorized", code)
+                categories[key] = categories.get(key, Decimal(0)) + rollup.total
+            for currency_totals in totals.values():
+                currency_totals["net"] = currency_totals["income"] - currency_totals["expense"]
+            period["totals"] = totals
+            period["converted"] = None
+            period["categories"] = [
+                {"kind": kind, "category": category, "currency": code, "total": total}
+                for (kind, category, code), total in sorted(categories.items(), key=lambda item: -item[1])
+            ]
+
+        if len({rollup.currency_id for rollup in rollups}) > 1:
+            target = await currency_cache.aget_default()
+            rates = await exchange_rate_cache.aget()
+            FinanceService._convert_totals(rollups, periods, rates, target, today)
+        return {"periods": periods}
+
+    @staticmethod
+    def _convert_totals(rollups: list, periods: list, rates, target, today: date) -> None:
+        """Add each period's totals converted into `target`, all rollups in one array operation.
+
+        A month's totals are converted at the rate as of the month's last day
+        (or today, for the current month).
+        """
+        months = np.array([rollup.month for rollup in rollups], dtype="datetime64[D]")
+        rate_days = np.minimum(
+            (months.astype("datetime64[M]") + 1).astype("datetime64[D]") - 1, np.datetime64(today, "D")
+        )
+        converted = rates.convert(
+            [rollup.total for rollup in rollups], [rollup.currency_id for rollup in rollups], rate_days, target.pk
+        )
+        is_income = np.array([rollup.kind == "income" for rollup in rollups])
+        unknown = np.isnan(converted)
+        codes = np.array([rollup.currency.code for rollup in rollups])
+        for period in periods:
+            in_period = (months >= np.datetime64(period["start"], "D")) & (months < np.datetime64(period["end"], "D"))
+            income = Decimal(f"{np.nansum(converted[in_period & is_income]):.2f}")
+            expense = Decimal(f"{np.nansum(converted[in_period & ~is_income]):.2f}")
+            period["converted"] = {
+                "currency": target.code,
+                "symbol": target.symbol,
+                "income": income,
+                "expense": expense,
+                "net": income - expense,
+                "missing": sorted(set(codes[in_period & unknown])),
+            }
+
+    @staticmethod
+    async def get_report(user_id: int, today: date = None) -> dict:
+        """Spending trends for the Trends screen, from the user's analytics snapshot (see `core.analytics`).
+
+        Args:
+            user_id (int): Primary key of the user
+            today (date, optional): Reference day, defaults to today
+
+        Returns:
+            dict: Amounts in the default currency (`currency`, `symbol`): `months`
+            (the last six: month, income, expense), `average` (daily spend over the
+            last 30 days), `categories` (share of the last three months' spend,
+            largest first), `forecast` (`month`, `spent` so far, `projected`) and
+            `missing` (currencies without a rate, left out)
+        """
+        today = today or (timezone.localdate() if settings.USE_TZ else timezone.now().date())
+        target = await currency_cache.aget_default()
+        rates = await exchange_rate_cache.aget()
+        codes = {currency.pk: currency.code for currency in await currency_cache.aall()}
+        return await sync_to_async(FinanceService._build_report)(user_id, today, target, rates, codes)
+
+    @staticmethod
+    def _build_report(user_id: int, today: date, target, rates, codes: dict) -> dict:
+        stats = analytics.UserAnalytics(analytics.snapshots.load(user_id), rates, target.pk, today, codes)
+        monthly = stats.monthly_totals(6)
+        shares = stats.category_shares(3)
+        totals = shares["totals"].sum(axis=0)
+        names = dict(Category.objects.filter(
+            pk__in=[int(category) for category in shares["categories"] if category != analytics.NO_CATEGORY]
+        ).values_list("id", "name"))
+        forecast = stats.forecast()
+
+        def money(value) -> Decimal:
+            return Decimal(f"{value:.2f}")
+
+        return {
+            "currency": target.code,
+            "symbol": target.symbol,
+            "months": [
+                {"month": month, "income": money(income), "expense": money(expense)}
+                for month, income, expense in zip(monthly["months"], monthly["income"], monthly["expense"])
+            ],
+            "average": money(stats.moving_average(30, 1)[-1]),
+            "categories": [
+                {"category": names.get(int(category), "Uncategorized"), "share": float(total / totals.sum())}
+                for category, total in zip(shares["categories"], totals)
+                if total > 0
+            ],
+            "forecast": {
+                "month": forecast["month"],
+                "spent": money(forecast["spent"]),
+                "projected": money(forecast["projected"]),
+            },
+            "missing": stats.missing,
+        }
+
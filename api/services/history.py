@@ -0,0 +1,108 @@
+"""Keyset pagination over a user's incomes and expenses, newest first.
+
+A page is addressed by the (date, id) of the row next to it rather than by
+an offset, so every page is one index range scan of `page_size + 1` rows on
+(user, date, id) however far back it is. Cursors are short base-36 tokens
+that fit in Telegram's 64-byte callback data.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Optional
+from django.conf import settings
+from django.utils import timezone
+from core.models import Transaction
+
+OLDER = "o"
+NEWER = "n"
+
+_EPOCH = datetime(1970, 1, 1)
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _base36(number: int) -> str:
+    digits = ""
+    while True:
+        number, digit = divmod(number, 36)
+        digits = _DIGITS[digit] + digits
+        if not number:
+            return digits
+
+
+def encode_cursor(date: datetime, pk: int) -> str:
+    """Encode a row's (date, id) as `<microseconds since 1970>.<id>`, both in base 36."""
+    if timezone.is_aware(date):
+        date = timezone.make_naive(date, dt_timezone.utc)
+    micros = (date - _EPOCH) // timedelta(microseconds=1)
+    return f"{'-' if micros < 0 else ''}{_base36(abs(micros))}.{_base36(pk)}"
+
+
+def decode_cursor(token: str) -> tuple:
+    """Decode a token from `encode_cursor` back into (date, id).
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    micros, pk = token.split(".")
+    date = _EPOCH + timedelta(microseconds=int(micros, 36))
+    if settings.USE_TZ:
+        date = timezone.make_aware(date, dt_timezone.utc)
+    return date, int(pk, 36)
+
+
+def page_queryset(user_id: int, cursor: Optional[str] = None, direction: str = OLDER):
+    """The ordered rows after `cursor` in `direction` (slice it to the page size).
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    queryset = Transaction.objects.filter(user_id=user_id)
+    newer = direction == NEWER
+    if cursor is not None:
+        date, pk = decode_cursor(cursor)
+        # The bound on date alone is what the index range scan starts from
+        if newer:
+            queryset = queryset.filter(date__gte=date).exclude(date=date, id__lte=pk)
+        else:
+            queryset = queryset.filter(date__lte=date).exclude(date=date, id__gte=pk)
+    return queryset.order_by(*(("date", "id") if newer else ("-date", "-id"))).values_list(
+        "id", "kind", "date", "amount", "currency__symbol", "category__name", "description"
+    )
+
+
+def history_page(user_id: int, cursor: Optional[str] = None, direction: str = OLDER,
+                 page_size: int = 10) -> dict:
+    """Read one page of a user's transactions with a single query.
+
+    Args:
+        user_id (int): Primary key of the user
+        cursor (str, optional): Token of the row the page starts after; the newest page if omitted
+        direction (str): `OLDER` or `NEWER` than the cursor
+        page_size (int): Rows per page
+
+    Returns:
+        dict: `rows` (newest first, each with `id`, `kind`, `date`, `amount`, `symbol`,
+        `category` and `description`) and the `older` and `newer` cursors, None at either end
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    newer = direction == NEWER
+    # One extra row tells whether there is a page beyond this one
+    rows = list(page_queryset(user_id, cursor, direction)[:page_size + 1])
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if newer:
+        rows.reverse()
+
+    has_older = more if not newer else bool(rows)
+    has_newer = more if newer else cursor is not None and bool(rows)
+    return {
+        "rows": [
+            {
+                "id": pk, "kind": kind, "date": date, "amount": amount,
+                "symbol": symbol, "category": category, "description": description,
+            }
+            for pk, kind, date, amount, symbol, category, description in rows
+        ],
+        "older": encode_cursor(rows[-1][2], rows[-1][0]) if has_older else None,
+        "newer": encode_cursor(rows[0][2], rows[0][0]) if has_newer else None,
+    }
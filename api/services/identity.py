@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+from typing import Optional
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from api.services.cache import LRUCache
+
+User = get_user_model()
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Lightweight, immutable view of a `User` for the write path."""
+    id: int
+    telegram_id: int
+    username: str
+    first_name: str
+    is_active: bool
+
+    @property
+    def pk(self) -> int:
+        return self.id
+
+
+class UserIdentityCache:
+    """Identity map from Telegram user id to user primary key.
+
+    Entries are bounded (LRU) and expire after a TTL, which also bounds staleness
+    across processes. Saves and deletes in this process invalidate immediately.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = 300):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl, on_evict=self._forget)
+        self._keys: dict[int, int] = {}  # User pk -> the Telegram id it is cached under
+
+    def _forget(self, telegram_id: int, cached: CachedUser) -> None:
+        if self._keys.get(cached.id) == telegram_id:
+            del self._keys[cached.id]
+
+    def peek(self, telegram_id: int) -> Optional[CachedUser]:
+        """The cached record for a Telegram id, without querying the database on a miss."""
+        return self._cache.get(telegram_id)
+
+    async def get(self, telegram_id: int) -> CachedUser:
+        """Resolve a Telegram id to a cached user record.
+
+        Raises:
+            User.DoesNotExist: If no user has this Telegram id
+        """
+        cached = self.peek(telegram_id)
+        if cached is None:
+            user = await User.objects.only(
+                "id", "telegram_id", "username", "first_name", "is_active"
+            ).aget(telegram_id=telegram_id)
+            cached = self.add(user)
+        return cached
+
+    async def get_user_id(self, telegram_id: int) -> int:
+        """Resolve a Telegram id to a user primary key."""
+        return (await self.get(telegram_id)).id
+
+    def add(self, user) -> CachedUser:
+        """Cache a loaded user and return its lightweight record."""
+        cached = CachedUser(
+            id=user.pk,
+            telegram_id=user.telegram_id,
+            username=user.username,
+            first_name=user.first_name,
+            is_active=user.is_active,
+        )
+        previous = self._keys.get(user.pk)
+        if previous is not None and previous != user.telegram_id:
+            self._cache.pop(previous)
+        self._cache.set(user.telegram_id, cached)
+        self._keys[user.pk] = user.telegram_id
+        return cached
+
+    def invalidate(self, user) -> None:
+        """Drop any entry for `user`, including one under a previous Telegram id."""
+        for telegram_id in {self._keys.get(user.pk), user.telegram_id} - {None}:
+            cached = self._cache.pop(telegram_id)
+            if cached is not None:
+                self._forget(telegram_id, cached)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._keys.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+identity_cache = UserIdentityCache(
+    maxsize=settings.IDENTITY_CACHE_SIZE,
+    ttl=settings.IDENTITY_CACHE_TTL,
+)
+
+
+@receiver(post_save, sender=User, dispatch_uid="identity_cache_user_saved")
+@receiver(post_delete, sender=User, dispatch_uid="identity_cache_user_deleted")
+def invalidate_cached_user(sender, instance, **kwargs):
+    identity_cache.invalidate(instance)
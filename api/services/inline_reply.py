@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from enum import Enum
+from typing import Any, Iterator, Optional
+from telegram import Bot, TelegramObject
+from api.services.menu_registry import CompiledMarkup
+
+# Bot API methods whose result handlers can do without: the held call reports
+# `True` to the handler, which is what Telegram returns for these anyway (or a
+# Message nobody reads when editing).
+INLINE_METHODS = frozenset({
+    "answerCallbackQuery",
+    "editMessageText",
+    "editMessageReplyMarkup",
+    "deleteMessage",
+})
+
+_current_capture: ContextVar[Optional["InlineReplyCapture"]] = ContextVar("inline_reply_capture", default=None)
+
+# Metrics
+inline_stats = {"inline_replies": 0, "sent_normally": 0}
+
+
+def _json_value(value: Any) -> Any:
+    """Convert a Bot API parameter into its JSON form (the held methods never carry files)."""
+    if isinstance(value, TelegramObject):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _presend(data: dict) -> dict:
+    """Send a compiled keyboard's stored JSON, which python-telegram-bot passes through as is."""
+    markup = data.get("reply_markup")
+    if isinstance(markup, CompiledMarkup):
+        return {**data, "reply_markup": markup.to_json()}
+    return data
+
+
+class InlineReplyCapture:
+    """Holds back the latest Bot API call made while an update is being handled.
+
+    Telegram executes one method returned in the webhook response body, so the
+    last eligible call can skip its own HTTPS round-trip. Whenever another call
+    is made, the held one is sent normally first, keeping calls in order.
+    """
+
+    def __init__(self):
+        self.pending: Optional[tuple[str, dict, dict]] = None  # Endpoint, parameters and `_do_post` options
+        self.closed = False
+
+    def to_response(self) -> Optional[dict]:
+        """Build the webhook response body for the held call, if any."""
+        if self.pending is None:
+            return None
+        endpoint, data, _ = self.pending
+        self.pending = None
+        body = {"method": endpoint}
+        for key, value in data.items():
+            body[key] = _json_value(value)
+        inline_stats["inline_replies"] += 1
+        return body
+
+
+@contextmanager
+def capture_inline_reply() -> Iterator[InlineReplyCapture]:
+    """Capture the Bot API call to return in the webhook response while handling one update.
+
+    Calls made after the block exits (e.g. from background tasks that inherited
+    the context) are sent normally.
+    """
+    capture = InlineReplyCapture()
+    token = _current_capture.set(capture)
+    try:
+        yield capture
+    finally:
+        capture.closed = True
+        _current_capture.reset(token)
+
+
+class InlineReplyBot(Bot):
+    """Bot that defers eligible calls to the webhook response inside `capture_inline_reply`."""
+
+    async def _do_post(self, endpoint: str, data: dict, **kwargs):
+        capture = _current_capture.get()
+        if capture is None or capture.closed:
+            return await super()._do_post(endpoint, _presend(data), **kwargs)
+
+        # Only one call can ride on the webhook response: send the held one first
+        if capture.pending is not None:
+            pending_endpoint, pending_data, pending_kwargs = capture.pending
+            capture.pending = None
+            inline_stats["sent_normally"] += 1
+            await super()._do_post(pending_endpoint, _presend(pending_data), **pending_kwargs)
+
+        if endpoint in INLINE_METHODS:
+            capture.pending = (endpoint, data, kwargs)
+            return True
+
+        inline_stats["sent_normally"] += 1
+        return await super()._do_post(endpoint, _presend(data), **kwargs)
@@ -1,11 +1,16 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from api.schemas import CommandResponse
+from api.services.menu_registry import keyboards, menus, prompts
 import logging
 
 logger = logging.getLogger(__name__)
 
 class MenuService:
-    """Service for generating menu layouts and messages for the Telegram bot."""
+    """Service for generating menu layouts and messages for the Telegram bot.
+
+    Fixed menus and prompts are declared in `api.services.menu_registry` and
+    compiled once; the methods here return them or fill them in.
+    """
     
     @staticmethod
     def get_main_menu() -> tuple[str, InlineKeyboardMarkup]:
@@ -14,21 +19,7 @@ class MenuService:
         Returns:
             tuple[str, InlineKeyboardMarkup]: The menu message and keyboard layout
         """
-        keyboard = [
-            [
-                InlineKeyboardButton("➕ Add Income", callback_data="menu_add_income"),
-                InlineKeyboardButton("➖ Add Expense", callback_data="menu_add_expense"),
-            ],
-            [
-                InlineKeyboardButton("📊 View Summary", callback_data="menu_summary"),
-                InlineKeyboardButton("⚙️ Settings", callback_data="menu_settings"),
-            ],
-            [
-                InlineKeyboardButton("❓ Help", callback_data="menu_help"),
-            ],
-        ]
-        message = "Welcome to FinanceBot! What would you like to do?"
-        return message, InlineKeyboardMarkup(keyboard)
+        return menus["main"].render()
 
     @staticmethod
     def get_income_menu() -> tuple[str, InlineKeyboardMarkup]:
@@ -37,24 +28,7 @@ class MenuService:
         Returns:
             tuple[str, InlineKeyboardMarkup]: The menu message and keyboard layout
         """
-        keyboard = [
-            [
-                InlineKeyboardButton("💼 Salary", callback_data="income_salary"),
-                InlineKeyboardButton("💰 Freelance", callback_data="income_freelance"),
-            ],
-            [
-                InlineKeyboardButton("📈 Investment", callback_data="income_investment"),
-                InlineKeyboardButton("🎁 Gift", callback_data="income_gift"),
-            ],
-            [
-                InlineKeyboardButton("➕ Other", callback_data="income_other"),
-            ],
-            [
-                InlineKeyboardButton("« Back to Main Menu", callback_data="back_to_main"),
-            ],
-        ]
-        message = "Select income category:"
-        return message, InlineKeyboardMarkup(keyboard)
+        return menus["income"].render()
 
     @staticmethod
     def get_expense_menu() -> tuple[str, InlineKeyboardMarkup]:
@@ -63,43 +37,219 @@ class MenuService:
         Returns:
             tuple[str, InlineKeyboardMarkup]: The menu message and keyboard layout
         """
-        keyboard = [
-            [
-                InlineKeyboardButton("🍔 Food", callback_data="expense_food"),
-                InlineKeyboardButton("🏠 Rent", callback_data="expense_rent"),
-            ],
-            [
-                InlineKeyboardButton("🚌 Transport", callback_data="expense_transport"),
-                InlineKeyboardButton("🛍️ Shopping", callback_data="expense_shopping"),
-            ],
-            [
-                InlineKeyboardButton("➕ Other", callback_data="expense_other"),
-            ],
-            [
-                InlineKeyboardButton("« Back to Main Menu", callback_data="back_to_main"),
-            ],
-        ]
-        message = "Select expense category:"
-        return message, InlineKeyboardMarkup(keyboard)
+        return menus["expense"].render()
 
     @staticmethod
     def get_settings_menu() -> tuple[str, InlineKeyboardMarkup]:
-        """Generate the settings menu with options for currency and budget settings.
+        """Generate the settings menu with options for currency, budget and recurring transaction settings.
         
         Returns:
             tuple[str, InlineKeyboardMarkup]: The menu message and keyboard layout
         """
-        keyboard = [
-            [
-                InlineKeyboardButton("💰 Set Currency", callback_data="settings_currency"),
-                InlineKeyboardButton("📊 Set Budget", callback_data="settings_budget"),
-            ],
-            [
-                InlineKeyboardButton("« Back to Main Menu", callback_data="back_to_main"),
-            ],
-        ]
-        message = "Settings:"
-        return message, InlineKeyboardMarkup(keyboard)
+        return menus["settings"].render()
+
+    @staticmethod
+    def get_summary_message(summary: dict, top_categories: int = 5) -> tuple[str, InlineKeyboardMarkup]:
+        """Generate the summary message from `FinanceService.get_summary`.
+        
+        Args:
+            summary (dict): The summary with one entry per period
+            top_categories (int): Largest categories listed per period
+            
+        Returns:
+            tuple[str, InlineKeyboardMarkup]: The summary message and keyboard layout
+        """
+        lines = ["📊 Summary"]
+        for period in summary["periods"]:
+            lines.append("")
+            lines.append(f"🗓 {period['label']}")
+            if not period["totals"]:
+                lines.append("No income or expenses recorded.")
+                continue
+            for code, totals in period["totals"].items():
+                symbol = totals["symbol"]
+                suffix = f" ({code})" if len(period["totals"]) > 1 else ""
+                lines.append(f"Income: {symbol}{totals['income']:,.2f}{suffix}")
+                lines.append(f"Expenses: {symbol}{totals['expense']:,.2f}{suffix}")
+                lines.append(f"Net: {symbol}{totals['net']:,.2f}{suffix}")
+            converted = period.get("converted")
+            if converted:
+                missing = f" (no rate for {', '.join(converted['missing'])})" if converted["missing"] else ""
+                lines.append(f"Net in {converted['currency']}: {converted['symbol']}{converted['net']:,.2f}{missing}")
+            symbols = {code: totals["symbol"] for code, totals in period["totals"].items()}
+            for entry in period["categories"][:top_categories]:
+                sign = "➕" if entry["kind"] == "income" else "➖"
+                lines.append(f"  {sign} {entry['category']}: {symbols[entry['currency']]}{entry['total']:,.2f}")
+        
+        return "\n".join(lines), keyboards["summary"]
+
+    @staticmethod
+    def get_report_message(report: dict) -> tuple[str, InlineKeyboardMarkup]:
+        """Generate the Trends screen from `FinanceService.get_report`.
+        
+        Args:
+            report (dict): Monthly totals, average spend, category shares and forecast
+            
+        Returns:
+            tuple[str, InlineKeyboardMarkup]: The report message and keyboard layout
+        """
+        symbol = report["symbol"]
+        lines = [f"📈 Trends ({report['currency']})", ""]
+        for month in report["months"]:
+            lines.append(
+                f"🗓 {month['month']:%b %Y}: spent {symbol}{month['expense']:,.2f}, earned {symbol}{month['income']:,.2f}"
+            )
+        lines.append("")
+        lines.append(f"Average spend over the last 30 days: {symbol}{report['average']:,.2f}/day")
+        if report["categories"]:
+            lines.append("Where it went (last 3 months):")
+            for entry in report["categories"][:5]:
+                lines.append(f"  ➖ {entry['category']}: {entry['share']:.0%}")
+        forecast = report["forecast"]
+        lines.append(
+            f"Forecast for {forecast['month']:%B}: {symbol}{forecast['projected']:,.2f} "
+            f"({symbol}{forecast['spent']:,.2f} so far)"
+        )
+        if report["missing"]:
+            lines.append(f"Not included (no exchange rate): {', '.join(report['missing'])}")
+        
+        return "\n".join(lines), keyboards["report"]
+
+    @staticmethod
+    def format_transaction(row: dict) -> str:
+        """One line per transaction in the history and search results."""
+        sign = "➕" if row["kind"] == "income" else "➖"
+        line = f"{sign} {row['date']:%Y-%m-%d} {row['symbol']}{row['amount']:,.2f} {row['category'] or 'Uncategorized'}"
+        if row["description"]:
+            line += f" · {row['description'][:40]}"
+        return line
+
+    @staticmethod
+    def get_history_message(page: dict) -> tuple[str, InlineKeyboardMarkup]:
+        """Generate a page of the transaction history from `FinanceService.get_history`.
+        
+        The Newer/Older buttons carry the page's cursors in their callback data
+        (`hist_n_<cursor>` and `hist_o_<cursor>`).
+        
+        Args:
+            page (dict): The page's rows and cursors
+            
+        Returns:
+            tuple[str, InlineKeyboardMarkup]: The history message and keyboard layout
+        """
+        lines = ["📜 History"]
+        lines.extend(MenuService.format_transaction(row) for row in page["rows"])
+        if not page["rows"]:
+            lines.append("No transactions recorded yet.")
+        
+        navigation = []
+        if page["newer"]:
+            navigation.append(InlineKeyboardButton("« Newer", callback_data=f"hist_n_{page['newer']}"))
+        if page["older"]:
+            navigation.append(InlineKeyboardButton("Older »", callback_data=f"hist_o_{page['older']}"))
+        keyboard = [navigation] if navigation else []
+        keyboard.append([InlineKeyboardButton("« Back to Main Menu", callback_data="back_to_main")])
+        return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+    @staticmethod
+    def get_search_message(results: dict) -> tuple[str, InlineKeyboardMarkup]:
+        """Generate a page of search results from `FinanceService.search_transactions`.
+        
+        The page buttons carry the page number and query in their callback data
+        (`srch_<page>_<query>`).
+        
+        Args:
+            results (dict): The page's rows, query and page number
+            
+        Returns:
+            tuple[str, InlineKeyboardMarkup]: The results message and keyboard layout
+        """
+        page, query = results["page"], results["query"]
+        lines = [f"🔎 Results for \"{query}\"" + (f" (page {page + 1})" if page else "")]
+        lines.extend(MenuService.format_transaction(row) for row in results["rows"])
+        if not results["rows"]:
+            lines.append("No matching transactions.")
+        
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("« Previous", callback_data=f"srch_{page - 1}_{query}"))
+        if results["more"]:
+            navigation.append(InlineKeyboardButton("Next »", callback_data=f"srch_{page + 1}_{query}"))
+        keyboard = [navigation] if navigation else []
+        keyboard.append([InlineKeyboardButton("« Back to Main Menu", callback_data="back_to_main")])
+        return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+    @staticmethod
+    def get_budgets_message(budgets: list) -> tuple[str, InlineKeyboardMarkup]:
+        """Generate the budget overview from `FinanceService.get_budgets`.
+        
+        Args:
+            budgets (list): The user's budgets with this month's spend
+            
+        Returns:
+            tuple[str, InlineKeyboardMarkup]: The budgets message and keyboard layout
+        """
+        lines = ["📊 Budgets this month"]
+        for budget in budgets:
+            symbol = budget["symbol"]
+            percent = budget["spent"] / budget["amount"] * 100
+            marker = "🚨" if percent >= 100 else "⚠️" if percent >= 80 else "✅"
+            lines.append(
+                f"{marker} {budget['category']}: {symbol}{budget['spent']:,.2f} of {symbol}{budget['amount']:,.2f} ({percent:.0f}%)"
+            )
+        if not budgets:
+            lines.append("No budgets yet.")
+        lines.append("")
+        lines.append("Set one with /budget [category] [amount], e.g. /budget Food 300")
+        
+        return "\n".join(lines), keyboards["back_to_settings"]
+
+    @staticmethod
+    def get_budget_alert_message(alert: dict) -> str:
+        """The alert sent when spending crosses a budget threshold (see `core.budgets.track_spend`)."""
+        symbol = alert["symbol"]
+        spent = f"{symbol}{alert['spent']:,.2f} of {symbol}{alert['amount']:,.2f}"
+        if alert["threshold"] >= 100:
+            return f"🚨 You've reached your {alert['category']} budget for this month: {spent} spent."
+        return f"⚠️ You've used {alert['threshold']}% of your {alert['category']} budget for this month: {spent} spent."
+
+    @staticmethod
+    def get_recurring_message(rules: list) -> tuple[str, InlineKeyboardMarkup]:
+        """Generate the list of recurring rules from `FinanceService.get_recurring_rules`.
+        
+        Args:
+            rules (list): The user's active rules, next due first
+            
+        Returns:
+            tuple[str, InlineKeyboardMarkup]: The rules message and keyboard layout
+        """
+        lines = ["🔁 Recurring transactions"]
+        for rule in rules:
+            sign = "+" if rule["kind"] == "income" else "-"
+            category = rule["category"] or "Uncategorized"
+            lines.append(
+                f"#{rule['id']} {sign}{rule['symbol']}{rule['amount']:,.2f} {category} ({rule['schedule']}), "
+                f"next {rule['next_run']:%Y-%m-%d %H:%M}"
+            )
+        if not rules:
+            lines.append("No recurring transactions yet.")
+        lines.append("")
+        lines.append("Add one with /recurring [income|expense] [amount] [category] [daily|weekly|monthly], "
+                     "e.g. /recurring expense 1200 Rent monthly")
+        if rules:
+            lines.append("Stop one with /recurring stop [id]")
+        
+        return "\n".join(lines), keyboards["back_to_settings"]
+
+    @staticmethod
+    def get_recurring_notice(fired: dict) -> str:
+        """The message sent when the scheduler records a rule's occurrences (see `core.recurrence.record_due`)."""
+        category = fired["category"] or "Uncategorized"
+        times = f" ({fired['count']} missed occurrences)" if fired["count"] > 1 else ""
+        return (
+            f"🔁 Recorded your recurring {category} {fired['kind']} of {fired['symbol']}{fired['amount']:,.2f}{times}. "
+            f"Next on {fired['next_run']:%Y-%m-%d}."
+        )
 
     @staticmethod
     def get_help_menu() -> tuple[str, InlineKeyboardMarkup]:
@@ -108,25 +258,7 @@ class MenuService:
         Returns:
             tuple[str, InlineKeyboardMarkup]: The help message and keyboard layout
         """
-        help_text = (
-            "📚 *FinanceBot Help*\n\n"
-            "Here's how to use the bot:\n\n"
-            "1. *Add Income/Expense*\n"
-            "   - Click ➕ Add Income or ➖ Add Expense\n"
-            "   - Select a category\n"
-            "   - Enter the amount\n"
-            "   - Add a description (optional)\n\n"
-            "2. *View Summary*\n"
-            "   - Click 📊 View Summary to see your financial overview\n\n"
-            "3. *Settings*\n"
-            "   - Click ⚙️ Settings to configure your preferences\n\n"
-            "Use the buttons below to navigate through the menus!"
-        )
-        
-        keyboard = [
-            [InlineKeyboardButton("« Back to Main Menu", callback_data="back_to_main")]
-        ]
-        return help_text, InlineKeyboardMarkup(keyboard)
+        return menus["help"].render()
 
     @staticmethod
     def get_amount_input_message(category: str, transaction_type: str) -> tuple[str, InlineKeyboardMarkup]:
@@ -139,13 +271,7 @@ class MenuService:
         Returns:
             tuple[str, InlineKeyboardMarkup]: The message and keyboard layout
         """
-        keyboard = [
-            [
-                InlineKeyboardButton("« Back to Categories", callback_data=f"back_to_amount_{transaction_type}_{category}"),
-            ],
-        ]
-        message = f"Enter the amount for {category} {transaction_type}:"
-        return message, InlineKeyboardMarkup(keyboard)
+        return prompts["amount"].render(category=category, transaction_type=transaction_type)
 
     @staticmethod
     def get_description_input_message(category: str, amount: float, transaction_type: str) -> tuple[str, InlineKeyboardMarkup]:
@@ -159,13 +285,8 @@ class MenuService:
         Returns:
             tuple[str, InlineKeyboardMarkup]: The message and keyboard layout
         """
-        message = f"Enter a description for {amount} {category} {transaction_type} (or skip):"
-        
         # Format the amount to avoid any decimal point issues
-        formatted_amount = str(amount).replace('.', '_')
-        
-        keyboard = [
-            [InlineKeyboardButton("Skip Description", callback_data=f"skip_description_{transaction_type}_{formatted_amount}_{category}")],
-            [InlineKeyboardButton("« Back to Amount", callback_data=f"back_to_amount_{transaction_type}_{category}")]
-        ]
-        return message, InlineKeyboardMarkup(keyboard) 
\ No newline at end of file
+        amount_key = str(amount).replace('.', '_')
+        return prompts["description"].render(
+            category=category, amount=amount, amount_key=amount_key, transaction_type=transaction_type
+        )
@@ -0,0 +1,206 @@
+"""Menus of the bot, declared as data and compiled once when the module is imported.
+
+`MENUS` declares each fixed screen as its text and rows of `(label, callback
+data)` buttons. They are compiled into `Menu`s whose keyboards are built and
+serialized to JSON a single time, so showing a menu allocates nothing and
+sending it does not serialize the keyboard again (see `CompiledMarkup`).
+
+`PROMPTS` declares screens that depend on the user's input, such as the
+amount and description prompts. Their text and callback data are
+`str.format` templates, compiled into `MenuTemplate`s that fill in a
+pre-serialized keyboard instead of building and serializing it per call.
+
+`KEYBOARDS` declares the fixed keyboards of generated screens (summaries,
+reports, budgets and recurring rules), whose text is built per call.
+"""
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+BACK_TO_MAIN = [("« Back to Main Menu", "back_to_main")]
+BACK_TO_SETTINGS = [("« Back to Settings", "menu_settings")]
+
+HELP_TEXT = (
+    "📚 *FinanceBot Help*\n\n"
+    "Here's how to use the bot:\n\n"
+    "1. *Add Income/Expense*\n"
+    "   - Click ➕ Add Income or ➖ Add Expense\n"
+    "   - Select a category\n"
+    "   - Enter the amount\n"
+    "   - Add a description (optional)\n\n"
+    "2. *View Summary*\n"
+    "   - Click 📊 View Summary to see your financial overview\n\n"
+    "3. *Settings*\n"
+    "   - Click ⚙️ Settings to configure your preferences\n\n"
+    "4. *Import a bank statement*\n"
+    "   - Send your statement as a CSV file with date, amount (or debit/credit) and description columns\n"
+    "   - Rows you've already imported are skipped\n\n"
+    "5. *Export your data*\n"
+    "   - Send `/export` for a CSV file, `/export jsonl` for JSON Lines, add `gz` to compress\n\n"
+    "6. *Search*\n"
+    "   - Send `/search coffee` to find transactions by their description\n\n"
+    "7. *Budgets*\n"
+    "   - Send `/budget Food 300` to set a monthly budget for a category, `/budget` to see them\n"
+    "   - You're alerted at 80% and 100% of a budget\n\n"
+    "8. *Recurring transactions*\n"
+    "   - Send `/recurring expense 1200 Rent monthly` to record rent every month, starting a month from now\n"
+    "   - Schedules are `daily`, `weekly`, `monthly` or `cron` and a cron expression, e.g. `cron 0 9 * * 1`\n"
+    "   - Send `/recurring` to see them, `/recurring stop 3` to stop one\n\n"
+    "Use the buttons below to navigate through the menus!"
+)
+
+# Fixed screens: text and rows of (label, callback data) buttons
+MENUS = {
+    "main": {
+        "text": "Welcome to FinanceBot! What would you like to do?",
+        "rows": [
+            [("➕ Add Income", "menu_add_income"), ("➖ Add Expense", "menu_add_expense")],
+            [("📊 View Summary", "menu_summary"), ("⚙️ Settings", "menu_settings")],
+            [("📜 History", "menu_history"), ("❓ Help", "menu_help")],
+        ],
+    },
+    "income": {
+        "text": "Select income category:",
+        "rows": [
+            [("💼 Salary", "income_salary"), ("💰 Freelance", "income_freelance")],
+            [("📈 Investment", "income_investment"), ("🎁 Gift", "income_gift")],
+            [("➕ Other", "income_other")],
+            BACK_TO_MAIN,
+        ],
+    },
+    "expense": {
+        "text": "Select expense category:",
+        "rows": [
+            [("🍔 Food", "expense_food"), ("🏠 Rent", "expense_rent")],
+            [("🚌 Transport", "expense_transport"), ("🛍️ Shopping", "expense_shopping")],
+            [("➕ Other", "expense_other")],
+            BACK_TO_MAIN,
+        ],
+    },
+    "settings": {
+        "text": "Settings:",
+        "rows": [
+            [("💰 Set Currency", "settings_currency"), ("📊 Set Budget", "settings_budget")],
+            [("🔁 Recurring", "settings_recurring")],
+            BACK_TO_MAIN,
+        ],
+    },
+    "help": {"text": HELP_TEXT, "rows": [BACK_TO_MAIN]},
+}
+
+# Screens for the user's input: text and callback data are filled in with `str.format`
+PROMPTS = {
+    "amount": {
+        "text": "Enter the amount for {category} {transaction_type}:",
+        "rows": [[("« Back to Categories", "back_to_amount_{transaction_type}_{category}")]],
+    },
+    "description": {
+        "text": "Enter a description for {amount} {category} {transaction_type} (or skip):",
+        "rows": [
+            [("Skip Description", "skip_description_{transaction_type}_{amount_key}_{category}")],
+            [("« Back to Amount", "back_to_amount_{transaction_type}_{category}")],
+        ],
+    },
+}
+
+# Keyboards of screens whose text is generated
+KEYBOARDS = {
+    "summary": [[("📈 Trends", "menu_report")], BACK_TO_MAIN],
+    "report": [[("« Back to Summary", "menu_summary")]],
+    "back_to_settings": [BACK_TO_SETTINGS],
+}
+
+
+class CompiledMarkup(InlineKeyboardMarkup):
+    """An inline keyboard that carries its own JSON serialization.
+
+    `to_json` returns the stored JSON and `to_dict` decodes it, instead of
+    walking the buttons. `InlineReplyBot` sends the JSON as is.
+    """
+
+    __slots__ = ("_json",)
+
+    def __init__(self, inline_keyboard, serialized: Optional[str] = None):
+        """Create a keyboard.
+
+        Args:
+            inline_keyboard: Rows of `InlineKeyboardButton`s
+            serialized (str, optional): The keyboard's JSON, serialized from the buttons if not given
+        """
+        super().__init__(inline_keyboard)
+        # Telegram objects are frozen once initialized; this attribute is never changed after
+        object.__setattr__(self, "_json", serialized or json.dumps(super().to_dict()))
+
+    def to_json(self) -> str:
+        return self._json
+
+    def to_dict(self, recursive: bool = True) -> dict:
+        return json.loads(self._json)
+
+
+def _keyboard(rows) -> list:
+    return [[InlineKeyboardButton(label, callback_data=data) for label, data in row] for row in rows]
+
+
+@dataclass(frozen=True)
+class Menu:
+    """A compiled screen: its text and keyboard."""
+
+    text: str
+    markup: CompiledMarkup
+
+    def render(self) -> tuple[str, CompiledMarkup]:
+        return self.text, self.markup
+
+
+class MenuTemplate:
+    """A screen whose text and callback data are filled in per call.
+
+    The keyboard is serialized once with a placeholder for each callback data,
+    which is then replaced by its JSON-encoded template: rendering fills in a
+    `str.format` template of the JSON with the JSON-escaped values. The latest
+    renderings are cached, since prompts repeat (the same categories, amounts).
+    """
+
+    def __init__(self, text: str, rows: list, cache_size: int = 1024):
+        """Compile a template.
+
+        Args:
+            text (str): `str.format` template of the text
+            rows (list): Rows of `(label, callback data template)` buttons
+            cache_size (int): Renderings kept
+        """
+        self.render = lru_cache(maxsize=cache_size)(self._render)
+        self.text = text
+        self.rows = tuple(tuple(row) for row in rows)
+        callbacks = [data for row in rows for _, data in row]
+        placeholders = iter(f"\x00{index}\x00" for index in range(len(callbacks)))
+        serialized = json.dumps(InlineKeyboardMarkup(
+            [[InlineKeyboardButton(label, callback_data=next(placeholders)) for label, _ in row] for row in rows]
+        ).to_dict())
+        serialized = serialized.replace("{", "{{").replace("}", "}}")
+        for index, data in enumerate(callbacks):
+            serialized = serialized.replace(json.dumps(f"\x00{index}\x00"), json.dumps(data))
+        self._json = serialized
+
+    def _render(self, **values) -> tuple[str, CompiledMarkup]:
+        """Fill in the template (through `render`, which caches the result).
+
+        Args:
+            **values: Values of the template's fields
+
+        Returns:
+            tuple[str, CompiledMarkup]: The text and keyboard
+        """
+        markup = CompiledMarkup(
+            [[InlineKeyboardButton(label, callback_data=data.format(**values)) for label, data in row] for row in self.rows],
+            self._json.format(**{key: json.dumps(str(value))[1:-1] for key, value in values.items()}),
+        )
+        return self.text.format(**values), markup
+
+
+menus = {name: Menu(spec["text"], CompiledMarkup(_keyboard(spec["rows"]))) for name, spec in MENUS.items()}
+prompts = {name: MenuTemplate(spec["text"], spec["rows"]) for name, spec in PROMPTS.items()}
+keyboards = {name: CompiledMarkup(_keyboard(rows)) for name, rows in KEYBOARDS.items()}
@@ -0,0 +1,197 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from core import recurrence
+from core.models import RecurringRule
+
+logger = logging.getLogger(__name__)
+
+
+class RecurringScheduler:
+    """Records recurring transactions as they fall due, in the background.
+
+    The next run of every active rule is kept in a min-heap, so the loop
+    sleeps until the earliest one instead of polling the database. Entries
+    are invalidated lazily: an entry only counts while it matches the rule's
+    latest known next run. The heap is reloaded every `refresh_interval`
+    seconds to pick up rules created or stopped by other processes.
+
+    Occurrences are recorded by `core.recurrence.record_due` under an
+    advisory lock, so when several processes run a scheduler only one of
+    them records at a time; the others retry after `retry_interval`.
+    """
+
+    def __init__(self, batch_size: int = 100, refresh_interval: float = 300.0, retry_interval: float = 30.0):
+        """Create a scheduler.
+
+        Args:
+            batch_size (int): Rules recorded per transaction
+            refresh_interval (float): Seconds between reloads of the heap from the database
+            retry_interval (float): Seconds to wait after losing the lock or failing to record
+        """
+        self.batch_size = batch_size
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.on_recorded: Optional[Callable[[dict], Awaitable[None]]] = None
+        self._heap: list[tuple[datetime, int]] = []
+        self._next: dict[int, datetime] = {}
+        self._refresh_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.runs = 0
+        self.recorded = 0
+        self.lock_skips = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self, on_recorded: Optional[Callable[[dict], Awaitable[None]]] = None) -> None:
+        """Load the rules and start the scheduling loop.
+
+        Args:
+            on_recorded (Callable, optional): Coroutine function called with each non-empty
+                result of `core.recurrence.record_due`, e.g. to notify users
+        """
+        if self.running:
+            return
+        self.on_recorded = on_recorded
+        self._wakeup = asyncio.Event()
+        await self.refresh()
+        self._task = asyncio.create_task(self._run(), name="recurring-scheduler")
+        logger.info(f"RecurringScheduler started with {len(self._next)} active rules")
+
+    async def stop(self) -> None:
+        """Stop the scheduling loop (a batch being recorded is rolled back)."""
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("RecurringScheduler stopped")
+
+    def schedule(self, rule_id: int, next_run: datetime) -> None:
+        """Set a rule's next run, replacing any earlier entry, and wake the loop if it is now the earliest.
+
+        Does nothing unless the loop runs in this process, whose next refresh picks the rule up otherwise.
+        """
+        if self.running:
+            self._push(rule_id, next_run)
+
+    def _push(self, rule_id: int, next_run: datetime) -> None:
+        self._next[rule_id] = next_run
+        heapq.heappush(self._heap, (next_run, rule_id))
+        if self._heap[0] == (next_run, rule_id):
+            self._wakeup.set()
+
+    def unschedule(self, rule_id: int) -> None:
+        """Forget a rule; its heap entry is dropped when it surfaces."""
+        self._next.pop(rule_id, None)
+
+    async def refresh(self) -> None:
+        """Rebuild the heap from the active rules in the database."""
+        rows = [row async for row in RecurringRule.objects.filter(is_active=True).values_list("next_run", "id")]
+        self._next = {rule_id: next_run for next_run, rule_id in rows}
+        self._heap = rows
+        heapq.heapify(self._heap)
+        self._refresh_at = time.monotonic() + self.refresh_interval
+
+    def _earliest(self) -> Optional[datetime]:
+        """The earliest valid next run, dropping invalidated entries on top of the heap."""
+        while self._heap:
+            next_run, rule_id = self._heap[0]
+            if self._next.get(rule_id) == next_run:
+                return next_run
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now: datetime) -> list[int]:
+        """Remove the entries due by `now`, returning the ids of the rules they were valid for."""
+        due = []
+        while (next_run := self._earliest()) is not None and next_run <= now:
+            _, rule_id = heapq.heappop(self._heap)
+            del self._next[rule_id]
+            due.append(rule_id)
+        return due
+
+    async def run_due(self, now: Optional[datetime] = None) -> Optional[dict]:
+        """Record one batch of due occurrences and reschedule the rules it fired.
+
+        Returns:
+            Optional[dict]: The result of `core.recurrence.record_due`, or None if another
+            process holds the lock
+        """
+        now = now or timezone.now()
+        result = await sync_to_async(recurrence.record_due)(now, self.batch_size)
+        self.runs += 1
+        if result is None:
+            self.lock_skips += 1
+            for rule_id in self._pop_due(now):
+                self._push(rule_id, now + timedelta(seconds=self.retry_interval))
+            return None
+        if not result["more"]:
+            # Anything else due here was recorded or stopped by another process
+            self._pop_due(now)
+        for fired in result["fired"]:
+            self._push(fired["rule_id"], fired["next_run"])
+        self.recorded += result["created"]
+        if result["fired"]:
+            logger.info(f"Recorded {result['created']} recurring transactions for {len(result['fired'])} rules")
+            if self.on_recorded:
+                try:
+                    await self.on_recorded(result)
+                except Exception as e:
+                    logger.error(f"Error reporting recurring transactions: {str(e)}", exc_info=True)
+        return result
+
+    async def _run(self) -> None:
+        while True:
+            delay = None
+            try:
+                if time.monotonic() >= self._refresh_at:
+                    await self.refresh()
+                earliest = self._earliest()
+                if earliest is not None and earliest <= timezone.now():
+                    await self.run_due()
+                    continue
+                if earliest is not None:
+                    delay = (earliest - timezone.now()).total_seconds()
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error recording recurring transactions: {str(e)}", exc_info=True)
+                delay = self.retry_interval
+            until_refresh = self._refresh_at - time.monotonic()
+            delay = until_refresh if delay is None else min(delay, until_refresh)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(delay, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        """Snapshot of scheduler metrics."""
+        earliest = self._earliest()
+        return {
+            "running": self.running,
+            "rules": len(self._next),
+            "next_run": earliest.isoformat() if earliest else None,
+            "runs": self.runs,
+            "recorded": self.recorded,
+            "lock_skips": self.lock_skips,
+            "failed": self.failed,
+        }
+
+
+recurring_scheduler = RecurringScheduler(
+    batch_size=settings.RECURRING_BATCH_SIZE,
+    refresh_interval=settings.RECURRING_REFRESH_INTERVAL,
+)
@@ -0,0 +1,84 @@
+"""Full-text search over transaction descriptions.
+
+Descriptions are indexed through the generated `search_vector` column and
+its GIN index, so a search reads only the user's rows containing the
+query's words instead of scanning every description. Each word of the query
+matches as a prefix ("groc" finds "groceries"); results are ranked by
+`ts_rank`, newest first among equals.
+"""
+import re
+from typing import Optional
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+from core.models import Transaction
+
+# Longest normalized query, in bytes: it travels in the callback data of the
+# page buttons (`srch_<page>_<query>`), which Telegram limits to 64 bytes
+MAX_QUERY_BYTES = 50
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def normalize_query(text: str) -> Optional[str]:
+    """Reduce a query to lowercase words separated by spaces, at most `MAX_QUERY_BYTES` long.
+
+    Returns:
+        Optional[str]: The normalized query, or None if it has no words
+    """
+    query = ""
+    for word in _WORD.findall(text.lower()):
+        candidate = f"{query} {word}" if query else word
+        if len(candidate.encode()) > MAX_QUERY_BYTES:
+            break
+        query = candidate
+    return query or None
+
+
+def search_query(user_id: int, query: str) -> SearchQuery:
+    """All words of a normalized query, each matched as a prefix of a description word, for one user.
+
+    The user id is indexed at weight D and description words at weight A
+    (see `Transaction.search_vector`), so the index lookup itself is
+    restricted to the user's rows.
+    """
+    terms = [f"{int(user_id)}:D"] + [f"{word}:*A" for word in query.split()]
+    return SearchQuery(" & ".join(terms), search_type="raw", config="simple")
+
+
+def search_transactions(user_id: int, query: str, page: int = 0, page_size: int = 10) -> dict:
+    """Read one page of a user's transactions matching a normalized query, best match first.
+
+    Pages are addressed by number: ranking has to score every matching row
+    anyway, so an offset adds little on top.
+
+    Args:
+        user_id (int): Primary key of the user
+        query (str): Query from `normalize_query`
+        page (int): Zero-based page number
+        page_size (int): Rows per page
+
+    Returns:
+        dict: `query`, `page`, `rows` (each with `id`, `kind`, `date`, `amount`,
+        `symbol`, `category` and `description`) and `more` (whether a next page exists)
+    """
+    tsquery = search_query(user_id, query)
+    start = page * page_size
+    rows = list(
+        Transaction.objects.filter(user_id=user_id, search_vector=tsquery)
+        .annotate(rank=SearchRank(F("search_vector"), tsquery))
+        .order_by("-rank", "-date", "-id")
+        .values_list("id", "kind", "date", "amount", "currency__symbol", "category__name", "description")
+        [start:start + page_size + 1]
+    )
+    return {
+        "query": query,
+        "page": page,
+        "rows": [
+            {
+                "id": pk, "kind": kind, "date": date, "amount": amount,
+                "symbol": symbol, "category": category, "description": description,
+            }
+            for pk, kind, date, amount, symbol, category, description in rows[:page_size]
+        ],
+        "more": len(rows) > page_size,
+    }
@@ -0,0 +1,354 @@
+import asyncio
+import csv
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Iterable, Iterator, Optional
+import httpx
+from django.conf import settings
+from django.db import connection
+from telegram import Bot, Document
+from telegram.error import BadRequest
+from api.services.finance import FinanceService
+
+logger = logging.getLogger(__name__)
+
+# Header names (lowercased) recognised for each field
+COLUMN_ALIASES = {
+    "date": ("date", "transaction date", "posting date", "posted date", "value date", "booking date"),
+    "amount": ("amount", "transaction amount", "value", "sum"),
+    "debit": ("debit", "withdrawal", "withdrawals", "money out", "paid out"),
+    "credit": ("credit", "deposit", "deposits", "money in", "paid in"),
+    "description": ("description", "details", "narrative", "memo", "payee", "reference", "transaction details"),
+    "category": ("category",),
+}
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d.%m.%Y", "%d-%m-%Y", "%Y/%m/%d", "%d %b %Y", "%d %B %Y")
+
+DEFAULT_CATEGORY = "Imported"
+
+_AMOUNT_JUNK = re.compile(r"[^\d,.\-]")
+
+
+class StatementFormatError(ValueError):
+    """Raised when a CSV file does not look like a bank statement."""
+
+
+class StatementDownloadError(Exception):
+    """Raised when a statement cannot be downloaded; never carries the file URL, which holds the bot token."""
+
+
+def map_columns(header: list) -> dict:
+    """Map statement fields to column positions from a CSV header row.
+
+    Raises:
+        StatementFormatError: If there is no date column or no amount (or debit/credit) column
+    """
+    normalized = [column.strip().lower() for column in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for position, name in enumerate(normalized):
+            if name in aliases:
+                columns[field] = position
+                break
+    if "date" not in columns:
+        raise StatementFormatError("No date column found")
+    if "amount" not in columns and "debit" not in columns and "credit" not in columns:
+        raise StatementFormatError("No amount, debit or credit column found")
+    return columns
+
+
+def parse_amount(value: str) -> Optional[Decimal]:
+    """Parse a statement amount such as "-1,234.50", "(12.00)" or "12,50". Empty cells give None."""
+    value = value.strip()
+    if not value:
+        return None
+    negative = value.startswith("(") and value.endswith(")")
+    value = _AMOUNT_JUNK.sub("", value)
+    if "," in value:
+        # A lone comma followed by two digits is a decimal comma, otherwise a thousands separator
+        whole, _, fraction = value.rpartition(",")
+        value = f"{whole}.{fraction}" if "." not in value and len(fraction) == 2 else value.replace(",", "")
+    if not value or value in ("-", "."):
+        return None
+    amount = Decimal(value)
+    return -abs(amount) if negative else amount
+
+
+def parse_date(value: str) -> datetime:
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        for date_format in DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, date_format)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Unrecognised date {value!r}")
+    return parsed
+
+
+def iter_statement_records(lines: Iterable[str]) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    """Parse statement CSV lines lazily into transaction records.
+
+    Each row gets an `import_hash` over its date, signed amount and description
+    plus how many identical rows came before it in the file, so re-importing
+    a statement (or an overlapping one) skips rows that are already stored
+    while genuinely repeated rows in one statement are all kept.
+
+    Args:
+        lines (Iterable[str]): Lines of the CSV file, header first
+
+    Yields:
+        tuple: (line number, record or None, error or None); blank rows are skipped
+
+    Raises:
+        StatementFormatError: If the header does not describe a statement
+    """
+    reader = csv.reader(lines)
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise StatementFormatError("The file is empty")
+    columns = map_columns(header)
+    occurrences = Counter()
+
+    def cell(row: list, field: str) -> str:
+        position = columns.get(field)
+        return row[position] if position is not None and position < len(row) else ""
+
+    for row in reader:
+        line_no = reader.line_num
+        if not any(value.strip() for value in row):
+            continue
+        try:
+            date = parse_date(cell(row, "date"))
+            amount = parse_amount(cell(row, "amount"))
+            if amount is None:
+                debit, credit = parse_amount(cell(row, "debit")), parse_amount(cell(row, "credit"))
+                amount = (credit or 0) - abs(debit or 0)
+            if not amount:
+                raise ValueError("No amount")
+        except (ValueError, InvalidOperation) as e:
+            yield line_no, None, str(e) or "Invalid amount"
+            continue
+
+        description = cell(row, "description").strip()
+        content = f"{date.isoformat()}|{amount}|{description}"
+        occurrences[content] += 1
+        digest = hashlib.sha256(f"{content}|{occurrences[content]}".encode()).hexdigest()
+        yield line_no, {
+            "type": "income" if amount > 0 else "expense",
+            "amount": abs(amount),
+            "date": date,
+            "description": description,
+            "category_name": cell(row, "category").strip()[:100] or DEFAULT_CATEGORY,
+            "import_hash": digest,
+        }, None
+
+
+class StatementImporter:
+    """Imports bank-statement CSV documents sent to the bot.
+
+    The file is streamed to a temporary file, then parsed and written in
+    chunks from a worker thread, so a large statement never sits in memory
+    and never blocks the event loop. Each chunk is committed separately;
+    rows carry a content hash, so retrying a failed import resumes where it
+    stopped. Progress is shown by editing a single status message.
+    """
+
+    def __init__(self, chunk_size: int = 1000, max_bytes: int = 20 * 1024 * 1024,
+                 concurrency: int = 2, progress_interval: float = 3.0):
+        """Create an importer.
+
+        Args:
+            chunk_size (int): Rows parsed and inserted per transaction
+            max_bytes (int): Largest accepted file
+            concurrency (int): Imports allowed to run at the same time
+            progress_interval (float): Minimum seconds between progress message edits
+        """
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.progress_interval = progress_interval
+        self._slots = asyncio.Semaphore(concurrency)
+        self._active_users = set()
+
+    def run(self, path: str, user_id: int, report: Callable[[dict], None] = lambda stats: None) -> dict:
+        """Import a statement file synchronously (call from a worker thread).
+
+        Args:
+            path (str): Path of the downloaded CSV file
+            user_id (int): Primary key of the importing user
+            report (Callable): Called with the running totals after each chunk
+
+        Returns:
+            dict: Totals: rows, imported, duplicates, failed and the first few errors
+        """
+        stats = {"rows": 0, "imported": 0, "duplicates": 0, "failed": 0, "errors": []}
+
+        def fail(line_no: int, detail: str):
+            stats["failed"] += 1
+            if len(stats["errors"]) < 5:
+                stats["errors"].append(f"line {line_no}: {detail}")
+
+        with open(path, newline="", encoding="utf-8-sig", errors="replace") as lines:
+            chunk = []
+            for line_no, record, error in iter_statement_records(lines):
+                stats["rows"] += 1
+                if error:
+                    fail(line_no, error)
+                    continue
+                chunk.append((line_no, record))
+                if len(chunk) >= self.chunk_size:
+                    self._write_chunk(user_id, chunk, stats, fail)
+                    chunk = []
+                    report(dict(stats))
+            if chunk:
+                self._write_chunk(user_id, chunk, stats, fail)
+        return stats
+
+    def _run_in_thread(self, path: str, user_id: int, report: Callable[[dict], None]) -> dict:
+        try:
+            return self.run(path, user_id, report)
+        finally:
+            # Worker threads are not managed by Django's request cycle
+            connection.close()
+
+    def _write_chunk(self, user_id: int, chunk: list, stats: dict, fail: Callable) -> None:
+        results = FinanceService._bulk_create_transactions(
+            user_id, [record for _, record in chunk], self.chunk_size
+        )
+        for (line_no, _), result in zip(chunk, results):
+            if result["status"] == "success":
+                stats["imported"] += 1
+            elif result["status"] == "duplicate":
+                stats["duplicates"] += 1
+            else:
+                fail(line_no, result["detail"])
+
+    async def import_document(self, bot: Bot, document: Document, user_id: int, chat_id: int) -> Optional[dict]:
+        """Download a statement document and import it, reporting progress in the chat.
+
+        Args:
+            bot (Bot): Bot used to download the file and edit the status message
+            document (Document): The uploaded CSV document
+            user_id (int): Primary key of the importing user
+            chat_id (int): Chat to report progress in
+
+        Returns:
+            dict: Import totals, or None if the import did not run
+        """
+        if document.file_size and document.file_size > self.max_bytes:
+            await bot.send_message(chat_id, f"❌ The file is too large (limit {self.max_bytes // (1024 * 1024)} MB).")
+            return None
+        if user_id in self._active_users:
+            await bot.send_message(chat_id, "⏳ Your previous statement is still being imported.")
+            return None
+
+        self._active_users.add(user_id)
+        status = await bot.send_message(chat_id, "📥 Downloading statement...")
+        progress = ProgressMessage(bot, chat_id, status.message_id, self.progress_interval)
+        loop = asyncio.get_running_loop()
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        try:
+            await self._download(bot, document, path)
+            await progress.show("⏳ Importing statement...")
+            async with self._slots:
+                stats = await asyncio.to_thread(
+                    self._run_in_thread, path, user_id, lambda stats: loop.call_soon_threadsafe(progress.update, stats)
+                )
+            await progress.finish(stats)
+            return stats
+        except StatementFormatError as e:
+            await progress.show(f"❌ This doesn't look like a bank statement: {e}.")
+        except Exception as e:
+            logger.error(f"Statement import failed: {str(e)}", exc_info=True)
+            await progress.show("❌ The import failed. Sending the file again resumes where it stopped.")
+        finally:
+            self._active_users.discard(user_id)
+            os.unlink(path)
+        return None
+
+    async def _download(self, bot: Bot, document: Document, path: str) -> None:
+        """Stream the document to `path` without holding it in memory."""
+        telegram_file = await bot.get_file(document.file_id)
+        if not telegram_file.file_path.startswith(("http://", "https://")):
+            # Local Bot API server: the file is already on disk
+            await telegram_file.download_to_drive(path)
+            return
+        size = 0
+        try:
+            async with httpx.AsyncClient(timeout=60) as client:
+                async with client.stream("GET", telegram_file.file_path) as response:
+                    if response.status_code != 200:
+                        raise StatementDownloadError(f"Statement download failed with status {response.status_code}")
+                    with open(path, "wb") as out:
+                        async for chunk in response.aiter_bytes():
+                            size += len(chunk)
+                            if size > self.max_bytes:
+                                raise ValueError("Statement file exceeds the size limit")
+                            out.write(chunk)
+        except httpx.HTTPError as e:
+            # httpx errors may quote the URL, so neither the message nor the chained exception is kept
+            raise StatementDownloadError(f"Statement download failed: {type(e).__name__}") from None
+
+
+class ProgressMessage:
+    """A status message edited in place, at most once every `interval` seconds."""
+
+    def __init__(self, bot: Bot, chat_id: int, message_id: int, interval: float = 3.0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval
+        self._last_edit = 0.0
+        self._pending: Optional[asyncio.Task] = None
+
+    def update(self, stats: dict) -> None:
+        """Report running totals; edits that come too soon after the last one are dropped."""
+        now = time.monotonic()
+        if now - self._last_edit < self.interval or (self._pending and not self._pending.done()):
+            return
+        self._last_edit = now
+        self._pending = asyncio.ensure_future(self.show(
+            f"⏳ Importing statement... {stats['rows']} rows read, {stats['imported']} imported"
+        ))
+
+    async def show(self, text: str) -> None:
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+        except BadRequest as e:
+            # "Message is not modified" and similar are harmless here
+            logger.debug(f"Progress edit skipped: {str(e)}")
+
+    async def finish(self, stats: dict) -> None:
+        if self._pending:
+            await self._pending
+        lines = [
+            "✅ Statement imported!",
+            f"Rows read: {stats['rows']}",
+            f"Imported: {stats['imported']}",
+            f"Already imported (skipped): {stats['duplicates']}",
+        ]
+        if stats["failed"]:
+            lines.append(f"Failed: {stats['failed']}")
+            lines.extend(f"  • {error}" for error in stats["errors"])
+        await self.show("\n".join(lines))
+
+
+statement_importer = StatementImporter(
+    chunk_size=settings.BULK_CREATE_CHUNK_SIZE,
+    max_bytes=settings.STATEMENT_IMPORT_MAX_BYTES,
+    concurrency=settings.STATEMENT_IMPORT_CONCURRENCY,
+    progress_interval=settings.STATEMENT_IMPORT_PROGRESS_INTERVAL,
+)
@@ -1,21 +1,32 @@
+from typing import Union
 from fastapi import HTTPException
-from api.schemas import TelegramUpdate, CommandResponse
+from api.schemas import TelegramUpdate, CommandResponse, update_payload_adapter
 from api.services.commnad_parser import CommandParser
 from api.services.menu import MenuService
 from api.services.finance import FinanceService
+from api.services import history, search
+from api.services.identity import identity_cache
+from api.services.inline_reply import InlineReplyBot
+from api.services.statement_import import statement_importer
+from api.services.broadcast import notifier
+from api.services.bot_request import bot_request
+from api.services.export import EXPORT_FORMATS, ExportBusy, export_filename, export_pool, write_export
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from telegram import Update, Bot
+from telegram import Bot, Update
 from telegram.ext import Application, ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+import asyncio
 import logging
+import os
+import tempfile
 
-# Configure logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+# Largest document a bot can upload through the Bot API
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+
 class TelegramService:
     """Service for handling Telegram bot interactions and state management."""
     
@@ -26,21 +37,39 @@ class TelegramService:
             token (str): The Telegram bot token
         """
         self.token = token
-        self.bot = Bot(token=token)
+        # Replies to users and background sends (broadcasts, notifications, exports,
+        # imports) get separate connection pools, so bulk work cannot delay replies
+        self.bot = InlineReplyBot(
+            token=token,
+            request=bot_request("interactive", settings.BOT_HTTP_POOL_SIZE, settings.BOT_HTTP_POOL_TIMEOUT),
+        )
+        self.bulk_bot = Bot(
+            token=token,
+            request=bot_request("bulk", settings.BOT_HTTP_BULK_POOL_SIZE, settings.BOT_HTTP_BULK_POOL_TIMEOUT),
+        )
         self.application = None
         self.user_states = {}  # Store user states for multi-step interactions
+        self.background_tasks = set()  # Long-running work started by handlers, e.g. statement imports
 
     async def initialize(self):
         """Initialize the bot and application with all necessary handlers."""
         self.application = Application.builder().bot(self.bot).build()
         
-        # Register handlers
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
+        # Register handlers. Edited messages are decoded too, but only new messages
+        # drive the menu flow.
+        new_message = filters.UpdateType.MESSAGE
+        self.application.add_handler(CommandHandler("start", self.start_command, filters=new_message))
+        self.application.add_handler(CommandHandler("help", self.help_command, filters=new_message))
+        self.application.add_handler(CommandHandler("export", self.export_command, filters=new_message))
+        self.application.add_handler(CommandHandler("budget", self.budget_command, filters=new_message))
+        self.application.add_handler(CommandHandler("search", self.search_command, filters=new_message))
+        self.application.add_handler(CommandHandler("recurring", self.recurring_command, filters=new_message))
         self.application.add_handler(CallbackQueryHandler(self.button_callback))
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(new_message & filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(new_message & filters.Document.FileExtension("csv"), self.handle_statement))
         
         await self.application.initialize()
+        await self.bulk_bot.initialize()
         logger.info("TelegramService initialized successfully")
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -58,6 +87,94 @@ class TelegramService:
         message, keyboard = MenuService.get_help_menu()
         await update.message.reply_text(message, reply_markup=keyboard, parse_mode="Markdown")
 
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle `/export [csv|jsonl] [gz]` by sending the user's transactions as a document.
+        
+        The export is written in the background so the update completes immediately.
+        """
+        args = [arg.lower() for arg in context.args or []]
+        export_format = next((arg for arg in args if arg in EXPORT_FORMATS), "csv")
+        compress = "gz" in args or "gzip" in args
+        user = await self.get_or_create_user_by_telegram_id(
+            update.effective_user.id,
+            first_name=update.effective_user.first_name or "",
+            username=update.effective_user.username or ""
+        )
+        await update.message.reply_text("📤 Preparing your export...")
+        self.run_in_background(self.send_export(user.pk, update.effective_chat.id, export_format, compress))
+
+    async def budget_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle `/budget` (show budgets) and `/budget [category] [amount]` (set a monthly budget)."""
+        await self.get_or_create_user_by_telegram_id(
+            update.effective_user.id,
+            first_name=update.effective_user.first_name or "",
+            username=update.effective_user.username or ""
+        )
+        response = await FinanceService.handle_budget_command(context.args or [], update.effective_user.id)
+        await update.message.reply_text(response.details["message"])
+
+    async def recurring_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle `/recurring` (show rules), `/recurring stop [id]` and adding a recurring income or expense."""
+        await self.get_or_create_user_by_telegram_id(
+            update.effective_user.id,
+            first_name=update.effective_user.first_name or "",
+            username=update.effective_user.username or ""
+        )
+        response = await FinanceService.handle_recurring_command(context.args or [], update.effective_user.id)
+        await update.message.reply_text(response.details["message"])
+
+    async def send_recurring_notices(self, result: dict) -> None:
+        """Tell users about transactions the recurring scheduler recorded, and any budget alerts they raised."""
+        chats = {fired["user_id"]: fired["telegram_id"] for fired in result["fired"]}
+        messages = [(fired["telegram_id"], MenuService.get_recurring_notice(fired)) for fired in result["fired"]]
+        messages += [(chats.get(alert["user_id"]), MenuService.get_budget_alert_message(alert)) for alert in result["alerts"]]
+        # A batch can cover many users: send within the flood limits
+        await asyncio.gather(*(notifier.send(self.bulk_bot, chat_id, text) for chat_id, text in messages if chat_id is not None))
+
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle `/search [text]` by showing the first page of matching transactions."""
+        query = search.normalize_query(" ".join(context.args or []))
+        if query is None:
+            await update.message.reply_text("Usage: /search [text], e.g. /search coffee")
+            return
+        user = await self.get_or_create_user_by_telegram_id(
+            update.effective_user.id,
+            first_name=update.effective_user.first_name or "",
+            username=update.effective_user.username or ""
+        )
+        results = await FinanceService.search_transactions(user.pk, query)
+        message, keyboard = MenuService.get_search_message(results)
+        await update.message.reply_text(message, reply_markup=keyboard)
+
+    async def send_export(self, user_pk: int, chat_id: int, export_format: str, compress: bool) -> None:
+        """Write an export to a temporary file on the export pool and send it as a document."""
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            size = await export_pool.run(
+                write_export, path, user_pk, export_format, compress, settings.EXPORT_CHUNK_SIZE
+            )
+            if size > TELEGRAM_UPLOAD_LIMIT:
+                hint = "" if compress else " Try /export csv gz for a compressed file."
+                await self.bulk_bot.send_message(chat_id, f"❌ The export is too large to send here.{hint}")
+                return
+            with open(path, "rb") as document:
+                await self.bulk_bot.send_document(chat_id, document, filename=export_filename(export_format, compress))
+        except ExportBusy:
+            await self.bulk_bot.send_message(chat_id, "⏳ Too many exports are running. Please try again in a few minutes.")
+        except Exception as e:
+            logger.error(f"Error sending export: {str(e)}", exc_info=True)
+            await self.bulk_bot.send_message(chat_id, "❌ The export failed. Please try again.")
+        finally:
+            os.unlink(path)
+
+    def run_in_background(self, coroutine) -> asyncio.Task:
+        """Run long work started by a handler without holding up the update, keeping a reference to the task."""
+        task = asyncio.create_task(coroutine)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle text messages for amount and description input.
         
@@ -101,12 +218,12 @@ class TelegramService:
                     "description": text
                 }
                 
-                user = await User.objects.aget(telegram_id=user_id)
+                user_pk = await identity_cache.get_user_id(user_id)
                 
                 if state["transaction_type"] == "income":
-                    response = await FinanceService.create_income(record_data, user.id)
+                    response = await FinanceService.create_income(record_data, user_pk)
                 else:
-                    response = await FinanceService.create_expense(record_data, user.id)
+                    response = await FinanceService.create_expense(record_data, user_pk)
                 
                 # Clear user state before showing the message
                 del self.user_states[user_id]
@@ -118,6 +235,8 @@ class TelegramService:
                         f"✅ {state['transaction_type'].capitalize()} of {state['amount']} for {state['category']} has been recorded!",
                         reply_markup=keyboard
                     )
+                    for alert in response.details.get("budget_alerts", []):
+                        await update.message.reply_text(MenuService.get_budget_alert_message(alert))
                 else:
                     message, keyboard = MenuService.get_main_menu()
                     await update.message.reply_text(
@@ -131,6 +250,21 @@ class TelegramService:
                 reply_markup=MenuService.get_main_menu()[1]
             )
 
+    async def handle_statement(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Import a bank statement CSV sent as a document.
+        
+        The import runs in the background so the update (and the webhook
+        response) completes immediately; progress is reported in the chat.
+        """
+        user = await self.get_or_create_user_by_telegram_id(
+            update.effective_user.id,
+            first_name=update.effective_user.first_name or "",
+            username=update.effective_user.username or ""
+        )
+        self.run_in_background(statement_importer.import_document(
+            self.bulk_bot, update.message.document, user.pk, update.effective_chat.id
+        ))
+
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle button presses and update the menu accordingly.
         
@@ -187,12 +321,31 @@ class TelegramService:
                 await query.edit_message_text(message, reply_markup=keyboard, parse_mode="Markdown")
 
             elif button_data == "menu_summary":
-                # Coming soon message for summary feature
-                message, keyboard = MenuService.get_main_menu()
-                await query.edit_message_text(
-                    "📊 Summary feature coming soon!\n\nUse the menu below to add income or expenses.",
-                    reply_markup=keyboard
-                )
+                user_pk = await identity_cache.get_user_id(user_id)
+                summary = await FinanceService.get_summary(user_pk)
+                message, keyboard = MenuService.get_summary_message(summary)
+                await query.edit_message_text(message, reply_markup=keyboard)
+
+            elif button_data == "menu_report":
+                user_pk = await identity_cache.get_user_id(user_id)
+                report = await FinanceService.get_report(user_pk)
+                message, keyboard = MenuService.get_report_message(report)
+                await query.edit_message_text(message, reply_markup=keyboard)
+
+            elif button_data == "menu_history" or button_data.startswith("hist_"):
+                # Cursor pages: hist_o_<cursor> is the page older than the cursor, hist_n_<cursor> the newer one
+                direction, cursor = (button_data.split("_", 2)[1:] if button_data.startswith("hist_") else (None, None))
+                user_pk = await identity_cache.get_user_id(user_id)
+                page = await FinanceService.get_history(user_pk, cursor, direction or history.OLDER)
+                message, keyboard = MenuService.get_history_message(page)
+                await query.edit_message_text(message, reply_markup=keyboard)
+
+            elif button_data.startswith("srch_"):
+                page, text = button_data.split("_", 2)[1:]
+                user_pk = await identity_cache.get_user_id(user_id)
+                results = await FinanceService.search_transactions(user_pk, text, int(page))
+                message, keyboard = MenuService.get_search_message(results)
+                await query.edit_message_text(message, reply_markup=keyboard)
 
             elif button_data == "settings_currency":
                 # Coming soon message for currency settings
@@ -203,12 +356,14 @@ class TelegramService:
                 )
 
             elif button_data == "settings_budget":
-                # Coming soon message for budget settings
-                message, keyboard = MenuService.get_settings_menu()
-                await query.edit_message_text(
-                    "📊 Budget settings coming soon!\n\nYou can still track your income and expenses.",
-                    reply_markup=keyboard
-                )
+                user_pk = await identity_cache.get_user_id(user_id)
+                message, keyboard = MenuService.get_budgets_message(await FinanceService.get_budgets(user_pk))
+                await query.edit_message_text(message, reply_markup=keyboard)
+
+            elif button_data == "settings_recurring":
+                user_pk = await identity_cache.get_user_id(user_id)
+                message, keyboard = MenuService.get_recurring_message(await FinanceService.get_recurring_rules(user_pk))
+                await query.edit_message_text(message, reply_markup=keyboard)
 
             elif button_data.startswith("income_") or button_data.startswith("expense_"):
                 # Handle income/expense category selection
@@ -264,12 +419,12 @@ class TelegramService:
                     "description": ""
                 }
                 
-                user = await User.objects.aget(telegram_id=user_id)
+                user_pk = await identity_cache.get_user_id(user_id)
                 
                 if type == "income":
-                    response = await FinanceService.create_income(record_data, user.id)
+                    response = await FinanceService.create_income(record_data, user_pk)
                 else:
-                    response = await FinanceService.create_expense(record_data, user.id)
+                    response = await FinanceService.create_expense(record_data, user_pk)
                 
                 # Clear user state before showing the message
                 del self.user_states[user_id]
@@ -281,6 +436,8 @@ class TelegramService:
                         f"✅ {type.capitalize()} of {amount} for {category} has been recorded!",
                         reply_markup=keyboard
                     )
+                    for alert in response.details.get("budget_alerts", []):
+                        await query.message.reply_text(MenuService.get_budget_alert_message(alert))
                 else:
                     message, keyboard = MenuService.get_main_menu()
                     await query.edit_message_text(
@@ -300,50 +457,84 @@ class TelegramService:
             logger.error(f"Error in button_callback: {str(e)}", exc_info=True)
             await query.edit_message_text("❌ An error occurred. Please try again.")
 
-    async def process_update(self, update: TelegramUpdate) -> CommandResponse:
+    def decode_update(self, body: bytes) -> Update:
+        """Decode a raw webhook body into a python-telegram-bot `Update`.
+        
+        The body is parsed and validated once by pydantic-core and the resulting
+        dict is handed directly to `Update.de_json`, without intermediate models.
+        
+        Args:
+            body (bytes): The raw request body
+            
+        Returns:
+            Update: The decoded update
+            
+        Raises:
+            ValueError: If the body is not a valid Telegram update (pydantic's
+                ValidationError is a ValueError)
+        """
+        try:
+            return Update.de_json(update_payload_adapter.validate_json(body), self.bot)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Malformed update: {str(e)}") from e
+
+    @staticmethod
+    def ordering_key(update: Update) -> int:
+        """Key used to keep updates from the same user in order (the sender's Telegram id)."""
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return update.update_id
+
+    def to_telegram_update(self, update: TelegramUpdate) -> Update:
+        """Convert a validated `TelegramUpdate` schema into a python-telegram-bot `Update`."""
+        return Update.de_json(self.update_to_dict(update), self.bot)
+
+    @staticmethod
+    def update_to_dict(update: TelegramUpdate) -> dict:
+        """Dump a `TelegramUpdate` schema into the dict layout python-telegram-bot expects."""
+        # Convert the update to a format that python-telegram-bot can handle
+        update_dict = update.model_dump()
+        
+        # Ensure the update has the correct structure for python-telegram-bot
+        if update.callback_query:
+            # Convert our CallbackQuery to the format expected by python-telegram-bot
+            callback_query = update.callback_query.model_dump()
+            callback_query["from"] = callback_query.pop("from_user")
+            update_dict["callback_query"] = callback_query
+        elif update.message:
+            # Convert our Message to the format expected by python-telegram-bot
+            message = update.message.model_dump()
+            message["from"] = message.pop("from_user")
+            update_dict["message"] = message
+        
+        return update_dict
+
+    async def process_update(self, update: Union[Update, TelegramUpdate]) -> CommandResponse:
         """Process incoming Telegram updates.
         
-        This method converts the incoming update to the format expected by python-telegram-bot
-        and processes it through the application.
+        Updates decoded with `decode_update` are processed directly; `TelegramUpdate`
+        schemas are first converted to the format expected by python-telegram-bot.
         
         Args:
-            update (TelegramUpdate): The incoming update from Telegram
+            update (Update | TelegramUpdate): The incoming update from Telegram
             
         Returns:
             CommandResponse: The response indicating the status of the update processing
         """
         try:
-            # Convert the update to a format that python-telegram-bot can handle
-            update_dict = update.model_dump()
-            
-            # Ensure the update has the correct structure for python-telegram-bot
-            if update.callback_query:
-                # Convert our CallbackQuery to the format expected by python-telegram-bot
-                callback_query = update.callback_query.model_dump()
-                callback_query["from"] = callback_query.pop("from_user")
-                update_dict["callback_query"] = callback_query
-            elif update.message:
-                # Convert our Message to the format expected by python-telegram-bot
-                message = update.message.model_dump()
-                message["from"] = message.pop("from_user")
-                update_dict["message"] = message
-            
-            telegram_update = Update.de_json(update_dict, self.bot)
+            if isinstance(update, TelegramUpdate):
+                update = self.to_telegram_update(update)
             
             # Process the update through the application
-            await self.application.process_update(telegram_update)
-            
-            # Get chat_id from either message or callback_query
-            chat_id = None
-            if update.message:
-                chat_id = update.message.chat.id
-            elif update.callback_query and update.callback_query.message:
-                chat_id = update.callback_query.message.chat.id
+            await self.application.process_update(update)
             
+            chat = update.effective_chat
             return CommandResponse(
                 status="success",
                 details={"message": "Update processed successfully"},
-                chat_id=chat_id
+                chat_id=chat.id if chat else None
             )
 
         except Exception as e:
@@ -354,16 +545,21 @@ class TelegramService:
     async def get_or_create_user_by_telegram_id(tg_id: int, first_name: str = "", username: str = ""):
         """Get or create a user based on their Telegram ID.
         
+        Users in the identity cache are returned without querying the database.
+        
         Args:
             tg_id (int): The Telegram user ID
             first_name (str, optional): The user's first name
             username (str, optional): The user's username
             
         Returns:
-            User: The user object
+            CachedUser: The user's cached record
         """
+        cached = identity_cache.peek(tg_id)
+        if cached is not None:
+            return cached
         user, _ = await User.objects.aget_or_create(
             telegram_id=tg_id,
             defaults={"first_name": first_name, "username": username, "is_telegram_user": True}
         )
-        return user
+        return identity_cache.add(user)
@@ -0,0 +1,945 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
+import httpx
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from telegram import Bot, InlineKeyboardMarkup
+from core import rollups
+from core.models import Broadcast, Budget, Category, Currency, ExchangeRate, Expense, Income, MonthlyRollup, RecurringRule
+from core.reference import currency_cache, exchange_rate_cache
+from api.logs import JsonFormatter, PayloadSampler, redact
+from api.routers.finance import list_currencies
+from api.services import history, search
+from api.services.bot_request import MeteredHTTPXRequest
+from api.services.broadcast import BroadcastRunner, Notifier, TokenBucket
+from api.services.bulk import BulkUpdateIngestor
+from api.services.categories import category_resolver
+from api.services.dedup import DatabaseDedupBackend, UpdateDeduplicator
+from api.services.dispatcher import UpdateDispatcher
+from api.services.export import ExportBusy, ExportPool, export_chunks, stream_export
+from api.services.finance import FinanceService
+from api.services.identity import UserIdentityCache, identity_cache
+from api.services.inline_reply import InlineReplyBot, capture_inline_reply
+from api.services.menu import MenuService
+from api.services.menu_registry import menus
+from api.services.scheduler import RecurringScheduler, recurring_scheduler
+from api.services.statement_import import StatementImporter, iter_statement_records
+from api.services.telegram import TelegramService
+
+class UpdateDispatcherTest(SimpleTestCase):
+    async def test_updates_for_same_key_stay_in_order(self):
+        handled = []
+
+        async def handler(item):
+            key, seq = item
+            # Later updates finish faster, so only the per-key queue keeps them ordered
+            await asyncio.sleep(0.01 * (5 - seq))
+            handled.append(item)
+
+        dispatcher = UpdateDispatcher(handler, workers=4, queue_size=10)
+        await dispatcher.start()
+        for seq in range(5):
+            for key in (1, 2, 3):
+                dispatcher.submit_nowait(key, (key, seq))
+        await dispatcher.stop()
+
+        for key in (1, 2, 3):
+            self.assertEqual([seq for k, seq in handled if k == key], list(range(5)))
+        self.assertEqual(dispatcher.stats()["processed"], 15)
+
+    async def test_full_shard_rejects(self):
+        async def handler(item):
+            await asyncio.sleep(1)
+
+        dispatcher = UpdateDispatcher(handler, workers=1, queue_size=1)
+        await dispatcher.start()
+        dispatcher.submit_nowait(1, "a")
+        await asyncio.sleep(0)  # let the worker pick up "a"
+        dispatcher.submit_nowait(1, "b")
+        with self.assertRaises(asyncio.QueueFull):
+            dispatcher.submit_nowait(1, "c")
+        self.assertEqual(dispatcher.stats()["rejected"], 1)
+        await dispatcher.stop(timeout=0)
+
+class DecodeUpdateTest(SimpleTestCase):
+    def setUp(self):
+        self.service = TelegramService(token="123456:TEST")
+
+    def test_decodes_update_types_missing_from_schemas(self):
+        body = json.dumps({
+            "update_id": 7,
+            "edited_message": {
+                "message_id": 1,
+                "from": {"id": 99, "is_bot": False, "first_name": "Ada"},
+                "chat": {"id": 99, "type": "private"},
+                "date": 1735689600,
+                "edit_date": 1735689700,
+                "text": "edited",
+            },
+        }).encode()
+
+        update = self.service.decode_update(body)
+
+        self.assertEqual(update.update_id, 7)
+        self.assertEqual(update.edited_message.text, "edited")
+        self.assertEqual(update.effective_user.id, 99)
+
+    def test_rejects_invalid_bodies(self):
+        for body in (b"{}", b"not json", b'{"update_id": 1, "message": 5}', b'{"update_id": 1, "message": {}}'):
+            with self.assertRaises(ValueError):
+                self.service.decode_update(body)
+
+class UpdateDeduplicatorTest(TestCase):
+    def test_window_drops_duplicates_and_evicts_oldest(self):
+        dedup = UpdateDeduplicator(window=3)
+        self.assertFalse(any(dedup.seen(update_id) for update_id in (1, 2, 3)))
+        self.assertTrue(dedup.seen(2))
+        self.assertFalse(dedup.seen(4))  # evicts 1
+        self.assertFalse(dedup.seen(1))
+        dedup.forget(1)
+        self.assertFalse(dedup.seen(1))
+        self.assertEqual(dedup.stats()["duplicates_dropped"], 1)
+
+    async def test_persistent_window_survives_restart(self):
+        dedup = UpdateDeduplicator(window=2, backend=DatabaseDedupBackend())
+        await dedup.start()
+        for update_id in (10, 11, 12):
+            dedup.seen(update_id)
+        await dedup.stop()
+
+        restarted = UpdateDeduplicator(window=2, backend=DatabaseDedupBackend())
+        await restarted.start()
+        self.assertTrue(restarted.seen(12))
+        self.assertTrue(restarted.seen(11))
+        self.assertFalse(restarted.seen(10))
+        await restarted.stop()
+
+class BulkUpdateIngestorTest(SimpleTestCase):
+    async def test_streams_results_in_per_user_order(self):
+        processed = []
+
+        class RecordingService(TelegramService):
+            async def process_update(self, update):
+                await asyncio.sleep(0.001 * (update.update_id % 3))
+                processed.append((update.effective_user.id, update.update_id))
+
+        def line(update_id, user_id):
+            return json.dumps({
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "from": {"id": user_id, "is_bot": False, "first_name": "Ada"},
+                    "chat": {"id": user_id, "type": "private"},
+                    "date": 1735689600,
+                    "text": "hi",
+                },
+            }).encode() + b"\n"
+
+        async def body():
+            payload = b"".join(line(update_id, 100 + update_id % 2) for update_id in range(1, 11))
+            payload += b"not json\n" + line(3, 101)
+            # Deliver in small chunks that split lines
+            for i in range(0, len(payload), 37):
+                yield payload[i:i + 37]
+
+        ingestor = BulkUpdateIngestor(RecordingService(token="123456:TEST"), UpdateDeduplicator(window=100), concurrency=2)
+        results = [result async for result in ingestor.run(body())]
+
+        self.assertEqual(sum(r["status"] == "success" for r in results), 10)
+        self.assertEqual([r for r in results if r["status"] == "error"][0]["line"], 11)
+        self.assertEqual([r for r in results if r["status"] == "duplicate"][0]["update_id"], 3)
+        for user_id in (100, 101):
+            ids = [update_id for uid, update_id in processed if uid == user_id]
+            self.assertEqual(ids, sorted(ids))
+
+class StructuredLoggingTest(SimpleTestCase):
+    def test_json_lines_include_extra_fields(self):
+        record = logging.makeLogRecord({
+            "name": "api", "levelname": "INFO", "msg": "Received %s", "args": ("update",),
+            "update_id": 42,
+        })
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["msg"], "Received update")
+        self.assertEqual(entry["update_id"], 42)
+
+    def test_redacts_names_and_samples_one_in_n(self):
+        payload = {"message": {"from": {"id": 1, "first_name": "Ada", "username": "ada"}, "text": "hi"}}
+        self.assertEqual(
+            redact(payload),
+            {"message": {"from": {"id": 1, "first_name": "***", "username": "***"}, "text": "hi"}},
+        )
+        self.assertEqual(payload["message"]["from"]["first_name"], "Ada")
+
+        sampler = PayloadSampler(3)
+        self.assertEqual([sampler.sample() for _ in range(6)], [True, False, False, True, False, False])
+        self.assertFalse(PayloadSampler(0).sample())
+
+class InlineReplyTest(SimpleTestCase):
+    async def test_last_call_is_returned_and_earlier_ones_sent(self):
+        sent = []
+
+        async def do_post(bot, endpoint, data, **kwargs):
+            sent.append(endpoint)
+            return True
+
+        bot = InlineReplyBot(token="123456:TEST")
+        message, keyboard = MenuService.get_income_menu()
+        with mock.patch.object(Bot, "_do_post", do_post):
+            with capture_inline_reply() as capture:
+                self.assertTrue(await bot.answer_callback_query("cb-1"))
+                self.assertTrue(await bot.edit_message_text(message, chat_id=1, message_id=2, reply_markup=keyboard))
+            # Outside the capture, calls go out directly
+            await bot.answer_callback_query("cb-2")
+
+        reply = capture.to_response()
+        self.assertEqual(sent, ["answerCallbackQuery", "answerCallbackQuery"])
+        self.assertEqual(reply["method"], "editMessageText")
+        self.assertEqual(reply["text"], message)
+        self.assertEqual(reply["reply_markup"], keyboard.to_dict())
+        json.dumps(reply)
+
+    async def test_held_call_keeps_its_timeouts_when_sent(self):
+        sent = []
+
+        async def do_post(bot, endpoint, data, **kwargs):
+            sent.append((endpoint, kwargs["read_timeout"]))
+            return True
+
+        bot = InlineReplyBot(token="123456:TEST")
+        with mock.patch.object(Bot, "_do_post", do_post):
+            with capture_inline_reply():
+                await bot.edit_message_text("Saved", chat_id=1, message_id=2, read_timeout=30)
+                await bot.send_message(1, "Done")
+        self.assertEqual(sent[0], ("editMessageText", 30))
+
+class MenuRegistryTest(SimpleTestCase):
+    def test_compiled_menus_serialize_like_their_buttons(self):
+        for menu in menus.values():
+            self.assertEqual(menu.markup.to_dict(), InlineKeyboardMarkup(menu.markup.inline_keyboard).to_dict())
+        self.assertIs(MenuService.get_main_menu()[1], MenuService.get_main_menu()[1])
+
+        message, keyboard = MenuService.get_description_input_message('Eat "out" {now}', 12.5, "expense")
+        self.assertEqual(message, 'Enter a description for 12.5 Eat "out" {now} expense (or skip):')
+        self.assertEqual(keyboard.inline_keyboard[0][0].callback_data, 'skip_description_expense_12_5_Eat "out" {now}')
+        self.assertEqual(keyboard.to_json(), InlineKeyboardMarkup(keyboard.inline_keyboard).to_json())
+        self.assertIs(MenuService.get_amount_input_message("food", "income")[1],
+                      MenuService.get_amount_input_message("food", "income")[1])
+
+    async def test_bot_sends_the_stored_json(self):
+        sent = []
+
+        async def do_post(bot, endpoint, data, **kwargs):
+            sent.append(data)
+            return True
+
+        message, keyboard = MenuService.get_settings_menu()
+        with mock.patch.object(Bot, "_do_post", do_post):
+            await InlineReplyBot(token="123456:TEST").send_message(1, message, reply_markup=keyboard)
+        self.assertIs(sent[0]["reply_markup"], keyboard.to_json())
+
+class UserIdentityCacheTest(TestCase):
+    def setUp(self):
+        identity_cache.clear()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+
+    def test_warm_lookups_skip_the_database(self):
+        get_user_id = async_to_sync(identity_cache.get_user_id)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_id(555), self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_id(555), self.user.pk)
+
+    async def test_save_and_delete_invalidate(self):
+        await identity_cache.get(555)
+        self.user.telegram_id = 556
+        await self.user.asave()
+        with self.assertRaises(get_user_model().DoesNotExist):
+            await identity_cache.get(555)
+        self.assertEqual((await identity_cache.get(556)).id, self.user.pk)
+        await self.user.adelete()
+        with self.assertRaises(get_user_model().DoesNotExist):
+            await identity_cache.get(556)
+
+    def test_command_handlers_resolve_users_from_the_cache(self):
+        get_or_create = async_to_sync(TelegramService.get_or_create_user_by_telegram_id)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_or_create(555).pk, self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_or_create(555).pk, self.user.pk)
+        self.assertEqual(identity_cache._keys, {self.user.pk: 555})
+
+        # Evicted entries are forgotten in the reverse map too
+        small = UserIdentityCache(maxsize=1)
+        other = get_user_model().objects.create(username="bob", telegram_id=777)
+        small.add(self.user)
+        small.add(other)
+        self.assertEqual(small._keys, {other.pk: 777})
+        other.telegram_id = 778
+        small.invalidate(other)
+        self.assertEqual((small._keys, len(small._cache)), ({}, 0))
+
+
+class CategoryResolverTest(TestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+
+    def test_upsert_creates_once_then_serves_from_cache(self):
+        resolve = async_to_sync(category_resolver.resolve)
+        with self.assertNumQueries(1):
+            created_id = resolve(self.user.pk, "Food")
+        category_resolver.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve(self.user.pk, "Food"), created_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve(self.user.pk, "Food"), created_id)
+        self.assertEqual(Category.objects.filter(user=self.user, name="Food").count(), 1)
+
+    def test_create_paths_share_categories(self):
+        record = {"amount": 10, "category_name": "Misc", "description": ""}
+        income = async_to_sync(FinanceService.create_income)(record, self.user.pk)
+        expense = async_to_sync(FinanceService.create_expense)(record, self.user.pk)
+        self.assertEqual((income.status, expense.status), ("success", "success"))
+        category = Category.objects.get(user=self.user, name="Misc")
+        self.assertEqual(Income.objects.get().category, category)
+        self.assertEqual(Expense.objects.get().category, category)
+
+    async def test_rename_and_delete_invalidate(self):
+        category_id = await category_resolver.resolve(self.user.pk, "Rent")
+        category = await Category.objects.aget(pk=category_id)
+        category.name = "Housing"
+        await category.asave()
+        self.assertNotEqual(await category_resolver.resolve(self.user.pk, "Rent"), category_id)
+        await category.adelete()
+        self.assertNotEqual(await category_resolver.resolve(self.user.pk, "Housing"), category_id)
+
+
+class BulkCreateTransactionsTest(TestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+        Currency.objects.create(code="EUR", name="Euro", symbol="€")
+
+    def bulk_create(self, records, chunk_size=None):
+        return async_to_sync(FinanceService.bulk_create_transactions)(self.user, records, chunk_size)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def records(count, prefix):
+            return [
+                {"type": ("income", "expense")[i % 2], "amount": i + 1, "category_name": f"{prefix}{i % 5}"}
+                for i in range(count)
+            ]
+
+        self.bulk_create(records(1, "warm"))
+        # One of them moves the budget counters of this month's expenses
+        with self.assertNumQueries(7):
+            self.bulk_create(records(10, "a"))
+        with self.assertNumQueries(7):
+            self.bulk_create(records(200, "b"))
+        with self.assertNumQueries(10):
+            self.bulk_create(records(200, "c"), chunk_size=50)
+        self.assertEqual(Income.objects.count() + Expense.objects.count(), 411)
+
+    def test_per_record_results(self):
+        results = self.bulk_create([
+            {"type": "expense", "amount": "12.50", "category_name": "Food", "currency": "eur",
+             "date": "2025-03-01T12:00:00"},
+            {"type": "expense", "amount": -1, "category_name": "Food"},
+            {"type": "transfer", "amount": 1, "category_name": "Food"},
+            {"type": "income", "amount": 100, "category_name": "Salary", "currency": "XXX"},
+            {"type": "income", "category_name": "Salary"},
+        ])
+        self.assertEqual([r["status"] for r in results], ["success"] + ["error"] * 4)
+        expense = Expense.objects.get(pk=results[0]["id"])
+        self.assertEqual((expense.currency.code, expense.category.name, expense.date.day), ("EUR", "Food", 1))
+        self.assertIn("amount", results[4]["detail"])
+
+
+STATEMENT_CSV = """Transaction Date,Details,Money Out,Money In
+01/03/2025,Coffee,"3,50",
+01/03/2025,Coffee,3.50,
+02/03/2025,Salary,,"2,000.00"
+not a date,Broken,1.00,
+"""
+
+
+class StatementImportTest(TestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+
+    def test_parses_debit_credit_columns(self):
+        rows = list(iter_statement_records(STATEMENT_CSV.splitlines(keepends=True)))
+        records = [record for _, record, _ in rows if record]
+        self.assertEqual([(r["type"], str(r["amount"])) for r in records],
+                         [("expense", "3.50"), ("expense", "3.50"), ("income", "2000.00")])
+        # Identical rows are told apart by their position among duplicates
+        self.assertNotEqual(records[0]["import_hash"], records[1]["import_hash"])
+        self.assertEqual(rows[3][0], 5)
+        self.assertIn("not a date", rows[3][2])
+
+    def test_reimport_skips_stored_rows(self):
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as statement:
+            statement.write(STATEMENT_CSV)
+        self.addCleanup(os.unlink, path)
+        importer = StatementImporter(chunk_size=2)
+        reports = []
+
+        first = importer.run(path, self.user.pk, reports.append)
+        self.assertEqual((first["rows"], first["imported"], first["duplicates"], first["failed"]), (4, 3, 0, 1))
+        self.assertEqual(len(reports), 1)
+        second = importer.run(path, self.user.pk)
+        self.assertEqual((second["imported"], second["duplicates"]), (0, 3))
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Income.objects.get(user=self.user).category.name, "Imported")
+
+    async def test_failed_downloads_do_not_log_the_bot_token(self):
+        file_path = "https://api.telegram.org/file/bot123:SECRET-TOKEN/documents/file_0.csv"
+        bot = mock.AsyncMock()
+        bot.get_file.return_value = mock.Mock(file_path=file_path)
+        bot.send_message.return_value = mock.Mock(message_id=1)
+        document = mock.Mock(file_id="file", file_size=100)
+        client = httpx.AsyncClient
+
+        def not_found(request):
+            return httpx.Response(404, request=request)
+
+        def unreachable(request):
+            raise httpx.ConnectError(f"Cannot connect to {request.url}", request=request)
+
+        for handler in (not_found, unreachable):
+            transport = httpx.MockTransport(handler)
+            with mock.patch("httpx.AsyncClient", lambda **kwargs: client(transport=transport, **kwargs)):
+                with self.assertLogs("api.services.statement_import", logging.ERROR) as logs:
+                    self.assertIsNone(await StatementImporter().import_document(bot, document, self.user.pk, 555))
+            logged = "".join(JsonFormatter().format(record) for record in logs.records)
+            self.assertIn("Statement download failed", logged)
+            self.assertNotIn("SECRET-TOKEN", logged)
+
+
+class TransactionExportTest(TransactionTestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+        async_to_sync(FinanceService.bulk_create_transactions)(self.user, [
+            {"type": "expense", "amount": "3.50", "category_name": "Food", "description": "Coffee, large",
+             "date": "2025-03-02T08:00:00+00:00"},
+            {"type": "income", "amount": 100, "category_name": "Salary", "date": "2025-03-01T09:00:00+00:00"},
+        ])
+
+    def test_csv_export_in_date_order(self):
+        data = b"".join(export_chunks(self.user.pk, "csv", chunk_size=1)).decode()
+        self.assertEqual(data.splitlines(), [
+            "type,date,amount,currency,category,description",
+            "income,2025-03-01T09:00:00,100.00,USD,Salary,",
+            'expense,2025-03-02T08:00:00,3.50,USD,Food,"Coffee, large"',
+        ])
+
+    async def test_streams_gzipped_jsonl(self):
+        chunks = [chunk async for chunk in stream_export(self.user.pk, "jsonl", compress=True, chunk_size=1)]
+        rows = [json.loads(line) for line in gzip.decompress(b"".join(chunks)).splitlines()]
+        self.assertEqual([(row["type"], row["amount"]) for row in rows], [("income", "100.00"), ("expense", "3.50")])
+
+    async def test_full_pool_rejects_exports(self):
+        pool = ExportPool(workers=1, queue_size=0)
+        pool.reserve()
+        with self.assertRaises(ExportBusy):
+            await anext(stream_export(self.user.pk, pool=pool))
+        self.assertEqual(pool.rejected, 1)
+        pool.release()
+        # Slots are freed when exports finish
+        for _ in range(2):
+            self.assertEqual(len([chunk async for chunk in stream_export(self.user.pk, chunk_size=1, pool=pool)]), 1)
+
+
+class CurrencyListTest(TestCase):
+    async def test_lists_currencies_by_code(self):
+        currency_cache.invalidate()
+        await Currency.objects.acreate(code="USD", name="US Dollar", symbol="$", is_default=True)
+        await Currency.objects.acreate(code="EUR", name="Euro", symbol="€")
+        self.assertEqual(await list_currencies(), [
+            {"code": "EUR", "name": "Euro", "symbol": "€", "is_default": False},
+            {"code": "USD", "name": "US Dollar", "symbol": "$", "is_default": True},
+        ])
+
+
+class SummaryTest(TestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+        async_to_sync(FinanceService.bulk_create_transactions)(self.user, [
+            {"type": "income", "amount": 1000, "category_name": "Salary", "date": "2025-03-01T09:00:00"},
+            {"type": "expense", "amount": 40, "category_name": "Food", "date": "2025-03-31T23:00:00"},
+            {"type": "expense", "amount": 60, "category_name": "Food", "date": "2025-03-05T12:00:00"},
+            {"type": "expense", "amount": 500, "category_name": "Rent", "date": "2025-02-01T12:00:00"},
+            {"type": "expense", "amount": 25, "category_name": "Food", "date": "2025-01-15T12:00:00"},
+            {"type": "expense", "amount": 99, "category_name": "Food", "date": "2024-12-31T12:00:00"},
+            {"type": "expense", "amount": 7, "category_name": "Food", "date": "2025-04-01T00:00:00"},
+        ])
+
+    def test_periods_are_read_from_rollups_in_one_query(self):
+        with self.assertNumQueries(1):
+            summary = async_to_sync(FinanceService.get_summary)(self.user.pk, today=date(2025, 3, 20))
+        this_month, last_month, year_to_date = summary["periods"]
+        self.assertEqual(this_month["totals"]["USD"]["net"], Decimal("900.00"))
+        self.assertEqual(this_month["categories"][1], {
+            "kind": "expense", "category": "Food", "currency": "USD", "total": Decimal("100.00")
+        })
+        self.assertEqual(last_month["totals"]["USD"]["expense"], Decimal("500.00"))
+        self.assertEqual(year_to_date["totals"]["USD"]["expense"], Decimal("625.00"))
+
+        message, _ = MenuService.get_summary_message(summary)
+        self.assertIn("Net: $900.00", message)
+        self.assertIn("Net: $375.00", message)
+        self.assertIsNone(this_month["converted"])
+
+    def test_report_from_analytics_snapshot(self):
+        exchange_rate_cache.invalidate()
+        with tempfile.TemporaryDirectory() as directory, override_settings(ANALYTICS_CACHE_DIR=directory):
+            report = async_to_sync(FinanceService.get_report)(self.user.pk, today=date(2025, 3, 20))
+        self.assertEqual(report["months"][-1], {
+            "month": date(2025, 3, 1), "income": Decimal("1000.00"), "expense": Decimal("100.00")
+        })
+        self.assertEqual([entry["category"] for entry in report["categories"]], ["Rent", "Food"])
+        self.assertEqual(report["forecast"]["spent"], Decimal("60.00"))
+
+        message, _ = MenuService.get_report_message(report)
+        self.assertIn("Mar 2025: spent $100.00, earned $1,000.00", message)
+        self.assertIn("Rent: 80%", message)
+
+    def test_mixed_currencies_are_converted_to_the_default(self):
+        exchange_rate_cache.invalidate()
+        eur = Currency.objects.create(code="EUR", name="Euro", symbol="€")
+        Currency.objects.create(code="GBP", name="British Pound", symbol="£")
+        usd = Currency.objects.get(code="USD")
+        currency_cache.invalidate()
+        ExchangeRate.objects.bulk_create([
+            ExchangeRate(base=eur, quote=usd, date=date(2025, 2, 1), rate=Decimal("1.05")),
+            ExchangeRate(base=eur, quote=usd, date=date(2025, 3, 10), rate=Decimal("1.10")),
+        ])
+        async_to_sync(FinanceService.bulk_create_transactions)(self.user, [
+            {"type": "expense", "amount": 100, "category_name": "Travel", "currency": "EUR", "date": "2025-03-02T09:00:00"},
+            {"type": "expense", "amount": 100, "category_name": "Travel", "currency": "EUR", "date": "2025-02-02T09:00:00"},
+            {"type": "expense", "amount": 10, "category_name": "Travel", "currency": "GBP", "date": "2025-03-02T09:00:00"},
+        ])
+
+        summary = async_to_sync(FinanceService.get_summary)(self.user.pk, today=date(2025, 3, 20))
+        this_month, last_month, _ = summary["periods"]
+        # The current month at today's rate, last month at its closing rate
+        self.assertEqual(this_month["converted"]["net"], Decimal("900.00") - Decimal("110.00"))
+        self.assertEqual(this_month["converted"]["missing"], ["GBP"])
+        self.assertEqual(last_month["converted"]["expense"], Decimal("605.00"))
+        message, _ = MenuService.get_summary_message(summary)
+        self.assertIn("Net in USD: $790.00 (no rate for GBP)", message)
+
+
+class MonthlyRollupTest(TestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+
+    def test_every_write_path_keeps_rollups_in_step(self):
+        record = {"amount": 10.005, "category_name": "Food", "description": ""}
+        async_to_sync(FinanceService.create_expense)(record, self.user.pk)
+        async_to_sync(FinanceService.create_expense)(record, self.user.pk)
+        async_to_sync(FinanceService.create_income)(dict(record, amount=50), self.user.pk)
+        async_to_sync(FinanceService.bulk_create_transactions)(self.user, [
+            {"type": "expense", "amount": 5, "category_name": "Rent", "date": "2024-01-10T00:00:00"},
+        ])
+        self.assertEqual(rollups.verify(), [])
+
+        expense = Expense.objects.filter(category__name="Food").first()
+        update = async_to_sync(FinanceService.update_transaction)
+        self.assertEqual(update("expense", expense.pk, self.user.pk, {"amount": 7, "category_name": "Bills"}).status, "success")
+        self.assertEqual(rollups.verify(), [])
+        for amount in ("abc", None, "NaN", -3):
+            response = update("expense", expense.pk, self.user.pk, {"amount": amount})
+            self.assertEqual((response.status, response.details["message"]), ("error", "❌ Amount must be a positive number."))
+        delete = async_to_sync(FinanceService.delete_transaction)
+        self.assertEqual(delete("expense", expense.pk, self.user.pk).status, "success")
+        self.assertEqual(delete("expense", expense.pk, self.user.pk).status, "error")
+        self.assertEqual(rollups.verify(), [])
+        # The emptied bucket is removed
+        self.assertFalse(MonthlyRollup.objects.filter(category__name="Bills").exists())
+        self.assertEqual(MonthlyRollup.objects.get(kind="expense", category__name="Food").total, Decimal("10.01"))
+
+
+class BudgetTest(TestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        identity_cache.clear()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+
+    def spend(self, amount, category="Food"):
+        record = {"amount": amount, "category_name": category, "description": ""}
+        response = async_to_sync(FinanceService.create_expense)(record, self.user.pk)
+        self.assertEqual(response.status, "success")
+        return response.details["budget_alerts"]
+
+    def test_set_budget_counts_spend_so_far_without_alerting(self):
+        self.spend(90)
+        response = async_to_sync(FinanceService.handle_budget_command)(["Food", "100"], 555)
+        self.assertEqual(response.status, "success")
+        self.assertEqual(response.details["budgets"][0]["spent"], Decimal("90"))
+        self.assertIn("Food: $90.00 of $100.00 (90%)", response.details["message"])
+        for invalid in ("Infinity", "NaN", "-5"):
+            response = async_to_sync(FinanceService.handle_budget_command)(["Food", invalid], 555)
+            self.assertEqual(response.status, "error")
+            self.assertIn("Usage", response.details["message"])
+        self.assertEqual(self.spend(5), [])
+        self.assertEqual([alert["threshold"] for alert in self.spend(5)], [100])
+
+    def test_alerts_once_per_threshold(self):
+        async_to_sync(FinanceService.set_budget)(self.user.pk, "Food", 100)
+        self.assertEqual(self.spend(50), [])
+        alerts = self.spend(35)
+        self.assertEqual([(alert["category"], alert["spent"], alert["threshold"]) for alert in alerts],
+                         [("Food", Decimal("85.00"), 80)])
+        self.assertEqual(self.spend(10), [])
+        self.assertEqual(self.spend(3, category="Rent"), [])
+        self.assertEqual([alert["threshold"] for alert in self.spend(10)], [100])
+        self.assertEqual(self.spend(10), [])
+        self.assertIn("🚨", MenuService.get_budget_alert_message(alerts[0] | {"threshold": 100}))
+
+    def test_counter_restarts_in_a_new_month(self):
+        async_to_sync(FinanceService.set_budget)(self.user.pk, "Food", 100)
+        self.spend(90)
+        Budget.objects.update(month=date(2020, 1, 1))
+        self.assertEqual(async_to_sync(FinanceService.get_budgets)(self.user.pk)[0]["spent"], 0)
+        self.assertEqual(self.spend(20), [])
+        self.assertEqual(Budget.objects.get().spent, Decimal("20.00"))
+
+    def test_write_path_adds_one_budget_statement(self):
+        async_to_sync(FinanceService.set_budget)(self.user.pk, "Food", 100)
+        self.spend(1)
+        self.spend(1, category="Rent")
+        for category in ("Food", "Rent"):
+            with CaptureQueriesContext(connection) as queries:
+                self.spend(1, category=category)
+            budget_statements = [query["sql"] for query in queries if "core_budget" in query["sql"]]
+            self.assertEqual(len(budget_statements), 1)
+            self.assertTrue(budget_statements[0].lstrip().startswith("WITH"))
+        self.assertEqual(Budget.objects.get().spent, Decimal("2.00"))
+
+
+class HistoryTest(TestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+        # Several rows share a date, so pages must break ties on id
+        async_to_sync(FinanceService.bulk_create_transactions)(self.user, [
+            {"type": ("income", "expense")[i % 2], "amount": i + 1, "category_name": "Misc",
+             "date": f"2024-0{1 + i // 10}-{1 + i % 7:02d}T12:00:00"}
+            for i in range(25)
+        ])
+        self.expected = list(self.user.transactions.order_by("-date", "-id").values_list("id", flat=True))
+
+    def get_page(self, cursor=None, direction="o"):
+        with self.assertNumQueries(1):
+            return history.history_page(self.user.pk, cursor, direction, page_size=10)
+
+    def test_pages_cover_every_row_once_in_both_directions(self):
+        pages = [self.get_page()]
+        while pages[-1]["older"]:
+            pages.append(self.get_page(pages[-1]["older"]))
+        self.assertEqual([len(page["rows"]) for page in pages], [10, 10, 5])
+        self.assertEqual([row["id"] for page in pages for row in page["rows"]], self.expected)
+        self.assertIsNone(pages[0]["newer"])
+
+        back = self.get_page(pages[-1]["newer"], "n")
+        self.assertEqual(back["rows"], pages[1]["rows"])
+        self.assertEqual((back["older"], back["newer"]), (pages[1]["older"], pages[1]["newer"]))
+
+    def test_cursor_fits_in_callback_data(self):
+        date, pk = datetime(2024, 2, 29, 23, 59, 59, 999999), 2 ** 40
+        self.assertEqual(history.decode_cursor(history.encode_cursor(date, pk)), (date, pk))
+        _, keyboard = MenuService.get_history_message(self.get_page(history.encode_cursor(date, pk)))
+        for button in keyboard.inline_keyboard[0]:
+            self.assertLessEqual(len(button.callback_data.encode()), 64)
+        with self.assertRaises(ValueError):
+            history.decode_cursor("not-a-cursor")
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        other = get_user_model().objects.create(username="bob", telegram_id=556)
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+        bulk_create = async_to_sync(FinanceService.bulk_create_transactions)
+        bulk_create(self.user, [
+            {"type": "expense", "amount": 1, "category_name": "Food", "description": description}
+            for description in ("Weekly groceries", "Groceries and more groceries", "Taxi home", "Coffee", "grocery run")
+        ])
+        bulk_create(other, [{"type": "expense", "amount": 1, "category_name": "Food", "description": "groceries"}])
+
+    def search(self, text, page=0):
+        with self.assertNumQueries(1):
+            return search.search_transactions(self.user.pk, search.normalize_query(text), page, page_size=2)
+
+    def test_prefix_matches_ranked_and_paginated(self):
+        first = self.search("GROC!")
+        self.assertEqual(first["rows"][0]["description"], "Groceries and more groceries")
+        self.assertTrue(first["more"])
+        second = self.search("groc", page=1)
+        self.assertFalse(second["more"])
+        self.assertEqual(
+            sorted(row["description"] for row in first["rows"] + second["rows"]),
+            ["Groceries and more groceries", "Weekly groceries", "grocery run"],
+        )
+        self.assertEqual([row["description"] for row in self.search("taxi ho")["rows"]], ["Taxi home"])
+        self.assertEqual(self.search("tea")["rows"], [])
+
+    def test_query_fits_in_callback_data(self):
+        self.assertIsNone(search.normalize_query("!!! ???"))
+        query = search.normalize_query("é" * 20 + " " + "x" * 40)
+        self.assertEqual(query, "é" * 20)
+        _, keyboard = MenuService.get_search_message(
+            {"query": "w" * search.MAX_QUERY_BYTES, "page": 998, "rows": [], "more": True}
+        )
+        for button in keyboard.inline_keyboard[0]:
+            self.assertLessEqual(len(button.callback_data.encode()), 64)
+
+
+class RecurringTest(TestCase):
+    def setUp(self):
+        category_resolver.clear()
+        currency_cache.invalidate()
+        identity_cache.clear()
+        self.user = get_user_model().objects.create(username="ada", telegram_id=555)
+        self.currency = Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+
+    def test_command_adds_lists_and_stops_rules(self):
+        command = async_to_sync(FinanceService.handle_recurring_command)
+        response = command(["expense", "1200", "Rent", "monthly", "Flat", "rent"], 555)
+        self.assertEqual(response.status, "success")
+        rule = RecurringRule.objects.get()
+        self.assertEqual((rule.category.name, rule.description, rule.frequency), ("Rent", "Flat rent", "monthly"))
+        self.assertGreater(rule.next_run, datetime.now() + timedelta(days=27))
+        self.assertIn(f"#{rule.pk} -$1,200.00 Rent (monthly)", response.details["message"])
+        self.assertNotIn(rule.pk, recurring_scheduler._next)  # Its loop does not run in tests
+
+        response = command(["income", "50", "Interest", "cron", "0", "9", "1", "*", "*"], 555)
+        self.assertEqual({rule["schedule"] for rule in response.details["rules"]}, {"monthly", "0 9 1 * *"})
+        for invalid in (["expense", "x", "Rent", "monthly"], ["expense", "Infinity", "Rent", "monthly"],
+                        ["expense", "5", "Rent"], ["expense", "5", "Rent", "cron", "0", "9"]):
+            self.assertEqual(command(invalid, 555).status, "error")
+
+        response = command(["stop", str(rule.pk)], 555)
+        self.assertIn(f"Stopped rule {rule.pk}", response.details["message"])
+        self.assertEqual(len(response.details["rules"]), 1)
+        self.assertNotIn(rule.pk, recurring_scheduler._next)
+        self.assertIn("no active rule", command(["stop", str(rule.pk)], 555).details["message"])
+
+    async def test_rules_are_scheduled_only_where_the_loop_runs(self):
+        scheduler = RecurringScheduler()
+        scheduler.schedule(1, datetime(2030, 1, 1))
+        self.assertEqual((scheduler._heap, scheduler._next), ([], {}))
+
+        await scheduler.start()
+        try:
+            scheduler.schedule(1, datetime(2030, 1, 1))
+            self.assertEqual(scheduler._earliest(), datetime(2030, 1, 1))
+        finally:
+            await scheduler.stop()
+
+    def test_scheduler_records_in_batches_and_reschedules(self):
+        now = datetime(2024, 4, 15, 12)
+        rules = [
+            RecurringRule.objects.create(
+                user=self.user, kind="income", amount=Decimal("3000"), currency=self.currency,
+                frequency=RecurringRule.MONTHLY, start=start, next_run=start,
+            )
+            for start in (datetime(2024, 2, 25, 9), datetime(2024, 4, 1, 9), datetime(2024, 5, 1, 9))
+        ]
+        scheduler = RecurringScheduler(batch_size=1)
+        results = []
+
+        async def run():
+            async def on_recorded(result):
+                results.append(result)
+            scheduler.on_recorded = on_recorded
+            await scheduler.refresh()
+            while (earliest := scheduler._earliest()) is not None and earliest <= now:
+                await scheduler.run_due(now)
+
+        async_to_sync(run)()
+        self.assertEqual([result["created"] for result in results], [2, 1])
+        self.assertEqual(Income.objects.count(), 3)
+        self.assertEqual(scheduler.stats()["rules"], 3)
+        self.assertEqual(scheduler._earliest(), datetime(2024, 4, 25, 9))
+        self.assertEqual(
+            MenuService.get_recurring_notice(results[0]["fired"][0]),
+            "🔁 Recorded your recurring Uncategorized income of $3,000.00 (2 missed occurrences). Next on 2024-04-25.",
+        )
+        self.assertEqual(rules[2].next_run, datetime(2024, 5, 1, 9))
+
+
+class FakeBotAPI:
+    """A local stand-in for the Bot API server, for tests that send real requests.
+
+    `sendMessage` answers 403 for chats in `blocked`, and 429 with a one second
+    `retry_after` the first time for chats in `flood`.
+    """
+
+    def __init__(self, blocked=(), flood=()):
+        self.blocked, self.flood = set(blocked), set(flood)
+        self.messages = []  # (monotonic time, chat id, text)
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                params = {key: values[0] for key, values in parse_qs(body).items()}
+                status, payload = fake.handle(self.path.rsplit("/", 1)[-1], params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/bot"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, method, params):
+        if method == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}}
+        chat_id = int(params["chat_id"])
+        with self.lock:
+            if chat_id in self.blocked:
+                return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+            if chat_id in self.flood:
+                self.flood.discard(chat_id)
+                return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                             "parameters": {"retry_after": 1}}
+            self.messages.append((time.monotonic(), chat_id, params["text"]))
+            return 200, {"ok": True, "result": {
+                "message_id": len(self.messages), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": params["text"],
+            }}
+
+
+class BroadcastTest(TestCase):
+    def setUp(self):
+        self.users = [
+            get_user_model().objects.create(username=f"user{i}", telegram_id=1000 + i, is_telegram_user=True)
+            for i in range(8)
+        ]
+        get_user_model().objects.create(username="web")
+
+    def test_token_bucket_reserves_in_order_and_pauses(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0, 0, 0.5, 1.0])
+        now[0] = 2.0
+        self.assertEqual(bucket.reserve(), 0)
+        bucket.pause(3)
+        self.assertEqual(bucket.reserve(), 3.5)
+        self.assertFalse(bucket.idle())
+        now[0] = 10.0
+        self.assertTrue(bucket.idle())
+
+    async def test_fan_out_against_fake_bot_api(self):
+        runner = BroadcastRunner(Notifier(rate=20, concurrency=4), chunk_size=3)
+        broadcast = await runner.create("Hello everyone")
+        started = time.monotonic()
+        with FakeBotAPI(blocked={1003}, flood={1005}) as api:
+            async with Bot("123:abc", base_url=api.base_url) as bot:
+                result = await runner.run(bot, broadcast.pk)
+
+        self.assertEqual((result.status, result.sent, result.blocked, result.failed), ("done", 7, 1, 0))
+        self.assertEqual(result.last_user_id, self.users[-1].pk)
+        self.assertEqual(sorted(chat_id for _, chat_id, _ in api.messages), [1000, 1001, 1002, 1004, 1005, 1006, 1007])
+        # The 429 held every later message back for its retry_after
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+        self.assertEqual(runner.notifier.stats()["throttled"], 1)
+
+    async def test_resumes_after_the_last_recorded_chunk(self):
+        runner = BroadcastRunner(Notifier(rate=100), chunk_size=3, lease=60)
+        broadcast = await runner.create("Hello again")
+        await Broadcast.objects.filter(pk=broadcast.pk).aupdate(
+            status=Broadcast.RUNNING, owner="elsewhere", heartbeat_at=datetime.now(), last_user_id=self.users[4].pk, sent=5
+        )
+        with FakeBotAPI() as api:
+            async with Bot("123:abc", base_url=api.base_url) as bot:
+                # Still leased by a live process
+                self.assertIsNone(await runner.run(bot, broadcast.pk))
+                await Broadcast.objects.filter(pk=broadcast.pk).aupdate(heartbeat_at=datetime.now() - timedelta(minutes=5))
+                result = await runner.run(bot, broadcast.pk)
+                cancelled = await runner.create("Never mind")
+                self.assertTrue(await runner.cancel(cancelled.pk))
+                self.assertIsNone(await runner.run(bot, cancelled.pk))
+
+        self.assertEqual(sorted(chat_id for _, chat_id, _ in api.messages), [1005, 1006, 1007])
+        self.assertEqual((result.status, result.sent, result.owner), ("done", 8, ""))
+
+
+class BotRequestTest(SimpleTestCase):
+    async def test_metrics_record_pool_waits_and_method_latency(self):
+        request = MeteredHTTPXRequest("test", pool_size=2, pool_timeout=5)
+        with FakeBotAPI(blocked={7}) as api:
+            async with Bot("123:abc", base_url=api.base_url, request=request) as bot:
+                results = await asyncio.gather(
+                    *(bot.send_message(chat_id, "Hi") for chat_id in range(1, 9)), return_exceptions=True
+                )
+            # The client is rebuilt, with its metered pool, after a shutdown
+            async with Bot("123:abc", base_url=api.base_url, request=request) as bot:
+                await bot.send_message(1, "Hi again")
+
+        self.assertEqual(sum(isinstance(result, Exception) for result in results), 1)
+        stats = request.metrics.stats()
+        self.assertEqual(stats["methods"]["sendMessage"]["count"], 9)
+        self.assertEqual(stats["methods"]["sendMessage"]["errors"], 1)
+        self.assertEqual(stats["methods"]["getMe"]["count"], 2)
+        self.assertEqual(request.metrics.pool_waits, 11)
+        # More requests were started than the pool has connections; the rest queued
+        self.assertGreater(stats["in_flight_max"], 2)
+        self.assertGreater(stats["pool_wait_max_ms"], 0)
+        self.assertEqual((stats["in_flight"], stats["waiting_for_connection"], stats["pool_timeouts"]), (0, 0, 0))
@@ -0,0 +1,127 @@
+"""Benchmark: per-user analytics from columnar snapshots vs iterating ORM rows.
+
+Runs against a throwaway test database created from the configured one, with
+one user owning every row (two currencies, 15 categories, three years).
+For each size it times:
+
+- orm: monthly expense totals computed by iterating the user's rows through the ORM
+- build: building the snapshot from scratch
+- load: loading an up-to-date snapshot (rollup check and memory mapping)
+- append: loading after 1,000 new rows
+- stats: monthly totals, 30-day moving average, category shares and forecast
+
+Usage:
+    python benchmarks/bench_analytics.py [size ...]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_app.settings")
+import django
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from core import analytics, partitions, rollups
+from core.exchange import ExchangeRates
+from core.models import Category, Currency, Transaction
+
+START = datetime(2023, 1, 1)
+TODAY = date(2025, 12, 20)
+
+
+def make_rows(count: int, user, currencies: list, categories: list, rng: random.Random) -> list:
+    return [
+        Transaction(
+            kind=Transaction.INCOME if rng.random() < 0.1 else Transaction.EXPENSE, user=user,
+            currency=currencies[rng.random() < 0.2], category=rng.choice(categories),
+            amount=rng.randint(1, 50000) / 100, date=START + timedelta(minutes=rng.randint(0, 1576799)),
+        )
+        for _ in range(count)
+    ]
+
+
+def timed(function, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def orm_monthly_totals(user_id: int) -> dict:
+    totals = defaultdict(float)
+    for row in Transaction.objects.filter(user_id=user_id, kind=Transaction.EXPENSE).order_by():
+        totals[(row.date.year, row.date.month)] += float(row.amount)
+    return totals
+
+
+def compute(snapshot, rates, currency_id) -> None:
+    stats = analytics.UserAnalytics(snapshot, rates, currency_id, TODAY)
+    stats.monthly_totals(12)
+    stats.moving_average(30, 90)
+    stats.category_shares(3)
+    stats.forecast()
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000]
+    rng = random.Random(42)
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            store = analytics.SnapshotStore(directory)
+            partitions.ensure_partitions(first=START.date())
+            usd = Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+            eur = Currency.objects.create(code="EUR", name="Euro", symbol="€")
+            rates = ExchangeRates.from_rows(
+                (eur.pk, usd.pk, START.date() + timedelta(days=day), 1 + rng.random() / 10) for day in range(1100)
+            )
+
+            print(f"{'rows':>9} {'orm':>10} {'build':>10} {'load':>10} {'append':>10} {'stats':>10}")
+            for size in sizes:
+                user = get_user_model().objects.create(username=f"user{size}")
+                categories = Category.objects.bulk_create([Category(user=user, name=f"Category {i}") for i in range(15)])
+                for offset in range(0, size, 50000):
+                    Transaction.objects.bulk_create(
+                        make_rows(min(50000, size - offset), user, [usd, eur], categories, rng), batch_size=5000
+                    )
+                rollups.rebuild(user.pk)
+                with connection.cursor() as cursor:
+                    cursor.execute("VACUUM ANALYZE")
+
+                orm = timed(lambda: orm_monthly_totals(user.pk), repeat=1 if size > 100000 else 3)
+
+                def build():
+                    store.discard(user.pk)
+                    store.load(user.pk)
+                built = timed(build, repeat=3)
+                loaded = timed(lambda: store.load(user.pk))
+
+                appends = []
+                for _ in range(3):
+                    Transaction.objects.bulk_create(make_rows(1000, user, [usd, eur], categories, rng))
+                    rollups.rebuild(user.pk)
+                    start = time.perf_counter()
+                    store.load(user.pk)
+                    appends.append((time.perf_counter() - start) * 1000)
+
+                snapshot = store.load(user.pk)
+                computed = timed(lambda: compute(snapshot, rates, usd.pk))
+                print(f"{size:>9} {orm:>8.1f}ms {built:>8.1f}ms {loaded:>8.1f}ms "
+                      f"{statistics.median(appends):>8.1f}ms {computed:>8.1f}ms")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark: rows/second for FinanceService.bulk_create_transactions vs create_expense/create_income.
+
+Runs against a throwaway test database created from the configured one.
+
+Usage:
+    python benchmarks/bench_bulk_create.py [bulk_rows] [single_rows]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_app.settings")
+import django
+django.setup()
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from api.services.finance import FinanceService
+from core.models import Currency
+
+
+def make_records(count: int) -> list:
+    return [
+        {
+            "type": "expense" if i % 3 else "income",
+            "amount": f"{(i % 500) + 1}.25",
+            "category_name": f"Category {i % 20}",
+            "description": f"Imported row {i}",
+        }
+        for i in range(count)
+    ]
+
+
+async def single_path(user_id: int, records: list) -> None:
+    for record in records:
+        create = FinanceService.create_income if record["type"] == "income" else FinanceService.create_expense
+        response = await create(record, user_id)
+        assert response.status == "success", response.details
+
+
+async def bulk_path(user_id: int, records: list) -> None:
+    results = await FinanceService.bulk_create_transactions(user_id, records)
+    assert all(result["status"] == "success" for result in results)
+
+
+def measure(label: str, path, user_id: int, rows: int) -> float:
+    records = make_records(rows)
+    start = time.perf_counter()
+    # async_to_sync keeps the ORM calls on this thread's connection
+    async_to_sync(path)(user_id, records)
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed
+    print(f"{label:<10} {rows:>8} rows  {elapsed:8.3f} s  {rate:>10,.0f} rows/s")
+    return rate
+
+
+def main():
+    bulk_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    single_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+        user = get_user_model().objects.create(username="bench", telegram_id=1)
+
+        single = measure("single", single_path, user.pk, single_rows)
+        bulk = measure("bulk", bulk_path, user.pk, bulk_rows)
+        print(f"speedup    {bulk / single:.1f}x")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
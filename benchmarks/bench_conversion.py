@@ -0,0 +1,71 @@
+"""Benchmark: converting mixed-currency rows with ExchangeRates.convert vs a per-row loop.
+
+Builds two years of daily rates for 15 currencies quoted against EUR (no
+database needed) and converts random rows into USD.
+
+Usage:
+    python benchmarks/bench_conversion.py [rows]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_app.settings")
+import django
+django.setup()
+
+import numpy as np
+from core.exchange import ExchangeRates
+
+CURRENCIES = 15
+EUR, USD = 1, 2
+START = date(2023, 1, 1)
+DAYS = 730
+
+
+def make_rates(rng: random.Random) -> ExchangeRates:
+    rows = []
+    for quote in range(2, CURRENCIES + 1):
+        level = rng.uniform(0.5, 150)
+        for day in range(DAYS):
+            if (START + timedelta(days=day)).weekday() < 5:  # No fixings at weekends
+                rows.append((EUR, quote, START + timedelta(days=day), level * rng.uniform(0.98, 1.02)))
+    return ExchangeRates.from_rows(rows)
+
+
+def timed(function, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(1)
+    rates = make_rates(rng)
+    amounts = [round(rng.uniform(1, 500), 2) for _ in range(rows)]
+    currencies = [rng.randint(1, CURRENCIES) for _ in range(rows)]
+    days = [START + timedelta(days=rng.randrange(DAYS)) for _ in range(rows)]
+    print(f"{len(rates):,} stored rates, {rows:,} rows")
+
+    rates.convert(amounts[:10], currencies[:10], days[:10], USD)  # Derive the cross rates once
+    vectorized = timed(lambda: rates.convert(amounts, currencies, days, USD))
+    arrays = (np.array(amounts), np.array(currencies), np.array(days, dtype="datetime64[D]"))
+    prepared = timed(lambda: rates.convert(*arrays, USD))
+    per_row = timed(lambda: [
+        amount * (rates.rate(currency, USD, day) or float("nan")) for amount, currency, day in zip(amounts, currencies, days)
+    ], repeat=1)
+    print(f"convert (Python lists)   {vectorized * 1000:9.1f} ms")
+    print(f"convert (NumPy arrays)   {prepared * 1000:9.1f} ms")
+    print(f"per-row rate() loop      {per_row * 1000:9.1f} ms  ({per_row / prepared:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Microbenchmark: menu render cost per update, building keyboards per call vs compiled menus.
+
+The old path builds the `InlineKeyboardButton`s of a screen on every call, as
+`MenuService` did before `api.services.menu_registry`; python-telegram-bot
+then serializes them for the request. The new path returns the compiled menu
+(or fills in a prompt template) and sends its stored JSON. Stages:
+
+- render: getting the text and keyboard
+- send: render plus the `reply_markup` request parameter of a normal Bot API call
+- inline: render plus the JSON body of an inline webhook reply
+
+Prompts are cached after their first rendering; "description*" renders a
+prompt without the cache.
+
+Usage:
+    python benchmarks/bench_menus.py [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_app.settings")
+import django
+django.setup()
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.request import RequestData
+from telegram.request._requestparameter import RequestParameter
+from api.services.inline_reply import _json_value, _presend
+from api.services.menu import MenuService
+from api.services.menu_registry import HELP_TEXT, prompts
+
+
+def old_main_menu():
+    keyboard = [
+        [
+            InlineKeyboardButton("➕ Add Income", callback_data="menu_add_income"),
+            InlineKeyboardButton("➖ Add Expense", callback_data="menu_add_expense"),
+        ],
+        [
+            InlineKeyboardButton("📊 View Summary", callback_data="menu_summary"),
+            InlineKeyboardButton("⚙️ Settings", callback_data="menu_settings"),
+        ],
+        [
+            InlineKeyboardButton("📜 History", callback_data="menu_history"),
+            InlineKeyboardButton("❓ Help", callback_data="menu_help"),
+        ],
+    ]
+    return "Welcome to FinanceBot! What would you like to do?", InlineKeyboardMarkup(keyboard)
+
+
+def old_expense_menu():
+    keyboard = [
+        [
+            InlineKeyboardButton("🍔 Food", callback_data="expense_food"),
+            InlineKeyboardButton("🏠 Rent", callback_data="expense_rent"),
+        ],
+        [
+            InlineKeyboardButton("🚌 Transport", callback_data="expense_transport"),
+            InlineKeyboardButton("🛍️ Shopping", callback_data="expense_shopping"),
+        ],
+        [InlineKeyboardButton("➕ Other", callback_data="expense_other")],
+        [InlineKeyboardButton("« Back to Main Menu", callback_data="back_to_main")],
+    ]
+    return "Select expense category:", InlineKeyboardMarkup(keyboard)
+
+
+def old_help_menu():
+    keyboard = [[InlineKeyboardButton("« Back to Main Menu", callback_data="back_to_main")]]
+    return HELP_TEXT, InlineKeyboardMarkup(keyboard)
+
+
+def old_amount_input(category, transaction_type):
+    keyboard = [
+        [InlineKeyboardButton("« Back to Categories", callback_data=f"back_to_amount_{transaction_type}_{category}")],
+    ]
+    return f"Enter the amount for {category} {transaction_type}:", InlineKeyboardMarkup(keyboard)
+
+
+def old_description_input(category, amount, transaction_type):
+    message = f"Enter a description for {amount} {category} {transaction_type} (or skip):"
+    formatted_amount = str(amount).replace('.', '_')
+    keyboard = [
+        [InlineKeyboardButton("Skip Description", callback_data=f"skip_description_{transaction_type}_{formatted_amount}_{category}")],
+        [InlineKeyboardButton("« Back to Amount", callback_data=f"back_to_amount_{transaction_type}_{category}")],
+    ]
+    return message, InlineKeyboardMarkup(keyboard)
+
+
+SCREENS = {
+    "main": (old_main_menu, MenuService.get_main_menu),
+    "expense": (old_expense_menu, MenuService.get_expense_menu),
+    "help": (old_help_menu, MenuService.get_help_menu),
+    "amount": (lambda: old_amount_input("food", "expense"), lambda: MenuService.get_amount_input_message("food", "expense")),
+    "description": (
+        lambda: old_description_input("food", 12.5, "expense"),
+        lambda: MenuService.get_description_input_message("food", 12.5, "expense"),
+    ),
+    # An amount not seen before misses the template's cache
+    "description*": (
+        lambda: old_description_input("food", 12.5, "expense"),
+        lambda: prompts["description"]._render(category="food", amount=12.5, amount_key="12_5", transaction_type="expense"),
+    ),
+}
+
+
+def send(render, presend):
+    """Render and encode the parameters of `editMessageText` as python-telegram-bot does."""
+    text, markup = render()
+    data = presend({"chat_id": 1, "message_id": 2, "text": text, "reply_markup": markup})
+    return RequestData([RequestParameter.from_input(key, value) for key, value in data.items()]).json_parameters
+
+
+def inline(render):
+    """Render and encode the webhook reply body of `editMessageText`."""
+    text, markup = render()
+    data = {"chat_id": 1, "message_id": 2, "text": text, "reply_markup": markup}
+    return json.dumps({"method": "editMessageText", **{key: _json_value(value) for key, value in data.items()}})
+
+
+def per_op(function, iterations: int) -> float:
+    return min(timeit.repeat(function, number=iterations, repeat=5)) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print(f"{'screen':<14}{'stage':<10}{'old (us/op)':>14}{'new (us/op)':>14}{'speedup':>10}")
+    for name, (old_render, new_render) in SCREENS.items():
+        assert old_render()[0] == new_render()[0]
+        assert old_render()[1].to_dict() == new_render()[1].to_dict()
+        assert send(old_render, dict) == send(new_render, _presend)
+        stages = {
+            "render": (old_render, new_render),
+            "send": (lambda: send(old_render, dict), lambda: send(new_render, _presend)),
+            "inline": (lambda: inline(old_render), lambda: inline(new_render)),
+        }
+        for stage, (old_fn, new_fn) in stages.items():
+            old, new = per_op(old_fn, iterations), per_op(new_fn, iterations)
+            print(f"{name:<14}{stage:<10}{old:>14.2f}{new:>14.2f}{old / new:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark: /search latency as the transaction table grows, against a naive `icontains` scan.
+
+Runs against a throwaway test database created from the configured one. The
+table is filled in steps up to each size, spread over 20 users and two years
+of monthly partitions; descriptions are two or three words from a
+vocabulary of 2,000. The searched user owns a twentieth of the rows.
+
+`/search` ranks every match, so its cost follows the number of matches;
+the `icontains` scan returns the newest matches and can stop early for a
+common term, but reads the user's whole history when nothing matches.
+
+Usage:
+    python benchmarks/bench_search.py [size ...]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_app.settings")
+import django
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from api.services import search
+from core import partitions
+from core.models import Currency, Transaction
+
+USERS = 20
+SYLLABLES = ["ka", "lo", "mi", "ne", "pu", "ra", "si", "to", "vu", "ze", "ba", "de", "fi", "go", "hu"]
+START = datetime(2023, 1, 1)
+
+
+def make_rows(count: int, users: list, currency: Currency, vocabulary: list, rng: random.Random) -> list:
+    return [
+        Transaction(
+            kind=Transaction.EXPENSE, user=users[i % len(users)], currency=currency, amount=rng.randint(1, 50000) / 100,
+            date=START + timedelta(minutes=rng.randint(0, 1051199)),
+            description=" ".join(rng.sample(vocabulary, rng.randint(2, 3))),
+        )
+        for i in range(count)
+    ]
+
+
+def timed(function, repeat: int = 15) -> float:
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10000, 100000, 500000]
+    rng = random.Random(42)
+    vocabulary = sorted({"".join(rng.sample(SYLLABLES, 3)) for _ in range(5000)})[:2000]
+    word = vocabulary[100]
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        partitions.ensure_partitions(first=date(2023, 1, 1))
+        currency = Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+        users = [get_user_model().objects.create(username=f"user{i}", telegram_id=i) for i in range(USERS)]
+        user = users[0]
+        query = search.normalize_query(word[:4])
+
+        print(f"{'rows':>10} {'matches':>8} {'/search':>10} {'icontains':>10}   no match: {'/search':>10} {'icontains':>10}")
+        total = 0
+        for size in sorted(sizes):
+            while total < size:
+                batch = min(50000, size - total)
+                Transaction.objects.bulk_create(make_rows(batch, users, currency, vocabulary, rng), batch_size=5000)
+                total += batch
+            with connection.cursor() as cursor:
+                # Also merges the GIN pending lists, as autovacuum would
+                cursor.execute("VACUUM ANALYZE")
+
+            matches = Transaction.objects.filter(user=user, search_vector=search.search_query(user.pk, query)).count()
+            timings = [
+                timed(lambda: search.search_transactions(user.pk, text))
+                for text in (query, "xyz")
+            ] + [
+                # Newest matches first, so the scan can stop after a page; a word nobody used reads every row
+                timed(lambda: list(
+                    Transaction.objects.filter(user=user, description__icontains=text)
+                    .order_by("-date", "-id").values_list("id", "description")[:11]
+                ))
+                for text in (query, "xyz")
+            ]
+            print(f"{total:>10} {matches:>8} {timings[0]:>8.2f}ms {timings[2]:>8.2f}ms   "
+                  f"          {timings[1]:>8.2f}ms {timings[3]:>8.2f}ms")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
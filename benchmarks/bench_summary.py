@@ -0,0 +1,74 @@
+"""Benchmark: latency of FinanceService.get_summary for a user with many transactions.
+
+Runs against a throwaway test database created from the configured one. The
+generated history spans the last `months` months; with 14 or fewer, every row
+falls inside the summary window (the worst case).
+
+Usage:
+    python benchmarks/bench_summary.py [rows] [months]
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_app.settings")
+import django
+django.setup()
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+from api.services.finance import FinanceService
+from core.models import Currency
+
+
+def make_records(count: int, months: int) -> list:
+    now = timezone.now()
+    span = timedelta(days=30 * months)
+    return [
+        {
+            "type": "income" if i % 10 == 0 else "expense",
+            "amount": f"{(i % 300) + 1}.99",
+            "category_name": f"Category {i % 15}",
+            "date": now - span * (i / count),
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    months = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$", is_default=True)
+        Currency.objects.create(code="EUR", name="Euro", symbol="€")
+        user = get_user_model().objects.create(username="bench", telegram_id=1)
+        other = get_user_model().objects.create(username="other", telegram_id=2)
+        bulk_create = async_to_sync(FinanceService.bulk_create_transactions)
+        bulk_create(user.pk, make_records(rows, months), 5000)
+        bulk_create(other.pk, make_records(rows, months), 5000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        get_summary = async_to_sync(FinanceService.get_summary)
+        get_summary(user.pk)
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            get_summary(user.pk)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"get_summary over {rows} rows ({months} months): "
+              f"median {statistics.median(timings):.1f} ms, max {max(timings):.1f} ms")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Microbenchmark: webhook update decoding, old multi-copy path vs single-pass path.
+
+"decode" covers everything before `Update.de_json` (the part this change removes
+copies from); "end-to-end" includes building the python-telegram-bot objects.
+
+Usage:
+    python benchmarks/bench_webhook_decode.py [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_app.settings")
+import django
+django.setup()
+
+from telegram import Update
+from api.schemas import TelegramUpdate, update_payload_adapter
+from api.services.telegram import TelegramService
+
+USER = {"id": 123456789, "is_bot": False, "first_name": "Ada", "username": "ada", "language_code": "en"}
+CHAT = {"id": 123456789, "type": "private", "first_name": "Ada", "username": "ada"}
+
+PAYLOADS = {
+    "message": {
+        "update_id": 10001,
+        "message": {
+            "message_id": 42,
+            "from": USER,
+            "chat": CHAT,
+            "date": 1735689600,
+            "text": "/add_expense 150 Groceries Weekly food shopping",
+            "entities": [{"offset": 0, "length": 12, "type": "bot_command"}],
+        },
+    },
+    "callback_query": {
+        "update_id": 10002,
+        "callback_query": {
+            "id": "4382bfdwdsb323b2d9",
+            "from": USER,
+            "message": {
+                "message_id": 43,
+                "from": {"id": 987654321, "is_bot": True, "first_name": "FinanceBot", "username": "finance_bot"},
+                "chat": CHAT,
+                "date": 1735689601,
+                "text": "Welcome to FinanceBot! What would you like to do?",
+            },
+            "chat_instance": "-5313862717413812110",
+            "data": "menu_add_income",
+        },
+    },
+}
+
+
+def old_decode(body: bytes) -> dict:
+    """Everything the old webhook did before `Update.de_json`."""
+    update_data = json.loads(body)
+    update = TelegramUpdate(**update_data)
+    return TelegramService.update_to_dict(update)
+
+
+def new_decode(body: bytes) -> dict:
+    return update_payload_adapter.validate_json(body)
+
+
+def old_path(service: TelegramService, body: bytes):
+    return Update.de_json(old_decode(body), service.bot)
+
+
+def new_path(service: TelegramService, body: bytes):
+    return service.decode_update(body)
+
+
+def per_op(fn, iterations: int) -> float:
+    return min(timeit.repeat(fn, number=iterations, repeat=3)) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    service = TelegramService(token="123456:BENCHMARK")
+
+    print(f"{'payload':<16}{'stage':<14}{'old (us/op)':>14}{'new (us/op)':>14}{'speedup':>10}")
+    for name, payload in PAYLOADS.items():
+        body = json.dumps(payload).encode()
+        # The old path drops `from` on nested messages, so only compare what both keep
+        old_update, new_update = old_path(service, body), new_path(service, body)
+        assert old_update.update_id == new_update.update_id
+        assert old_update.effective_user == new_update.effective_user
+
+        stages = {
+            "decode": (lambda: old_decode(body), lambda: new_decode(body)),
+            "end-to-end": (lambda: old_path(service, body), lambda: new_path(service, body)),
+        }
+        for stage, (old_fn, new_fn) in stages.items():
+            old, new = per_op(old_fn, iterations), per_op(new_fn, iterations)
+            print(f"{name:<16}{stage:<14}{old:>14.2f}{new:>14.2f}{old / new:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
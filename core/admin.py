@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Currency, Category, Income, Expense
+from .models import User, Budget, Currency, Category, ExchangeRate, Income, Expense, RecurringRule, Broadcast
+from .rollups import RollupDelta
 
 class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
@@ -21,5 +22,29 @@ class CustomUserAdmin(UserAdmin):
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Currency)
 admin.site.register(Category)
-admin.site.register(Income)
-admin.site.register(Expense)
\ No newline at end of file
+admin.site.register(ExchangeRate)
+admin.site.register(Budget)
+admin.site.register(RecurringRule)
+admin.site.register(Broadcast)
+class TransactionAdmin(admin.ModelAdmin):
+    """Keeps the monthly rollups in step with edits made in the admin (which run in a transaction)."""
+    exclude = ('kind',)  # Fixed by the proxy model being edited
+    
+    def save_model(self, request, obj, form, change):
+        delta = RollupDelta()
+        if change:
+            delta.deleted([type(obj).objects.get(pk=obj.pk)])
+        super().save_model(request, obj, form, change)
+        delta.created([obj]).apply()
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        RollupDelta().deleted([obj]).apply()
+    
+    def delete_queryset(self, request, queryset):
+        delta = RollupDelta().deleted(queryset)
+        super().delete_queryset(request, queryset)
+        delta.apply()
+
+admin.site.register(Income, TransactionAdmin)
+admin.site.register(Expense, TransactionAdmin)
\ No newline at end of file
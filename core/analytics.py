@@ -0,0 +1,368 @@
+"""Per-user analytics over columnar snapshots of the transaction table.
+
+A user's transactions are cached on disk as one raw binary file per column
+(`COLUMNS`) plus a small JSON header, and read back as memory-mapped NumPy
+arrays, so loading a history of a million rows costs a few page faults
+instead of a million ORM objects. New rows are appended to the files as
+they come in; edits and deletes discard the snapshot, which is rebuilt on
+the next load. Before a snapshot is used, its row count and amount total
+are checked against the monthly rollups, and the version of the user's
+transactions it was built from against their `CacheVersion` counter, which
+every edit, delete and rollup rebuild bumps (see `core.rollups`) in
+whichever process it runs. Snapshots of the users loaded least recently are
+removed beyond `ANALYTICS_CACHE_MAX_USERS`.
+
+`UserAnalytics` computes trends, moving averages, category shares and a
+month-end forecast from the arrays with vectorized operations only.
+"""
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Iterator, Optional
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core.exchange import ExchangeRates
+from core.models import CacheVersion, Expense, Income, MonthlyRollup, Transaction
+
+# Column name -> dtype, in the order the snapshot query selects them
+COLUMNS = {
+    "day": np.int32,       # Days since 1970-01-01
+    "cents": np.int64,     # Amount in cents of the row's currency
+    "currency": np.int32,  # Currency id
+    "category": np.int32,  # Category id, NO_CATEGORY if none
+    "income": np.int8,     # 1 for incomes, 0 for expenses
+}
+NO_CATEGORY = -1
+
+_table = Transaction._meta.db_table
+
+SNAPSHOT_SQL = f"""
+    SELECT id, date::date - DATE '1970-01-01', (amount * 100)::bigint, currency_id,
+           COALESCE(category_id, {NO_CATEGORY}), (kind = '{Transaction.INCOME}')::int
+    FROM {_table}
+    WHERE user_id = %s AND id > %s
+"""
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """A user's transactions as parallel column arrays, in insertion order."""
+    day: np.ndarray
+    cents: np.ndarray
+    currency: np.ndarray
+    category: np.ndarray
+    income: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+
+class SnapshotStore:
+    """Memory-mapped column files per user, under `root`/<user id>/.
+
+    The header (`meta.json`) holds the row count, the highest transaction
+    id included, the total in cents and the version of the user's
+    transactions. It is replaced atomically after the column files are
+    appended to, so readers never map a partial append. Writers for the same
+    user are serialized with a file lock. Each load touches the user's
+    directory; when one is created, the least recently touched ones beyond
+    `max_users` are removed.
+    """
+
+    def __init__(self, root: Optional[str] = None, chunk_size: int = 50000, max_users: Optional[int] = None):
+        self._root = root
+        self._max_users = max_users
+        self.chunk_size = chunk_size
+
+    @property
+    def root(self) -> str:
+        return self._root or settings.ANALYTICS_CACHE_DIR
+
+    @property
+    def max_users(self) -> int:
+        return self._max_users or settings.ANALYTICS_CACHE_MAX_USERS
+
+    def _directory(self, user_id: int) -> str:
+        return os.path.join(self.root, str(int(user_id)))
+
+    @contextmanager
+    def _locked(self, user_id: int) -> Iterator[str]:
+        directory = self._directory(user_id)
+        path = os.path.join(directory, ".lock")
+        while True:
+            os.makedirs(directory, exist_ok=True)
+            lock = open(path, "a")
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # The directory may have been evicted while we waited for its lock
+                if os.stat(path).st_ino == os.fstat(lock.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            lock.close()
+        try:
+            yield directory
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def _evict(self, keep: str) -> None:
+        """Remove the least recently loaded snapshots beyond `max_users`, except `keep`'s."""
+        with os.scandir(self.root) as entries:
+            directories = [entry for entry in entries if entry.is_dir() and entry.path != keep]
+        excess = len(directories) + 1 - self.max_users
+        if excess <= 0:
+            return
+        directories.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in directories[:excess]:
+            try:
+                lock = open(os.path.join(entry.path, ".lock"), "a")
+            except FileNotFoundError:
+                continue
+            with lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Being loaded right now
+                # Mapped files stay readable until unmapped
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    @staticmethod
+    def _read_meta(directory: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_meta(directory: str, meta: dict) -> None:
+        path = os.path.join(directory, "meta.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+
+    def _append(self, directory: str, user_id: int, meta: dict, suffix: str = "") -> dict:
+        """Append the user's rows with an id above the snapshot's to the column files."""
+        files = {name: open(os.path.join(directory, f"{name}.bin{suffix}"), "ab") for name in COLUMNS}
+        try:
+            for name, f in files.items():
+                # Drop bytes of an append that never made it into the header
+                f.truncate(meta["count"] * np.dtype(COLUMNS[name]).itemsize)
+            with connection.chunked_cursor() as cursor:
+                cursor.execute(SNAPSHOT_SQL, [user_id, meta["last_id"]])
+                while rows := cursor.fetchmany(self.chunk_size):
+                    block = np.array(rows, dtype=np.int64)
+                    for index, (name, dtype) in enumerate(COLUMNS.items(), 1):
+                        files[name].write(block[:, index].astype(dtype).tobytes())
+                    meta = {
+                        "count": meta["count"] + len(block),
+                        "last_id": max(meta["last_id"], int(block[:, 0].max())),
+                        "cents": meta["cents"] + int(block[:, 2].sum()),
+                    }
+        finally:
+            for f in files.values():
+                f.close()
+        return meta
+
+    def _rebuild(self, directory: str, user_id: int) -> dict:
+        # Written aside and swapped in: other processes may still map the old files
+        for name in COLUMNS:
+            open(os.path.join(directory, f"{name}.bin.tmp"), "wb").close()
+        meta = self._append(directory, user_id, {"count": 0, "last_id": 0, "cents": 0}, suffix=".tmp")
+        self.discard(user_id)
+        for name in COLUMNS:
+            os.replace(os.path.join(directory, f"{name}.bin.tmp"), os.path.join(directory, f"{name}.bin"))
+        return meta
+
+    @staticmethod
+    def _intact(directory: str, meta: dict) -> bool:
+        """Whether every column file holds at least the rows the header counts."""
+        for name, dtype in COLUMNS.items():
+            try:
+                if os.path.getsize(os.path.join(directory, f"{name}.bin")) < meta["count"] * np.dtype(dtype).itemsize:
+                    return False
+            except FileNotFoundError:
+                return False
+        return True
+
+    @staticmethod
+    def _expected(user_id: int) -> tuple:
+        """(row count, total in cents) according to the monthly rollups, and the transactions' version."""
+        totals = MonthlyRollup.objects.filter(user_id=user_id).aggregate(count=Sum("count"), total=Sum("total"))
+        version = CacheVersion.current(f"{CacheVersion.USER_TRANSACTIONS}{int(user_id)}")
+        return totals["count"] or 0, int((totals["total"] or Decimal(0)) * 100), version
+
+    def load(self, user_id: int) -> Snapshot:
+        """Bring a user's snapshot up to date and map it (synchronous; uses the database).
+
+        Returns:
+            Snapshot: Read-only arrays backed by the column files
+        """
+        count, cents, version = self._expected(user_id)
+        created = not os.path.isdir(self._directory(user_id))
+        with self._locked(user_id) as directory:
+            os.utime(directory)
+            meta = self._read_meta(directory)
+            if meta is not None and (not self._intact(directory, meta) or meta.get("version") != version):
+                meta = None
+            if meta is not None and (meta["count"], meta["cents"]) != (count, cents):
+                meta = self._append(directory, user_id, meta)
+            if meta is None or (meta["count"], meta["cents"]) != (count, cents):
+                meta = self._rebuild(directory, user_id)
+            self._write_meta(directory, {**meta, "version": version})
+        if created:
+            self._evict(directory)
+        return Snapshot(**{
+            name: np.memmap(os.path.join(directory, f"{name}.bin"), dtype=dtype, mode="r", shape=(meta["count"],))
+            if meta["count"] else np.empty(0, dtype=dtype)
+            for name, dtype in COLUMNS.items()
+        })
+
+    def discard(self, user_id: int) -> None:
+        """Drop a user's snapshot; the next load rebuilds it."""
+        try:
+            os.unlink(os.path.join(self._directory(user_id), "meta.json"))
+        except FileNotFoundError:
+            pass
+
+
+snapshots = SnapshotStore()
+
+
+@receiver(post_save, sender=Income, dispatch_uid="analytics_income_saved")
+@receiver(post_save, sender=Expense, dispatch_uid="analytics_expense_saved")
+@receiver(post_save, sender=Transaction, dispatch_uid="analytics_transaction_saved")
+@receiver(post_delete, sender=Income, dispatch_uid="analytics_income_deleted")
+@receiver(post_delete, sender=Expense, dispatch_uid="analytics_expense_deleted")
+@receiver(post_delete, sender=Transaction, dispatch_uid="analytics_transaction_deleted")
+def discard_changed_snapshot(sender, instance, created=False, **kwargs):
+    # New rows are appended on the next load; edited and deleted ones cannot be patched in place
+    if not created:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: snapshots.discard(user_id))
+
+
+def _month_index(days: np.ndarray) -> np.ndarray:
+    """Months since January 1970 of day numbers."""
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _month_start(month_index: int) -> date:
+    return date(1970 + month_index // 12, month_index % 12 + 1, 1)
+
+
+class UserAnalytics:
+    """Statistics over one user's snapshot, with every amount converted into one currency.
+
+    Each row is converted at the rate as of its own day; rows in a currency
+    with no known rate are left out (their currencies are listed in `missing`).
+    """
+
+    def __init__(self, snapshot: Snapshot, rates: ExchangeRates, currency_id: int, today: date,
+                 currency_codes: Optional[dict] = None):
+        """Convert a snapshot.
+
+        Args:
+            snapshot (Snapshot): The user's columns
+            rates (ExchangeRates): Exchange rates for the conversion
+            currency_id (int): Id of the currency everything is converted into
+            today (date): Reference day for "this month" and trailing windows
+            currency_codes (dict, optional): Currency id -> code, to name the `missing` currencies
+        """
+        self.today = today
+        self.today_day = int(np.datetime64(today, "D").astype(np.int64))
+        days = np.asarray(snapshot.day)
+        values = rates.convert(np.asarray(snapshot.cents) / 100, np.asarray(snapshot.currency), days, currency_id)
+        known = ~np.isnan(values)
+        missing = np.unique(np.asarray(snapshot.currency)[~known])
+        self.missing = sorted((currency_codes or {}).get(int(currency), str(currency)) for currency in missing)
+        self.day = days[known]
+        self.value = values[known]
+        self.category = np.asarray(snapshot.category)[known]
+        self.income = np.asarray(snapshot.income)[known].astype(bool)
+        self.month = _month_index(self.day)
+        self.this_month = int(_month_index(np.array([self.today_day]))[0])
+
+    def monthly_totals(self, months: int = 12) -> dict:
+        """Income and expense per calendar month, for the last `months` months including this one.
+
+        Returns:
+            dict: `months` (first days), `income`, `expense` and `net` (float arrays)
+        """
+        first = self.this_month - months + 1
+        offset = self.month - first
+        rows = (offset >= 0) & (offset < months)
+        income = np.bincount(offset[rows & self.income], self.value[rows & self.income], minlength=months)
+        expense = np.bincount(offset[rows & ~self.income], self.value[rows & ~self.income], minlength=months)
+        return {
+            "months": [_month_start(first + index) for index in range(months)],
+            "income": income,
+            "expense": expense,
+            "net": income - expense,
+        }
+
+    def daily_spend(self, days: int = 90) -> np.ndarray:
+        """Expenses per day over the last `days` days, ending today."""
+        offset = self.day - (self.today_day - days + 1)
+        rows = ~self.income & (offset >= 0) & (offset < days)
+        return np.bincount(offset[rows], self.value[rows], minlength=days)
+
+    def moving_average(self, window: int = 30, days: int = 90) -> np.ndarray:
+        """Trailing `window`-day average of daily spend for each of the last `days` days."""
+        series = self.daily_spend(days + window - 1)
+        totals = np.cumsum(np.concatenate(([0.0], series)))
+        return (totals[window:] - totals[:-window]) / window
+
+    def category_shares(self, months: int = 3) -> dict:
+        """Each category's share of expenses per month, over the last `months` months.
+
+        Returns:
+            dict: `months` (first days), `categories` (ids, `NO_CATEGORY` for none, largest
+            overall first), `totals` (months x categories) and `shares` (rows sum to 1,
+            or 0 for a month without expenses)
+        """
+        first = self.this_month - months + 1
+        offset = self.month - first
+        rows = ~self.income & (offset >= 0) & (offset < months)
+        categories, column = np.unique(self.category[rows], return_inverse=True)
+        totals = np.bincount(
+            offset[rows] * len(categories) + column, self.value[rows], minlength=months * len(categories)
+        ).reshape(months, len(categories))
+        order = np.argsort(-totals.sum(axis=0), kind="stable")
+        totals = totals[:, order]
+        month_totals = totals.sum(axis=1, keepdims=True)
+        shares = np.divide(totals, month_totals, out=np.zeros_like(totals), where=month_totals > 0)
+        return {
+            "months": [_month_start(first + index) for index in range(months)],
+            "categories": categories[order],
+            "totals": totals,
+            "shares": shares,
+        }
+
+    def forecast(self, trailing_days: int = 90) -> dict:
+        """Project this month's spend: spend so far plus the trailing daily average for the days left.
+
+        Returns:
+            dict: `spent` so far, `daily` (trailing average per day) and `projected` month-end total
+        """
+        month_start = _month_start(self.this_month)
+        next_month = _month_start(self.this_month + 1)
+        spent = float(self.value[~self.income & (self.month == self.this_month) & (self.day <= self.today_day)].sum())
+        daily = float(self.daily_spend(trailing_days).mean())
+        remaining = (next_month - self.today).days - 1
+        return {
+            "month": month_start,
+            "spent": spent,
+            "daily": daily,
+            "projected": spent + daily * remaining,
+        }
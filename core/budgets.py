@@ -0,0 +1,136 @@
+"""Monthly category budgets and their spend counters.
+
+Each `Budget` row carries the spend of the month it last counted. Expense
+writes pass their change to `track_spend` (through `RollupDelta.apply`),
+which moves the counters and detects threshold crossings in a single
+UPDATE found through the (user, category) unique index. A counter left
+over from an earlier month restarts from zero on its first write of the
+new month.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from core.models import Budget, Category, Currency, MonthlyRollup, Transaction
+
+# Percentages of a budget that trigger an alert when spending crosses them
+THRESHOLDS = (80, 100)
+
+_table = Budget._meta.db_table
+
+_LEVEL_SQL = "CASE {cases} ELSE 0 END".format(cases=" ".join(
+    f"WHEN {{spent}} >= {{limit}} * {threshold / 100:.2f} THEN {threshold}"
+    for threshold in sorted(THRESHOLDS, reverse=True)
+))
+
+# The CTE locks the budgets first, so the previous alert level it reads is
+# the latest committed one even when two expenses race.
+TRACK_SQL = f"""
+    WITH changes (user_id, category_id, currency_id, amount) AS (VALUES {{values}}),
+    counted AS (
+        SELECT budget.id,
+               CASE WHEN budget.month = %(month)s THEN budget.spent ELSE 0 END + changes.amount AS spent,
+               CASE WHEN budget.month = %(month)s THEN budget.alerted ELSE 0 END AS alerted
+        FROM {_table} AS budget
+        JOIN changes ON budget.user_id = changes.user_id AND budget.category_id = changes.category_id
+            AND budget.currency_id = changes.currency_id
+        FOR UPDATE OF budget
+    )
+    UPDATE {_table} AS budget
+    SET spent = counted.spent, month = %(month)s,
+        alerted = GREATEST(counted.alerted, {_LEVEL_SQL.format(spent="counted.spent", limit="budget.amount")})
+    FROM counted, {Category._meta.db_table} AS category, {Currency._meta.db_table} AS currency
+    WHERE budget.id = counted.id AND category.id = budget.category_id AND currency.id = budget.currency_id
+    RETURNING budget.id, budget.user_id, category.name, currency.code, currency.symbol,
+              budget.amount, budget.spent, budget.alerted, counted.alerted
+"""
+
+
+def current_month() -> date:
+    today = timezone.localdate() if settings.USE_TZ else timezone.now().date()
+    return today.replace(day=1)
+
+
+def level(spent: Decimal, limit: Decimal) -> int:
+    """The highest threshold `spent` has reached, or 0."""
+    return max((threshold for threshold in THRESHOLDS if spent >= limit * threshold / 100), default=0)
+
+
+def track_spend(changes: list, month: Optional[date] = None) -> list:
+    """Add expense changes to this month's budget counters; call inside the writing transaction.
+
+    Args:
+        changes (list): (user id, category id, currency id, amount) tuples, at most one per
+            budget, for expenses dated in `month` (negative amounts for removed ones)
+        month (date, optional): First day of the current month
+
+    Returns:
+        list: One alert per budget whose spend crossed a threshold: `budget_id`, `user_id`,
+        `category`, `currency`, `symbol`, `amount`, `spent` and `threshold`
+    """
+    changes = [change for change in changes if change[1] is not None and change[3]]
+    if not changes:
+        return []
+    params = {"month": month or current_month()}
+    rows = []
+    for index, (user_id, category_id, currency_id, amount) in enumerate(sorted(changes)):
+        params.update({f"u{index}": user_id, f"c{index}": category_id, f"k{index}": currency_id, f"a{index}": amount})
+        rows.append(f"(%(u{index})s::bigint, %(c{index})s::bigint, %(k{index})s::bigint, %(a{index})s::numeric)")
+    with connection.cursor() as cursor:
+        cursor.execute(TRACK_SQL.format(values=", ".join(rows)), params)
+        return [
+            {
+                "budget_id": budget_id, "user_id": user_id, "category": category, "currency": code,
+                "symbol": symbol, "amount": limit, "spent": spent, "threshold": alerted,
+            }
+            for budget_id, user_id, category, code, symbol, limit, spent, alerted, previous in cursor.fetchall()
+            if alerted > previous
+        ]
+
+
+def monthly_spend(user_id: int, category_id: int, currency_id: int, month: date) -> Decimal:
+    """A category's expenses for a month, from the rollups (used when a budget is set up)."""
+    totals = MonthlyRollup.objects.filter(
+        user_id=user_id, category_id=category_id, currency_id=currency_id, month=month, kind=Transaction.EXPENSE
+    ).values_list("total", flat=True)
+    return sum(totals, Decimal(0))
+
+
+def set_budget(user_id: int, category_id: int, currency_id: int, amount: Decimal) -> Budget:
+    """Create or change a category's monthly budget, counting this month's spend so far.
+
+    Thresholds already reached are marked as alerted, so setting a budget
+    never alerts by itself.
+    """
+    month = current_month()
+    with transaction.atomic():
+        spent = monthly_spend(user_id, category_id, currency_id, month)
+        budget, _ = Budget.objects.update_or_create(
+            user_id=user_id,
+            category_id=category_id,
+            defaults={
+                "currency_id": currency_id,
+                "amount": amount,
+                "month": month,
+                "spent": spent,
+                "alerted": level(spent, amount),
+            },
+        )
+    return budget
+
+
+def budget_status(user_id: int) -> list:
+    """A user's budgets with this month's spend (a counter from an earlier month counts as zero)."""
+    month = current_month()
+    return [
+        {
+            "category": budget.category.name,
+            "currency": budget.currency.code,
+            "symbol": budget.currency.symbol,
+            "amount": budget.amount,
+            "spent": budget.spent if budget.month == month else Decimal(0),
+        }
+        for budget in Budget.objects.filter(user_id=user_id).select_related("category", "currency")
+    ]
@@ -0,0 +1,253 @@
+"""Exchange rates: loading rate files and feeds, and converting amounts in bulk.
+
+`ExchangeRates` is an immutable snapshot of the rate table, indexed per
+currency pair as two sorted NumPy arrays (dates and rates). A lookup is a
+binary search for the latest rate on or before a date ("as of"). To convert
+a whole result set, each pair's rates are expanded once into a dense array
+with one entry per day, so a row's rate is a single array index and the
+cost is a handful of array operations per source currency.
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Optional
+import numpy as np
+from django.db import transaction
+from core.models import CacheVersion, Currency, ExchangeRate
+
+
+class ExchangeRates:
+    """As-of exchange rate lookups and vectorized conversion over a snapshot of rates.
+
+    Pairs without a stored rate are derived from the inverse pair, or through
+    one intermediate currency (a feed quoting everything against EUR can
+    convert USD to GBP). Results are floats, meant for reporting totals;
+    stored amounts stay decimals.
+    """
+
+    def __init__(self, series: dict):
+        """Create a snapshot.
+
+        Args:
+            series (dict): (base id, quote id) -> (dates as datetime64[D], rates as float64),
+                both sorted by date
+        """
+        self._series = series
+        self._derived = {}
+        self._daily = {}
+        self._neighbours = defaultdict(set)
+        for base, quote in series:
+            self._neighbours[base].add(quote)
+            self._neighbours[quote].add(base)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple]) -> "ExchangeRates":
+        """Build a snapshot from (base id, quote id, date, rate) rows in any order."""
+        grouped = defaultdict(list)
+        for base, quote, day, rate in rows:
+            grouped[(base, quote)].append((day, float(rate)))
+        series = {}
+        for pair, points in grouped.items():
+            points.sort()
+            series[pair] = (
+                np.array([day for day, _ in points], dtype="datetime64[D]"),
+                np.array([rate for _, rate in points], dtype=np.float64),
+            )
+        return cls(series)
+
+    def __len__(self) -> int:
+        return sum(len(dates) for dates, _ in self._series.values())
+
+    @staticmethod
+    def _as_of(series: tuple, days: np.ndarray) -> np.ndarray:
+        dates, rates = series
+        index = np.searchsorted(dates, days, side="right") - 1
+        return np.where(index >= 0, rates[np.maximum(index, 0)], np.nan)
+
+    def _stored(self, base: int, quote: int) -> Optional[tuple]:
+        if (base, quote) in self._series:
+            return self._series[(base, quote)]
+        if (quote, base) in self._series:
+            dates, rates = self._series[(quote, base)]
+            return dates, 1.0 / rates
+        return None
+
+    def _pair(self, base: int, quote: int) -> Optional[tuple]:
+        """Rate series for a pair: stored, inverted, or crossed through one other currency."""
+        if (base, quote) in self._derived:
+            return self._derived[(base, quote)]
+        series = self._stored(base, quote)
+        if series is None:
+            # Prefer the best-connected intermediate: usually the feed's base currency
+            for via in sorted(self._neighbours[base] & self._neighbours[quote],
+                              key=lambda currency: -len(self._neighbours[currency])):
+                first, second = self._stored(base, via), self._stored(via, quote)
+                dates = np.union1d(first[0], second[0])
+                rates = self._as_of(first, dates) * self._as_of(second, dates)
+                known = ~np.isnan(rates)
+                if known.any():
+                    series = (dates[known], rates[known])
+                    break
+        self._derived[(base, quote)] = series
+        return series
+
+    def _daily_rates(self, base: int, quote: int) -> Optional[tuple]:
+        """(first day as a day number, rate in effect on each day from then to the last known rate)."""
+        if (base, quote) not in self._daily:
+            series = self._pair(base, quote)
+            if series is None:
+                self._daily[(base, quote)] = None
+            else:
+                dates, rates = series
+                days = np.arange(dates[0], dates[-1] + 1)
+                self._daily[(base, quote)] = (
+                    dates[0].astype(np.int64), rates[np.searchsorted(dates, days, side="right") - 1]
+                )
+        return self._daily[(base, quote)]
+
+    def rate(self, base: int, quote: int, on: date) -> Optional[float]:
+        """The `base` -> `quote` rate in effect on `on`, or None when there is none yet."""
+        if base == quote:
+            return 1.0
+        series = self._pair(base, quote)
+        if series is None:
+            return None
+        value = self._as_of(series, np.array([on], dtype="datetime64[D]"))[0]
+        return None if np.isnan(value) else float(value)
+
+    def convert(self, amounts, currency_ids, days, to: int) -> np.ndarray:
+        """Convert amounts in mixed currencies into `to`, each at the rate as of its date.
+
+        Args:
+            amounts: Amounts (array-like of numbers)
+            currency_ids: Currency id of each amount
+            days: Date (or datetime) of each amount
+            to (int): Id of the target currency
+
+        Returns:
+            np.ndarray: Converted amounts (float64); NaN where no rate is known
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        currency_ids = np.asarray(currency_ids)
+        days = np.asarray(days, dtype="datetime64[D]")
+        converted = np.full(amounts.shape, np.nan)
+        for currency in np.unique(currency_ids):
+            rows = currency_ids == currency
+            if currency == to:
+                converted[rows] = amounts[rows]
+                continue
+            daily = self._daily_rates(int(currency), to)
+            if daily is None:
+                continue
+            first, rates = daily
+            offsets = days[rows].astype(np.int64) - first
+            # Before the first rate there is none; after the last one it stays in effect
+            rate = np.where(offsets >= 0, rates[np.clip(offsets, 0, len(rates) - 1)], np.nan)
+            converted[rows] = amounts[rows] * rate
+        return converted
+
+
+class RateFormatError(ValueError):
+    """Raised when a rate file or feed cannot be read."""
+
+
+def _record(day, base: str, quote: str, rate) -> tuple:
+    try:
+        value = Decimal(str(rate))
+    except InvalidOperation:
+        raise RateFormatError(f"Invalid rate {rate!r}")
+    if not value.is_finite() or value <= 0:
+        raise RateFormatError(f"Rate must be a positive number, got {rate!r}")
+    if not isinstance(day, date):
+        try:
+            day = date.fromisoformat(str(day)[:10])
+        except ValueError:
+            raise RateFormatError(f"Invalid date {day!r}")
+    return day, base.strip().upper(), quote.strip().upper(), value
+
+
+def parse_rates(content: str) -> list:
+    """Parse exchange rates from CSV or JSON text.
+
+    Accepted shapes:
+
+    - CSV with a `date,base,quote,rate` header
+    - a JSON list of `{"date", "base", "quote", "rate"}` objects
+    - a JSON feed `{"base": "EUR", "date": "2024-01-02", "rates": {"USD": 1.09, ...}}`
+    - a JSON time series `{"base": "EUR", "rates": {"2024-01-02": {"USD": 1.09, ...}, ...}}`
+
+    Returns:
+        list: (date, base code, quote code, Decimal rate) tuples
+
+    Raises:
+        RateFormatError: If the content matches none of these shapes
+    """
+    content = content.strip()
+    if not content:
+        raise RateFormatError("No rates found")
+    if content[0] not in "[{":
+        reader = csv.DictReader(io.StringIO(content))
+        missing = {"date", "base", "quote", "rate"} - {name.strip().lower() for name in reader.fieldnames or []}
+        if missing:
+            raise RateFormatError(f"Missing columns: {', '.join(sorted(missing))}")
+        return [
+            _record(row["date"], row["base"], row["quote"], row["rate"])
+            for row in ({key.strip().lower(): value for key, value in row.items()} for row in reader)
+        ]
+
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise RateFormatError(f"Invalid JSON: {e}")
+    try:
+        if isinstance(data, list):
+            return [_record(item["date"], item["base"], item["quote"], item["rate"]) for item in data]
+        base, rates = data["base"], data["rates"]
+        if "date" in data:
+            return [_record(data["date"], base, quote, rate) for quote, rate in rates.items()]
+        return [
+            _record(day, base, quote, rate)
+            for day, day_rates in rates.items()
+            for quote, rate in day_rates.items()
+        ]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise RateFormatError(f"Unrecognised rate feed ({e})")
+
+
+def store_rates(records: Iterable[tuple], source: str = "") -> dict:
+    """Insert or update parsed rates in one transaction, then invalidate the rate caches.
+
+    Args:
+        records (Iterable[tuple]): (date, base code, quote code, rate) tuples, as returned by `parse_rates`
+        source (str): File or feed the rates came from
+
+    Returns:
+        dict: `stored` (rows written) and `skipped` (currency codes not in the database, with counts)
+    """
+    currencies = dict(Currency.objects.values_list("code", "id"))
+    rates, skipped = {}, defaultdict(int)
+    for day, base, quote, rate in records:
+        if base == quote:
+            continue
+        if base not in currencies or quote not in currencies:
+            skipped[quote if base in currencies else base] += 1
+            continue
+        # The last rate for a pair and day wins
+        rates[(currencies[base], currencies[quote], day)] = rate
+
+    with transaction.atomic():
+        ExchangeRate.objects.bulk_create(
+            [
+                ExchangeRate(base_id=base, quote_id=quote, date=day, rate=rate, source=source[:100])
+                for (base, quote, day), rate in rates.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["base", "quote", "date"],
+            update_fields=["rate", "source"],
+        )
+        CacheVersion.bump(CacheVersion.EXCHANGE_RATE)
+    return {"stored": len(rates), "skipped": dict(skipped)}
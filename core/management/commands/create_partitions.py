@@ -0,0 +1,25 @@
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core import partitions
+
+class Command(BaseCommand):
+    help = 'Creates the missing monthly partitions of the transaction table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.TRANSACTION_PARTITIONS_AHEAD,
+                            help='Months after the current one to create')
+        parser.add_argument('--from', dest='first', help='Earliest month to create (YYYY-MM), defaults to the current month')
+
+    def handle(self, *args, **options):
+        first = None
+        if options['first']:
+            try:
+                first = datetime.strptime(options['first'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError(f"Invalid month {options['first']!r}, expected YYYY-MM")
+        
+        created = partitions.ensure_partitions(options['months_ahead'], first)
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partitions created"))
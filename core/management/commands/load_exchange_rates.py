@@ -0,0 +1,33 @@
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.exchange import RateFormatError, parse_rates, store_rates
+
+class Command(BaseCommand):
+    help = 'Loads daily exchange rates from a CSV/JSON file or an HTTP feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', default=settings.EXCHANGE_RATES_SOURCE,
+                            help='Path or http(s) URL of the rates (defaults to EXCHANGE_RATES_SOURCE)')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not source:
+            raise CommandError('No source given and EXCHANGE_RATES_SOURCE is not set')
+        
+        try:
+            if source.startswith(('http://', 'https://')):
+                response = httpx.get(source, timeout=30, follow_redirects=True)
+                response.raise_for_status()
+                content = response.text
+            else:
+                with open(source, encoding='utf-8-sig') as rates_file:
+                    content = rates_file.read()
+            records = parse_rates(content)
+        except (OSError, httpx.HTTPError, RateFormatError) as e:
+            raise CommandError(f"Could not read rates from {source}: {e}")
+        
+        result = store_rates(records, source)
+        for code, count in sorted(result['skipped'].items()):
+            self.stdout.write(self.style.WARNING(f"Skipped {count} rates for unknown currency {code}"))
+        self.stdout.write(self.style.SUCCESS(f"Loaded {result['stored']} exchange rates"))
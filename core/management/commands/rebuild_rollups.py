@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core import rollups
+
+class Command(BaseCommand):
+    help = 'Rebuilds the monthly rollup table from incomes and expenses, then verifies it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild the rollups of this user id')
+        parser.add_argument('--verify-only', action='store_true', help='Compare rollups with the source rows without rebuilding')
+
+    def handle(self, *args, **options):
+        user_id = options['user']
+        
+        if not options['verify_only']:
+            with transaction.atomic():
+                written = rollups.rebuild(user_id)
+            self.stdout.write(f"Rebuilt {written} rollup rows")
+        
+        mismatches = rollups.verify(user_id)
+        for mismatch in mismatches[:20]:
+            self.stdout.write(self.style.WARNING(
+                "user {user_id} {month} category {category_id} currency {currency_id} {kind}: "
+                "expected {expected_total} ({expected_count}), found {total} ({count})".format(**mismatch)
+            ))
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} rollup rows do not match the transactions")
+        
+        self.stdout.write(self.style.SUCCESS('Rollups match the transactions'))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 05:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedUpdate',
+            fields=[
+                ('update_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Processed Update',
+                'verbose_name_plural': 'Processed Updates',
+            },
+        ),
+    ]
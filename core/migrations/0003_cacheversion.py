@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 05:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_processedupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Cache Version',
+                'verbose_name_plural': 'Cache Versions',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_cacheversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='expense',
+            constraint=models.UniqueConstraint(fields=('user', 'import_hash'), name='unique_expense_import_hash'),
+        ),
+        migrations.AddConstraint(
+            model_name='income',
+            constraint=models.UniqueConstraint(fields=('user', 'import_hash'), name='unique_income_import_hash'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 05:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_import_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('kind', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense')], max_length=10)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='core.category')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='core.currency')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Monthly Rollup',
+                'verbose_name_plural': 'Monthly Rollups',
+                'ordering': ['-month'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'month', 'category', 'currency', 'kind'), name='unique_monthly_rollup', nulls_distinct=False)],
+            },
+        ),
+        # Build rollups for the existing incomes and expenses
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO core_monthlyrollup (user_id, month, category_id, currency_id, kind, total, count)
+                SELECT user_id, date_trunc('month', date)::date, category_id, currency_id, 'income', SUM(amount), COUNT(*)
+                FROM core_income GROUP BY 1, 2, 3, 4
+                UNION ALL
+                SELECT user_id, date_trunc('month', date)::date, category_id, currency_id, 'expense', SUM(amount), COUNT(*)
+                FROM core_expense GROUP BY 1, 2, 3, 4
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
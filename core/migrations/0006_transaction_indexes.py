@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-18 05:43
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking out writes, which needs autocommit
+    atomic = False
+
+    dependencies = [
+        ('core', '0005_monthlyrollup'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='expense',
+            index=models.Index(fields=['user', '-date', '-id'], name='expense_user_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='expense',
+            index=models.Index(fields=['user', 'category', 'date'], name='expense_user_category_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='expense',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['date'], name='expense_date_brin'),
+        ),
+        AddIndexConcurrently(
+            model_name='income',
+            index=models.Index(fields=['user', '-date', '-id'], name='income_user_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='income',
+            index=models.Index(fields=['user', 'category', 'date'], name='income_user_category_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='income',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['date'], name='income_date_brin'),
+        ),
+        # The composite indexes lead with user, so the single-column FK indexes are redundant
+        migrations.AlterField(
+            model_name='expense',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='expenses', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='income',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='incomes', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='monthlyrollup',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,172 @@
+# Generated by Django 5.2 on 2026-10-18 05:48
+
+from datetime import date
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# Django cannot create a partitioned table, so the table is written by hand and
+# the model state is declared alongside it. Every unique index of a partitioned
+# table must contain the partition key, hence the (id, date) primary key.
+CREATE_TRANSACTION_SQL = """
+CREATE TABLE core_transaction (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    kind varchar(10) NOT NULL,
+    amount numeric(10, 2) NOT NULL,
+    date timestamp with time zone NOT NULL,
+    description text NOT NULL,
+    import_hash varchar(64) NULL,
+    created_at timestamp with time zone NOT NULL,
+    updated_at timestamp with time zone NOT NULL,
+    category_id bigint NULL REFERENCES core_category (id) DEFERRABLE INITIALLY DEFERRED,
+    currency_id bigint NOT NULL REFERENCES core_currency (id) DEFERRABLE INITIALLY DEFERRED,
+    user_id bigint NOT NULL REFERENCES core_user (id) DEFERRABLE INITIALLY DEFERRED,
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+CREATE TABLE core_transaction_default PARTITION OF core_transaction DEFAULT;
+CREATE INDEX core_transaction_category_id_idx ON core_transaction (category_id);
+CREATE INDEX core_transaction_currency_id_idx ON core_transaction (currency_id);
+CREATE INDEX transaction_user_date_idx ON core_transaction (user_id, date DESC, id DESC);
+CREATE INDEX transaction_user_cat_date_idx ON core_transaction (user_id, category_id, date);
+CREATE INDEX transaction_date_brin ON core_transaction USING brin (date);
+ALTER TABLE core_transaction ADD CONSTRAINT unique_transaction_import_hash UNIQUE (user_id, import_hash, date);
+"""
+
+COPY_ROWS_SQL = """
+INSERT INTO core_transaction (kind, amount, date, description, import_hash, created_at, updated_at,
+                              category_id, currency_id, user_id)
+SELECT kind, amount, date, description, import_hash, created_at, updated_at, category_id, currency_id, user_id
+FROM (
+    SELECT 'income' AS kind, id, amount, date, description, import_hash, created_at, updated_at,
+           category_id, currency_id, user_id
+    FROM core_income
+    UNION ALL
+    SELECT 'expense' AS kind, id, amount, date, description, import_hash, created_at, updated_at,
+           category_id, currency_id, user_id
+    FROM core_expense
+) AS source
+ORDER BY date, kind, id;
+"""
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_partitions(apps, schema_editor):
+    """Create monthly partitions covering the rows about to be copied, and the coming months.
+
+    Self-contained on purpose: `core.partitions` follows the current model,
+    while this has to create partitions of the table as it is at this point.
+    """
+    db = schema_editor.connection.alias
+    table = apps.get_model("core", "Transaction")._meta.db_table
+    firsts = [
+        apps.get_model("core", name).objects.using(db).aggregate(first=models.Min("date"))["first"]
+        for name in ("Income", "Expense")
+    ]
+    this_month = django.utils.timezone.now().date().replace(day=1)
+    first = min((value.date().replace(day=1) for value in firsts if value), default=this_month)
+    last = _add_months(this_month, getattr(settings, "TRANSACTION_PARTITIONS_AHEAD", 3))
+
+    month = min(first, this_month)
+    while month <= last:
+        end = _add_months(month, 1)
+        schema_editor.execute(
+            f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        month = end
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_TRANSACTION_SQL, reverse_sql="DROP TABLE core_transaction;"),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='Transaction',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('kind', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense')], max_length=10)),
+                        ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                        ('date', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('description', models.TextField(blank=True)),
+                        ('import_hash', models.CharField(blank=True, editable=False, max_length=64, null=True)),
+                        ('created_at', models.DateTimeField(auto_now_add=True)),
+                        ('updated_at', models.DateTimeField(auto_now=True)),
+                        ('category', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='core.category')),
+                        ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='core.currency')),
+                        ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'verbose_name': 'Transaction',
+                        'verbose_name_plural': 'Transactions',
+                        'ordering': ['-date'],
+                        'indexes': [
+                            models.Index(fields=['user', '-date', '-id'], name='transaction_user_date_idx'),
+                            models.Index(fields=['user', 'category', 'date'], name='transaction_user_cat_date_idx'),
+                            django.contrib.postgres.indexes.BrinIndex(fields=['date'], name='transaction_date_brin'),
+                        ],
+                        'constraints': [
+                            models.UniqueConstraint(fields=('user', 'import_hash', 'date'), name='unique_transaction_import_hash'),
+                        ],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_partitions, migrations.RunPython.noop),
+        # Ids are renumbered: incomes and expenses had overlapping ones. The
+        # monthly rollups do not reference rows, so they stay valid.
+        migrations.RunSQL(COPY_ROWS_SQL),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL("DROP TABLE core_income; DROP TABLE core_expense;"),
+            ],
+            state_operations=[
+                migrations.DeleteModel(
+                    name='Expense',
+                ),
+                migrations.DeleteModel(
+                    name='Income',
+                ),
+                migrations.CreateModel(
+                    name='Expense',
+                    fields=[
+                    ],
+                    options={
+                        'verbose_name': 'Expense',
+                        'verbose_name_plural': 'Expenses',
+                        'proxy': True,
+                        'indexes': [],
+                        'constraints': [],
+                    },
+                    bases=('core.transaction',),
+                ),
+                migrations.CreateModel(
+                    name='Income',
+                    fields=[
+                    ],
+                    options={
+                        'verbose_name': 'Income',
+                        'verbose_name_plural': 'Incomes',
+                        'proxy': True,
+                        'indexes': [],
+                        'constraints': [],
+                    },
+                    bases=('core.transaction',),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 05:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_transaction_partitioned'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=24)),
+                ('source', models.CharField(blank=True, max_length=100)),
+                ('base', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rates_from', to='core.currency')),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates_to', to='core.currency')),
+            ],
+            options={
+                'verbose_name': 'Exchange Rate',
+                'verbose_name_plural': 'Exchange Rates',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('base', 'quote', 'date'), name='unique_exchange_rate'), models.CheckConstraint(condition=models.Q(('rate__gt', 0)), name='exchange_rate_positive')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 06:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_exchangerate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Budget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('month', models.DateField()),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('alerted', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budgets', to='core.category')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budgets', to='core.currency')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='budgets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Budget',
+                'verbose_name_plural': 'Budgets',
+                'ordering': ['category__name'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'category'), name='unique_budget'), models.CheckConstraint(condition=models.Q(('amount__gt', 0)), name='budget_amount_positive')],
+            },
+        ),
+    ]
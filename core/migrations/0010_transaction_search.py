@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 06:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_budget'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('description', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector(django.db.models.functions.comparison.Cast('user_id', models.TextField()), config='simple', weight='D'), django.contrib.postgres.search.SearchConfig('simple')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='transaction_search_gin'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 06:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_transaction_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('description', models.TextField(blank=True)),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'), ('cron', 'Cron expression')], max_length=10)),
+                ('cron', models.CharField(blank=True, max_length=100)),
+                ('start', models.DateTimeField()),
+                ('next_run', models.DateTimeField()),
+                ('last_run', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recurring_rules', to='core.category')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_rules', to='core.currency')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_rules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Recurring Rule',
+                'verbose_name_plural': 'Recurring Rules',
+                'ordering': ['next_run'],
+                'indexes': [models.Index(condition=models.Q(('is_active', True)), fields=['next_run'], name='recurring_rule_due_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('amount__gt', 0)), name='recurring_rule_amount_positive')],
+            },
+        ),
+    ]
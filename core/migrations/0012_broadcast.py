@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 06:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recurringrule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('cancelled', 'Cancelled')], default='pending', max_length=10)),
+                ('owner', models.CharField(blank=True, max_length=64)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('blocked', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcasts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Broadcast',
+                'verbose_name_plural': 'Broadcasts',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
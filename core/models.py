@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models.functions import Cast
 from django.utils import timezone
 
 class User(AbstractUser):
@@ -35,6 +38,38 @@ class User(AbstractUser):
             return f"@{self.telegram_username}"
         return self.username
 
+class CacheVersion(models.Model):
+    """Version counters for cached reference data.
+    
+    Writers bump the counter for a dataset; every process compares it with the
+    version it loaded to know when its cache is stale.
+    """
+    CURRENCY = 'currency'
+    EXCHANGE_RATE = 'exchange_rate'
+    USER_TRANSACTIONS = 'transactions:'  # Followed by a user id; bumped when their transactions are edited or deleted
+    
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Cache Version'
+        verbose_name_plural = 'Cache Versions'
+    
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+    
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
+    
+    @classmethod
+    def bump(cls, name):
+        """Invalidate a dataset everywhere: bump its version and drop the local cache on commit."""
+        if not cls.objects.filter(name=name).update(version=models.F('version') + 1):
+            cls.objects.get_or_create(name=name, defaults={'version': 1})
+        from core.reference import invalidate
+        transaction.on_commit(lambda: invalidate(name))
+
 class Currency(models.Model):
     code = models.CharField(max_length=3, unique=True)
     name = models.CharField(max_length=50)
@@ -55,6 +90,12 @@ class Currency(models.Model):
         if self.is_default:
             Currency.objects.filter(is_default=True).exclude(pk=self.pk).update(is_default=False)
         super().save(*args, **kwargs)
+        CacheVersion.bump(CacheVersion.CURRENCY)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        CacheVersion.bump(CacheVersion.CURRENCY)
+        return result
     
     @classmethod
     def get_default(cls):
@@ -64,9 +105,39 @@ class Currency(models.Model):
             default = cls.objects.first()
         return default
 
+class ExchangeRate(models.Model):
+    """The daily rate of a currency pair: one `base` unit is worth `rate` `quote` units."""
+    base = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='rates_from', db_index=False)  # Leads the unique constraint
+    quote = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='rates_to')
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=24, decimal_places=10)
+    source = models.CharField(max_length=100, blank=True)  # File or feed the rate was loaded from
+    
+    class Meta:
+        verbose_name = 'Exchange Rate'
+        verbose_name_plural = 'Exchange Rates'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['base', 'quote', 'date'], name='unique_exchange_rate'),
+            models.CheckConstraint(condition=models.Q(rate__gt=0), name='exchange_rate_positive'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date:%Y-%m-%d} 1 {self.base.code} = {self.rate} {self.quote.code}"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        CacheVersion.bump(CacheVersion.EXCHANGE_RATE)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        CacheVersion.bump(CacheVersion.EXCHANGE_RATE)
+        return result
+
 def get_default_currency():
-    """Function to get the default currency ID for use in models"""
-    return Currency.get_default() if Currency.get_default() else None
+    """Function to get the default currency for use in models (served from the reference cache)"""
+    from core.reference import currency_cache
+    return currency_cache.get_default()
 
 class Category(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories')
@@ -85,51 +156,271 @@ class Category(models.Model):
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
-class Income(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='incomes')
+class Transaction(models.Model):
+    """An income or an expense.
+    
+    The table is range-partitioned by month on `date` (see `core.partitions`),
+    so queries bounded by date only read the partitions they need. Postgres
+    requires the partition key in every unique index, which makes the real
+    primary key (id, date); `id` alone is still unique, as it comes from a
+    single identity sequence.
+    """
+    INCOME = 'income'
+    EXPENSE = 'expense'
+    KIND_CHOICES = [
+        (INCOME, 'Income'),
+        (EXPENSE, 'Expense'),
+    ]
+    KIND = None  # Set by the proxies below
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Indexed through the composite indexes below, which all lead with user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transactions', db_index=False)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.ForeignKey(
         Currency, 
         on_delete=models.CASCADE, 
-        related_name='incomes',
+        related_name='transactions',
     )
-    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='incomes', default=None, null=True, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='transactions', default=None, null=True, blank=True)
     date = models.DateTimeField(default=timezone.now)
     description = models.TextField(blank=True)
+    import_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)  # Content hash of an imported statement row
+    # Words of the description for /search ('simple' keeps them unstemmed, whatever their
+    # language), plus the user id at weight D so the GIN index narrows a search to one user
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('description', config='simple', weight='A')
+            + SearchVector(Cast('user_id', models.TextField()), config='simple', weight='D')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        verbose_name = 'Income'
-        verbose_name_plural = 'Incomes'
+        verbose_name = 'Transaction'
+        verbose_name_plural = 'Transactions'
         ordering = ['-date']
+        constraints = [
+            # The hash covers the row's date, so adding the partition key changes nothing
+            models.UniqueConstraint(fields=['user', 'import_hash', 'date'], name='unique_transaction_import_hash'),
+        ]
+        indexes = [
+            # History pages and date ranges, newest first (id breaks ties for keyset pagination)
+            models.Index(fields=['user', '-date', '-id'], name='transaction_user_date_idx'),
+            # Per-category drill-downs over a date range
+            models.Index(fields=['user', 'category', 'date'], name='transaction_user_cat_date_idx'),
+            # Cheap range filter over the whole append-mostly table (admin, maintenance jobs)
+            BrinIndex(fields=['date'], name='transaction_date_brin'),
+            # Full-text search over descriptions
+            GinIndex(fields=['search_vector'], name='transaction_search_gin'),
+        ]
     
     def __str__(self):
         return f"{self.amount} {self.currency.code} - ({self.date.strftime('%Y-%m-%d')})"
     
+    def save(self, *args, **kwargs):
+        if self.KIND:
+            self.kind = self.KIND
+        super().save(*args, **kwargs)
+
+class TransactionKindManager(models.Manager):
+    """Restricts a transaction proxy to rows of its own kind."""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(kind=self.model.KIND)
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.kind = self.model.KIND
+        return super().bulk_create(objs, *args, **kwargs)
+
+class Income(Transaction):
+    KIND = Transaction.INCOME
+    
+    objects = TransactionKindManager()
+    
+    class Meta:
+        proxy = True
+        verbose_name = 'Income'
+        verbose_name_plural = 'Incomes'
+    
     def get_absolute_url(self):
         from django.urls import reverse
         return reverse('income-detail', args=[str(self.id)])
+
+class Expense(Transaction):
+    KIND = Transaction.EXPENSE
+    
+    objects = TransactionKindManager()
     
+    class Meta:
+        proxy = True
+        verbose_name = 'Expense'
+        verbose_name_plural = 'Expenses'
+    
+    def __str__(self):
+        return f"{self.amount} {self.currency.code}"
 
-class Expense(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expenses')
+class MonthlyRollup(models.Model):
+    """Per-user monthly totals, maintained alongside every income and expense write.
+    
+    See `core.rollups` for how rows are updated, rebuilt and verified.
+    """
+    KIND_CHOICES = Transaction.KIND_CHOICES
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_rollups', db_index=False)  # Leads the unique constraint
+    month = models.DateField()  # First day of the month
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='monthly_rollups', null=True, blank=True)
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='monthly_rollups')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Monthly Rollup'
+        verbose_name_plural = 'Monthly Rollups'
+        ordering = ['-month']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'month', 'category', 'currency', 'kind'],
+                name='unique_monthly_rollup',
+                nulls_distinct=False,
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.month:%Y-%m}: {self.total} ({self.count})"
+
+class Budget(models.Model):
+    """A monthly spending limit for one of a user's categories.
+    
+    This month's spend is kept in `spent`, updated by every expense write
+    (see `core.budgets`), so checking a budget never scans transactions.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='budgets', db_index=False)  # Leads the unique constraint
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='budgets')
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='budgets')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    month = models.DateField()  # First day of the month `spent` counts
+    spent = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    alerted = models.PositiveSmallIntegerField(default=0)  # Highest threshold (percent) already alerted this month
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Budget'
+        verbose_name_plural = 'Budgets'
+        ordering = ['category__name']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='unique_budget'),
+            models.CheckConstraint(condition=models.Q(amount__gt=0), name='budget_amount_positive'),
+        ]
+    
+    def __str__(self):
+        return f"{self.category.name}: {self.spent}/{self.amount} ({self.month:%Y-%m})"
+
+class RecurringRule(models.Model):
+    """An income or expense recorded automatically on a schedule.
+    
+    `next_run` is the earliest occurrence not recorded yet. The scheduler
+    (see `core.recurrence`) records every occurrence up to now and moves
+    `next_run` past them in the same transaction, so an occurrence is never
+    recorded twice or skipped, even after downtime.
+    """
+    KIND_CHOICES = Transaction.KIND_CHOICES
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    CRON = 'cron'
+    FREQUENCY_CHOICES = [
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+        (MONTHLY, 'Monthly'),
+        (CRON, 'Cron expression'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_rules')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    currency = models.ForeignKey(
-        Currency, 
-        on_delete=models.CASCADE, 
-        related_name='expenses',
-    )
-    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='expenses', default=None, null=True, blank=True)
-    date = models.DateTimeField(default=timezone.now)
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='recurring_rules')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='recurring_rules', null=True, blank=True)
     description = models.TextField(blank=True)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES)
+    cron = models.CharField(max_length=100, blank=True)  # Five-field cron expression, for the cron frequency
+    start = models.DateTimeField()  # Daily, weekly and monthly rules repeat from it (see `next_run` for the next occurrence)
+    next_run = models.DateTimeField()
+    last_run = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        verbose_name = 'Expense'
-        verbose_name_plural = 'Expenses'
-        ordering = ['-date']
+        verbose_name = 'Recurring Rule'
+        verbose_name_plural = 'Recurring Rules'
+        ordering = ['next_run']
+        indexes = [
+            # Due rules, earliest first
+            models.Index(fields=['next_run'], condition=models.Q(is_active=True), name='recurring_rule_due_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(amount__gt=0), name='recurring_rule_amount_positive'),
+        ]
+    
+    def __str__(self):
+        schedule = self.cron if self.frequency == self.CRON else self.frequency
+        return f"{self.kind} {self.amount} ({schedule})"
+
+class Broadcast(models.Model):
+    """A message sent to every Telegram user.
+    
+    Recipients are sent to in chunks, in user id order; `last_user_id` is the
+    last recipient of the latest finished chunk, so an interrupted broadcast
+    resumes after it. The process sending it holds a lease (`owner`, renewed
+    through `heartbeat_at`), see `api.services.broadcast`.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (CANCELLED, 'Cancelled'),
+    ]
+    
+    text = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='broadcasts', null=True, blank=True)
+    owner = models.CharField(max_length=64, blank=True)  # Process currently sending it
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    last_user_id = models.BigIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    blocked = models.PositiveIntegerField(default=0)  # Users who blocked the bot or deleted their account
+    failed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Broadcast'
+        verbose_name_plural = 'Broadcasts'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.text[:30]} ({self.status}, {self.sent} sent)"
+
+class ProcessedUpdate(models.Model):
+    """Telegram update ids that have already been accepted by the webhook."""
+    update_id = models.BigIntegerField(primary_key=True)
+    received_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Processed Update'
+        verbose_name_plural = 'Processed Updates'
     
     def __str__(self):
-        return f"{self.amount} {self.currency.code}"
\ No newline at end of file
+        return str(self.update_id)
@@ -0,0 +1,90 @@
+"""Monthly partitions of the transaction table.
+
+`core_transaction` is range-partitioned on `date`, one partition per calendar
+month, plus a DEFAULT partition that catches rows no monthly partition covers
+so an insert never fails. `ensure_partitions` creates the months that are
+missing: the coming ones ahead of time, and any month whose rows have
+already landed in the default partition (those rows are moved over).
+"""
+from datetime import date
+from typing import Optional
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from core.models import Transaction
+
+_table = Transaction._meta.db_table
+DEFAULT_PARTITION = f"{_table}_default"
+# Generated columns are recomputed by Postgres and cannot be copied
+_columns = ", ".join(field.column for field in Transaction._meta.concrete_fields if not field.generated)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{_table}_p{month:%Y%m}"
+
+
+def existing_partitions() -> list:
+    """Names of the attached partitions, the default one included."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass ORDER BY child.relname",
+            [_table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_partitions(months_ahead: int = 3, first: Optional[date] = None) -> list:
+    """Create the missing monthly partitions from `first` to `months_ahead` months from now.
+
+    Months with rows waiting in the default partition are created too, by
+    moving their rows into a new table and attaching it. Safe to call from
+    several processes at once.
+
+    Args:
+        months_ahead (int): Months after the current one to create
+        first (date, optional): Earliest month to create, defaults to the current month
+
+    Returns:
+        list: Names of the partitions created
+    """
+    today = timezone.localdate() if settings.USE_TZ else timezone.now().date()
+    this_month = today.replace(day=1)
+    month = (first or this_month).replace(day=1)
+    months = set()
+    while month <= add_months(this_month, months_ahead):
+        months.add(month)
+        month = add_months(month, 1)
+
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Serializes concurrent callers; ATTACH also takes a lock on the parent
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [_table])
+        existing = set(existing_partitions())
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', date)::date FROM {DEFAULT_PARTITION}")
+        stranded = {row[0] for row in cursor.fetchall()}
+
+        for month in sorted(months | stranded):
+            name = partition_name(month)
+            if name in existing:
+                continue
+            start, end = month, add_months(month, 1)
+            bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            if month in stranded:
+                cursor.execute(f"CREATE TABLE {name} (LIKE {_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)")
+                cursor.execute(
+                    f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING {_columns}) "
+                    f"INSERT INTO {name} ({_columns}) SELECT {_columns} FROM moved",
+                    [start, end],
+                )
+                # Indexes and foreign keys are added from the parent on attach
+                cursor.execute(f"ALTER TABLE {_table} ATTACH PARTITION {name} {bounds}")
+            else:
+                cursor.execute(f"CREATE TABLE {name} PARTITION OF {_table} {bounds}")
+            created.append(name)
+    return created
@@ -0,0 +1,242 @@
+"""Schedules of recurring rules and recording of their due occurrences.
+
+A rule repeats daily, weekly or monthly from its `start`, or follows a
+five-field cron expression. `record_due` records every occurrence up to
+now for a batch of due rules: the transactions are inserted in bulk
+together with their rollup changes, and each rule's `next_run` moves past
+them in the same transaction. It runs under a transaction-level advisory
+lock, so when several processes run the scheduler one records while the
+others skip their turn.
+"""
+import calendar
+from datetime import datetime, time, timedelta
+from typing import Optional
+from django.db import connection, transaction
+from django.utils import timezone
+from core.models import RecurringRule, Transaction
+from core.rollups import RollupDelta
+
+# Advisory lock held while recording occurrences (any bigint unique within the database)
+LOCK_KEY = 7310_2201
+
+# Periods of the fixed-step frequencies
+STEPS = {RecurringRule.DAILY: timedelta(days=1), RecurringRule.WEEKLY: timedelta(weeks=1)}
+
+# (low, high) bounds of the cron fields: minute, hour, day of month, month, day of week
+_CRON_BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _parse_field(field: str, low: int, high: int) -> frozenset:
+    values = set()
+    for part in field.split(","):
+        span, _, step = part.partition("/")
+        if span == "*":
+            first, last = low, high
+        elif "-" in span:
+            first, last = (int(value) for value in span.split("-", 1))
+        else:
+            first = int(span)
+            # As in cron, `a/n` runs from a to the end of the field's range
+            last = high if step else first
+        step = int(step) if step else 1
+        if not low <= first <= last <= high or step < 1:
+            raise ValueError(f"Invalid cron field '{field}'")
+        values.update(range(first, last + 1, step))
+    return frozenset(values)
+
+
+class Cron:
+    """A five-field cron expression: minute, hour, day of month, month and day of week.
+
+    Fields accept `*`, numbers, ranges (`1-5`), lists (`1,15`) and steps
+    (`*/15`, `5/10`). Days of the week run from 0 (Sunday) to 6, and 7 is
+    Sunday too. As in cron, when neither day field starts with `*` a day
+    matching either one matches; otherwise a day must match both.
+    """
+
+    def __init__(self, expression: str):
+        """Parse an expression.
+
+        Raises:
+            ValueError: If it is not five valid fields
+        """
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("A cron expression has five fields: minute hour day month weekday")
+        self.expression = " ".join(fields)
+        minutes, hours, days, months, weekdays = (
+            _parse_field(field, low, high) for field, (low, high) in zip(fields, _CRON_BOUNDS)
+        )
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours)
+        self.days = days
+        self.months = months
+        self.weekdays = frozenset(weekday % 7 for weekday in weekdays)
+        self._either_day = not fields[2].startswith("*") and not fields[4].startswith("*")
+
+    def _matches_day(self, day) -> bool:
+        if day.month not in self.months:
+            return False
+        weekday = day.isoweekday() % 7
+        if self._either_day:
+            return day.day in self.days or weekday in self.weekdays
+        return day.day in self.days and weekday in self.weekdays
+
+    def next_after(self, after: datetime) -> datetime:
+        """The first matching minute strictly after `after`.
+
+        Raises:
+            ValueError: If nothing matches within eight years (e.g. February 30th)
+        """
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        # Eight years always include a leap day, the rarest day a valid expression can need
+        for _ in range(8 * 366):
+            if self._matches_day(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime.combine(day, time(hour, minute), tzinfo=start.tzinfo)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+
+def add_months(value: datetime, months: int, day: Optional[int] = None) -> datetime:
+    """`value` moved by a number of months, on `day` (default: its own) or the month's last day if shorter."""
+    index = value.month - 1 + months
+    year, month = value.year + index // 12, index % 12 + 1
+    return value.replace(year=year, month=month, day=min(day or value.day, calendar.monthrange(year, month)[1]))
+
+
+def next_after(rule: RecurringRule, after: datetime) -> datetime:
+    """A rule's first occurrence strictly after `after`.
+
+    Monthly rules keep the day of month of their start, falling back to the
+    last day of shorter months (a rule starting January 31st runs on February
+    28th, then March 31st).
+    """
+    if after < rule.start:
+        return rule.start
+    if rule.frequency == RecurringRule.CRON:
+        return Cron(rule.cron).next_after(after)
+    if rule.frequency == RecurringRule.MONTHLY:
+        months = (after.year - rule.start.year) * 12 + after.month - rule.start.month
+        candidate = add_months(rule.start, months)
+        return candidate if candidate > after else add_months(rule.start, months + 1)
+    step = STEPS[rule.frequency]
+    return rule.start + step * ((after - rule.start) // step + 1)
+
+
+def first_run(frequency: str, cron: str = "", now: Optional[datetime] = None) -> datetime:
+    """The first occurrence of a rule created at `now`: one period later, or the next cron match.
+
+    Raises:
+        ValueError: If the frequency or cron expression is invalid
+    """
+    now = (now or timezone.now()).replace(second=0, microsecond=0)
+    if frequency == RecurringRule.CRON:
+        return Cron(cron).next_after(now)
+    if frequency == RecurringRule.MONTHLY:
+        return add_months(now, 1)
+    if frequency not in STEPS:
+        raise ValueError(f"Unknown frequency '{frequency}'")
+    return now + STEPS[frequency]
+
+
+def record_due(now: Optional[datetime] = None, batch_size: int = 100, max_occurrences: int = 100) -> Optional[dict]:
+    """Record the occurrences due by `now` of up to `batch_size` rules, earliest first.
+
+    Missed occurrences (e.g. after downtime) are all recorded, each dated when
+    it was due, at most `max_occurrences` per rule in one call; a rule with
+    more stays due for the next call.
+
+    Args:
+        now (datetime, optional): Record occurrences up to this time, defaults to now
+        batch_size (int): Rules handled in this call
+        max_occurrences (int): Occurrences recorded per rule in this call
+
+    Returns:
+        Optional[dict]: None if another process holds the lock, else `created` (transactions
+        recorded), `fired` (one dict per rule with `rule_id`, `user_id`, `telegram_id`, `kind`,
+        `category`, `amount`, `symbol`, `count` and `next_run`), `alerts` (budget alerts, see
+        `core.budgets.track_spend`) and `more` (whether rules beyond the batch may be due)
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", [LOCK_KEY])
+            if not cursor.fetchone()[0]:
+                return None
+        rules = list(
+            RecurringRule.objects.select_for_update(of=("self",))
+            .filter(is_active=True, next_run__lte=now)
+            .select_related("user", "category", "currency")
+            .order_by("next_run")[:batch_size]
+        )
+        objects, fired = [], []
+        for rule in rules:
+            occurrences = []
+            run = rule.next_run
+            while run <= now and len(occurrences) < max_occurrences:
+                occurrences.append(run)
+                run = next_after(rule, run)
+            objects.extend(
+                Transaction(
+                    kind=rule.kind, user_id=rule.user_id, amount=rule.amount, currency_id=rule.currency_id,
+                    category_id=rule.category_id, date=occurrence, description=rule.description,
+                )
+                for occurrence in occurrences
+            )
+            rule.last_run, rule.next_run = occurrences[-1], run
+            fired.append({
+                "rule_id": rule.pk, "user_id": rule.user_id, "telegram_id": rule.user.telegram_id,
+                "kind": rule.kind, "category": rule.category.name if rule.category else None,
+                "amount": rule.amount, "symbol": rule.currency.symbol, "count": len(occurrences),
+                "next_run": run,
+            })
+        Transaction.objects.bulk_create(objects, batch_size=1000)
+        alerts = RollupDelta().created(objects).apply()
+        RecurringRule.objects.bulk_update(rules, ["next_run", "last_run"])
+    return {"created": len(objects), "fired": fired, "alerts": alerts, "more": len(rules) == batch_size}
+
+
+def create_rule(user_id: int, kind: str, amount, currency_id: int, category_id: Optional[int], frequency: str,
+                cron: str = "", description: str = "", now: Optional[datetime] = None) -> RecurringRule:
+    """Create a rule whose first occurrence is one period after `now` (see `first_run`).
+
+    The rule starts at `now`, so a monthly rule keeps the day it was created
+    on: created January 31st, it runs on February 28th, then March 31st.
+
+    Raises:
+        ValueError: If the frequency or cron expression is invalid
+    """
+    start = (now or timezone.now()).replace(second=0, microsecond=0)
+    next_run = first_run(frequency, cron, start)
+    return RecurringRule.objects.create(
+        user_id=user_id, kind=kind, amount=amount, currency_id=currency_id, category_id=category_id,
+        description=description, frequency=frequency, cron=Cron(cron).expression if cron else "",
+        start=start, next_run=next_run,
+    )
+
+
+def stop_rule(user_id: int, rule_id: int) -> bool:
+    """Deactivate one of a user's rules.
+
+    Returns:
+        bool: Whether the user had an active rule with that id
+    """
+    return RecurringRule.objects.filter(pk=rule_id, user_id=user_id, is_active=True).update(is_active=False) > 0
+
+
+def user_rules(user_id: int) -> list:
+    """A user's active rules, next due first."""
+    return [
+        {
+            "id": rule.pk, "kind": rule.kind, "amount": rule.amount, "symbol": rule.currency.symbol,
+            "category": rule.category.name if rule.category else None, "description": rule.description,
+            "schedule": rule.cron if rule.frequency == RecurringRule.CRON else rule.frequency,
+            "next_run": rule.next_run,
+        }
+        for rule in RecurringRule.objects.filter(user_id=user_id, is_active=True).select_related("category", "currency")
+    ]
@@ -0,0 +1,133 @@
+import time
+from typing import Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from core.exchange import ExchangeRates
+from core.models import CacheVersion, Currency, ExchangeRate
+
+
+class CurrencyCache:
+    """Process-local cache of all `Currency` rows.
+
+    The currencies are loaded once. To stay coherent across worker processes,
+    the cache compares the `CacheVersion` counter with the version it loaded,
+    at most once every `check_interval` seconds. Saves in this process
+    invalidate it as soon as they commit.
+    """
+
+    def __init__(self, check_interval: float = 5.0):
+        self.check_interval = check_interval
+        # (version, currencies by code, default currency), replaced as a whole
+        self._state: Optional[tuple[int, dict, Optional[Currency]]] = None
+        self._checked_at = 0.0
+
+    def _load(self) -> tuple[int, dict, Optional[Currency]]:
+        # Read the version first so a concurrent bump is picked up on the next check
+        version = CacheVersion.current(CacheVersion.CURRENCY)
+        currencies = list(Currency.objects.all())
+        by_code = {currency.code: currency for currency in currencies}
+        default = next((currency for currency in currencies if currency.is_default), None)
+        if default is None and currencies:
+            default = currencies[0]
+        self._state = (version, by_code, default)
+        self._checked_at = time.monotonic()
+        return self._state
+
+    def _is_fresh(self) -> bool:
+        return self._state is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    def _ensure(self) -> tuple[int, dict, Optional[Currency]]:
+        if self._is_fresh():
+            return self._state
+        state = self._state
+        if state is None or CacheVersion.current(CacheVersion.CURRENCY) != state[0]:
+            return self._load()
+        self._checked_at = time.monotonic()
+        return state
+
+    def get_default(self) -> Optional[Currency]:
+        """The default currency, or the first one if no default exists (same rule as `Currency.get_default`)."""
+        return self._ensure()[2]
+
+    def get(self, code: str) -> Optional[Currency]:
+        """Look up a currency by its code."""
+        return self._ensure()[1].get(code.upper())
+
+    def all(self) -> list:
+        """All currencies, ordered by code."""
+        return sorted(self._ensure()[1].values(), key=lambda currency: currency.code)
+
+    async def aall(self) -> list:
+        if self._is_fresh():
+            return sorted(self._state[1].values(), key=lambda currency: currency.code)
+        return await sync_to_async(self.all)()
+
+    async def aget_default(self) -> Optional[Currency]:
+        if self._is_fresh():
+            return self._state[2]
+        return await sync_to_async(self.get_default)()
+
+    async def aget(self, code: str) -> Optional[Currency]:
+        if self._is_fresh():
+            return self._state[1].get(code.upper())
+        return await sync_to_async(self.get)(code)
+
+    def invalidate(self) -> None:
+        self._state = None
+
+
+class ExchangeRateCache:
+    """Process-local `ExchangeRates` snapshot of the whole rate table.
+
+    Kept coherent the same way as `CurrencyCache`: the snapshot is rebuilt
+    when the `CacheVersion` counter moves, checked at most once every
+    `check_interval` seconds.
+    """
+
+    def __init__(self, check_interval: float = 5.0):
+        self.check_interval = check_interval
+        # (version, snapshot), replaced as a whole
+        self._state: Optional[tuple[int, ExchangeRates]] = None
+        self._checked_at = 0.0
+
+    def _load(self) -> tuple[int, ExchangeRates]:
+        version = CacheVersion.current(CacheVersion.EXCHANGE_RATE)
+        rates = ExchangeRates.from_rows(
+            ExchangeRate.objects.values_list("base_id", "quote_id", "date", "rate").order_by()
+        )
+        self._state = (version, rates)
+        self._checked_at = time.monotonic()
+        return self._state
+
+    def _is_fresh(self) -> bool:
+        return self._state is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    def get(self) -> ExchangeRates:
+        """The current snapshot of exchange rates."""
+        if self._is_fresh():
+            return self._state[1]
+        state = self._state
+        if state is None or CacheVersion.current(CacheVersion.EXCHANGE_RATE) != state[0]:
+            return self._load()[1]
+        self._checked_at = time.monotonic()
+        return state[1]
+
+    async def aget(self) -> ExchangeRates:
+        if self._is_fresh():
+            return self._state[1]
+        return await sync_to_async(self.get)()
+
+    def invalidate(self) -> None:
+        self._state = None
+
+
+currency_cache = CurrencyCache(check_interval=settings.REFERENCE_CACHE_CHECK_INTERVAL)
+exchange_rate_cache = ExchangeRateCache(check_interval=settings.REFERENCE_CACHE_CHECK_INTERVAL)
+
+_caches = {CacheVersion.CURRENCY: currency_cache, CacheVersion.EXCHANGE_RATE: exchange_rate_cache}
+
+
+def invalidate(name: str) -> None:
+    """Drop this process's cache for the dataset `name`."""
+    if name in _caches:
+        _caches[name].invalidate()
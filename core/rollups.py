@@ -0,0 +1,183 @@
+"""Maintenance of the `MonthlyRollup` table.
+
+Writers collect the change each transaction makes to its rollup
+bucket, keyed by (user, month, category, currency, kind), and apply all of
+them with one upsert inside the same transaction as the write; expenses
+dated this month also move the budget counters (see `core.budgets`). Edits
+and deletes also bump the user's `CacheVersion.USER_TRANSACTIONS` counter,
+which tells caches of their rows (see `core.analytics`) to rebuild. `rebuild`
+recomputes the table from the source rows and `verify` compares the two.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, Optional
+from django.db import connection
+from django.utils import timezone
+from core import budgets
+from core.models import CacheVersion, MonthlyRollup, Transaction, User
+
+CENT = Decimal("0.01")
+
+_table = MonthlyRollup._meta.db_table
+_source = Transaction._meta.db_table
+
+UPSERT_SQL = f"""
+    INSERT INTO {_table} AS rollup (user_id, month, category_id, currency_id, kind, total, count)
+    VALUES {{values}}
+    ON CONFLICT (user_id, month, category_id, currency_id, kind) DO UPDATE
+    SET total = rollup.total + EXCLUDED.total, count = rollup.count + EXCLUDED.count
+"""
+
+BUMP_VERSIONS_SQL = f"""
+    INSERT INTO {CacheVersion._meta.db_table} AS counter (name, version)
+    SELECT %s::text || user_id, 1 FROM {{users}} ORDER BY user_id
+    ON CONFLICT (name) DO UPDATE SET version = counter.version + 1
+"""
+
+SOURCE_SQL = f"""
+    SELECT user_id, date_trunc('month', date)::date AS month, category_id, currency_id,
+           kind, SUM(amount) AS total, COUNT(*) AS count
+    FROM {_source} {{where}}
+    GROUP BY user_id, month, category_id, currency_id, kind
+"""
+
+
+def month_of(value) -> date:
+    """The first day of the month `value` (a datetime) falls in."""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date().replace(day=1)
+
+
+class RollupDelta:
+    """Accumulates changes to rollup buckets for one write."""
+
+    def __init__(self):
+        self._changes = defaultdict(lambda: [Decimal(0), 0])
+        self._edited_users = set()  # Users with rows edited or deleted, even if their totals did not change
+
+    def __bool__(self) -> bool:
+        return any(count or total for total, count in self._changes.values())
+
+    def add(self, obj, sign: int = 1) -> None:
+        """Count a transaction in (sign=1) or out of (sign=-1) its bucket."""
+        key = (obj.user_id, month_of(obj.date), obj.category_id, obj.currency_id, obj.kind)
+        change = self._changes[key]
+        # Rounded the way the amount column stores it
+        change[0] += sign * Decimal(str(obj.amount)).quantize(CENT, ROUND_HALF_UP)
+        change[1] += sign
+        if sign < 0:
+            self._edited_users.add(obj.user_id)
+
+    def created(self, objects: Iterable) -> "RollupDelta":
+        for obj in objects:
+            self.add(obj)
+        return self
+
+    def deleted(self, objects: Iterable) -> "RollupDelta":
+        for obj in objects:
+            self.add(obj, -1)
+        return self
+
+    def updated(self, old, new) -> "RollupDelta":
+        self.add(old, -1)
+        self.add(new)
+        return self
+
+    def apply(self) -> list:
+        """Write the accumulated changes in one statement; call inside the writing transaction.
+
+        Returns:
+            list: Budget alerts raised by this month's expenses (see `core.budgets.track_spend`)
+        """
+        changes = [(key, change) for key, change in self._changes.items() if change[0] or change[1]]
+        if self._edited_users:
+            bump_versions(sorted(self._edited_users))
+            self._edited_users.clear()
+        if not changes:
+            return []
+        params = []
+        for (user_id, month, category_id, currency_id, kind), (total, count) in sorted(
+            changes, key=lambda item: tuple(str(part) for part in item[0])
+        ):
+            params.extend((user_id, month, category_id, currency_id, kind, total, count))
+        values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(changes))
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_SQL.format(values=values), params)
+            emptied_users = sorted({key[0] for key, change in changes if change[1] < 0})
+            if emptied_users:
+                cursor.execute(f"DELETE FROM {_table} WHERE user_id = ANY(%s) AND count = 0", [emptied_users])
+        self._changes.clear()
+
+        month = budgets.current_month()
+        return budgets.track_spend([
+            (user_id, category_id, currency_id, total)
+            for (user_id, change_month, category_id, currency_id, kind), (total, _) in changes
+            if kind == Transaction.EXPENSE and change_month == month
+        ], month)
+
+
+def bump_versions(user_ids: Optional[list] = None) -> None:
+    """Bump the `CacheVersion.USER_TRANSACTIONS` counter of some users (or everyone)."""
+    with connection.cursor() as cursor:
+        if user_ids is None:
+            cursor.execute(
+                BUMP_VERSIONS_SQL.format(users=f"(SELECT id AS user_id FROM {User._meta.db_table}) AS users"),
+                [CacheVersion.USER_TRANSACTIONS],
+            )
+        else:
+            cursor.execute(
+                BUMP_VERSIONS_SQL.format(users="unnest(%s::bigint[]) AS user_id"),
+                [CacheVersion.USER_TRANSACTIONS, list(user_ids)],
+            )
+
+
+def rebuild(user_id: Optional[int] = None) -> int:
+    """Recompute rollups from the transaction table (for one user or everyone).
+
+    Call inside a transaction so readers never see the table half-built.
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    where, params = ("WHERE user_id = %s", [user_id]) if user_id is not None else ("", [])
+    # The rows may have been changed behind the rollups' back, so their caches are stale too
+    bump_versions([user_id] if user_id is not None else None)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {_table} {where}", params)
+        cursor.execute(
+            f"INSERT INTO {_table} (user_id, month, category_id, currency_id, kind, total, count) "
+            + SOURCE_SQL.format(where=where),
+            params,
+        )
+        return cursor.rowcount
+
+
+def verify(user_id: Optional[int] = None) -> list:
+    """Compare rollups with totals computed from the transaction table.
+
+    Returns:
+        list: One dict per mismatching bucket with the expected and stored total and count
+    """
+    where, params = ("WHERE user_id = %s", [user_id]) if user_id is not None else ("", [])
+    sql = f"""
+        SELECT COALESCE(source.user_id, rollup.user_id), COALESCE(source.month, rollup.month),
+               COALESCE(source.category_id, rollup.category_id), COALESCE(source.currency_id, rollup.currency_id),
+               COALESCE(source.kind, rollup.kind), source.total, source.count, rollup.total, rollup.count
+        FROM ({SOURCE_SQL.format(where=where)}) AS source
+        FULL OUTER JOIN (SELECT * FROM {_table} {where}) AS rollup
+            ON source.user_id = rollup.user_id AND source.month = rollup.month
+            AND COALESCE(source.category_id, 0) = COALESCE(rollup.category_id, 0)
+            AND source.currency_id = rollup.currency_id AND source.kind = rollup.kind
+        WHERE source.total IS DISTINCT FROM rollup.total OR source.count IS DISTINCT FROM rollup.count
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params * 2)
+        return [
+            {
+                "user_id": row[0], "month": row[1], "category_id": row[2], "currency_id": row[3], "kind": row[4],
+                "expected_total": row[5], "expected_count": row[6], "total": row[7], "count": row[8],
+            }
+            for row in cursor.fetchall()
+        ]
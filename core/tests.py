@@ -1,7 +1,21 @@
-from django.test import TestCase
+import json
+import math
+import os
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from django.db import connection, connections
+from django.test import TestCase, override_settings
+from django.db import models
+from django.contrib.postgres.search import SearchQuery, SearchRank
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from io import StringIO
-from core.models import Currency
+from core import analytics, partitions, recurrence, rollups
+from core.models import CacheVersion, Category, Currency, Expense, Income, MonthlyRollup, RecurringRule, Transaction, User
+from core.exchange import ExchangeRates, RateFormatError, parse_rates
+from core.reference import currency_cache, exchange_rate_cache
 
 class CurrencyCommandTest(TestCase):
     def test_load_currencies_command(self):
@@ -37,3 +51,462 @@ class CurrencyCommandTest(TestCase):
         
         default = Currency.get_default()
         self.assertEqual(default, test_currency)
+
+
+class CurrencyCacheTest(TestCase):
+    def setUp(self):
+        currency_cache.invalidate()
+        self.usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$', is_default=True)
+        self.eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        
+    def test_default_served_from_cache(self):
+        self.assertEqual(currency_cache.get_default(), self.usd)
+        with self.assertNumQueries(0):
+            self.assertEqual(currency_cache.get_default(), self.usd)
+            self.assertEqual(currency_cache.get('eur'), self.eur)
+            
+    def test_save_invalidates_on_commit(self):
+        self.assertEqual(currency_cache.get_default(), self.usd)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.eur.is_default = True
+            self.eur.save()
+        self.assertEqual(currency_cache.get_default(), self.eur)
+        
+    def test_version_bump_from_another_process(self):
+        self.assertEqual(currency_cache.get_default(), self.usd)
+        # Another process switches the default without touching our in-memory state
+        Currency.objects.filter(pk=self.usd.pk).update(is_default=False)
+        Currency.objects.filter(pk=self.eur.pk).update(is_default=True)
+        CacheVersion.objects.filter(name=CacheVersion.CURRENCY).update(version=models.F('version') + 1)
+        
+        currency_cache._checked_at -= currency_cache.check_interval
+        self.assertEqual(currency_cache.get_default(), self.eur)
+
+
+class ExchangeRatesTest(TestCase):
+    USD, EUR, GBP, JPY = 1, 2, 3, 4
+    
+    def setUp(self):
+        # Everything quoted against EUR, the way a central bank feed is
+        self.rates = ExchangeRates.from_rows([
+            (self.EUR, self.USD, date(2024, 1, 2), '1.10'),
+            (self.EUR, self.USD, date(2024, 1, 1), '1.00'),
+            (self.EUR, self.GBP, date(2024, 1, 1), '0.80'),
+            (self.EUR, self.GBP, date(2024, 1, 3), '0.90'),
+        ])
+    
+    def test_as_of_lookup(self):
+        self.assertEqual(self.rates.rate(self.EUR, self.USD, date(2024, 1, 1)), 1.0)
+        self.assertEqual(self.rates.rate(self.EUR, self.USD, date(2024, 6, 1)), 1.1)
+        self.assertIsNone(self.rates.rate(self.EUR, self.USD, date(2023, 12, 31)))
+        self.assertAlmostEqual(self.rates.rate(self.USD, self.EUR, date(2024, 1, 2)), 1 / 1.1)
+        # USD -> GBP through EUR, with whichever rates were current on each day
+        self.assertAlmostEqual(self.rates.rate(self.USD, self.GBP, date(2024, 1, 2)), 0.8 / 1.1)
+        self.assertAlmostEqual(self.rates.rate(self.USD, self.GBP, date(2024, 1, 3)), 0.9 / 1.1)
+        self.assertIsNone(self.rates.rate(self.USD, self.JPY, date(2024, 1, 3)))
+    
+    def test_convert_mixed_currencies(self):
+        converted = self.rates.convert(
+            [100, 100, 100, 100, 100],
+            [self.EUR, self.USD, self.GBP, self.JPY, self.EUR],
+            [date(2024, 1, 2), datetime(2024, 1, 2, 18), date(2024, 1, 3), date(2024, 1, 3), date(2023, 1, 1)],
+            to=self.EUR,
+        )
+        self.assertEqual(converted[0], 100)
+        self.assertAlmostEqual(converted[1], 100 / 1.1)
+        self.assertAlmostEqual(converted[2], 100 / 0.9)
+        self.assertTrue(math.isnan(converted[3]))
+        self.assertEqual(converted[4], 100)
+    
+    def test_parse_feed_shapes(self):
+        expected = [(date(2024, 1, 2), 'EUR', 'USD', Decimal('1.09'))]
+        self.assertEqual(parse_rates('date,base,quote,rate\n2024-01-02,eur,usd,1.09\n'), expected)
+        self.assertEqual(parse_rates('[{"date": "2024-01-02", "base": "EUR", "quote": "USD", "rate": 1.09}]'), expected)
+        self.assertEqual(parse_rates('{"base": "EUR", "date": "2024-01-02", "rates": {"USD": 1.09}}'), expected)
+        self.assertEqual(parse_rates('{"base": "EUR", "rates": {"2024-01-02": {"USD": 1.09}}}'), expected)
+        for rate in ('NaN', 'Infinity', '-1', '0'):
+            with self.assertRaises(RateFormatError):
+                parse_rates(f'date,base,quote,rate\n2024-01-02,EUR,USD,{rate}\n')
+    
+    def test_load_command_refreshes_cache(self):
+        exchange_rate_cache.invalidate()
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$', is_default=True)
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        self.assertIsNone(exchange_rate_cache.get().rate(eur.pk, usd.pk, date(2024, 1, 2)))
+        
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as rates_file:
+            rates_file.write('{"base": "EUR", "date": "2024-01-02", "rates": {"USD": 1.09, "XXX": 3}}')
+        self.addCleanup(os.unlink, path)
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_exchange_rates', path, stdout=out)
+        
+        self.assertIn('Loaded 1 exchange rates', out.getvalue())
+        self.assertIn('unknown currency XXX', out.getvalue())
+        self.assertEqual(exchange_rate_cache.get().rate(eur.pk, usd.pk, date(2024, 1, 5)), 1.09)
+
+
+class AnalyticsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.enterContext(override_settings(ANALYTICS_CACHE_DIR=self.directory.name))
+        self.store = analytics.snapshots
+        self.user = User.objects.create(username='ada')
+        self.usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$', is_default=True)
+        self.eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.rent = Category.objects.create(user=self.user, name='Rent')
+    
+    def add(self, model, amount, day, category=None, currency=None):
+        obj = model.objects.create(
+            user=self.user, amount=amount, date=datetime.combine(day, datetime.min.time()),
+            category=category, currency=currency or self.usd,
+        )
+        rollups.RollupDelta().created([obj]).apply()
+        return obj
+    
+    def test_snapshot_appends_new_rows_and_rebuilds_after_changes(self):
+        self.add(Expense, '10.50', date(2024, 1, 5), self.food)
+        self.add(Income, '100', date(2024, 1, 6))
+        snapshot = self.store.load(self.user.pk)
+        self.assertEqual(snapshot.cents.tolist(), [1050, 10000])
+        self.assertEqual(snapshot.category.tolist(), [self.food.pk, analytics.NO_CATEGORY])
+        self.assertEqual(snapshot.income.tolist(), [0, 1])
+        self.assertEqual(snapshot.day[0], (date(2024, 1, 5) - date(1970, 1, 1)).days)
+        
+        column = os.path.join(self.directory.name, str(self.user.pk), 'cents.bin')
+        inode = os.stat(column).st_ino
+        for day in range(1, 6):
+            expense = self.add(Expense, '1', date(2024, 2, day), self.rent)
+        self.assertEqual(len(self.store.load(self.user.pk)), 7)
+        self.assertEqual(os.stat(column).st_ino, inode)  # Appended in place
+        
+        expense.amount = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            expense.save()
+        Transaction.objects.filter(pk=expense.pk).update(amount=1)  # Put back behind the ORM's back
+        self.assertEqual(self.store.load(self.user.pk).cents.tolist()[-1], 100)
+        self.assertNotEqual(os.stat(column).st_ino, inode)  # Rebuilt
+        
+        # A bulk change the rollups know about but no signal reported
+        Transaction.objects.filter(pk=expense.pk).update(amount=3)
+        rollups.rebuild(self.user.pk)
+        self.assertEqual(sorted(self.store.load(self.user.pk).cents.tolist()), [100] * 4 + [300, 1050, 10000])
+    
+    def test_snapshot_rebuilds_after_edits_from_other_processes(self):
+        expense = self.add(Expense, '10', date(2024, 1, 5), self.food)
+        self.assertEqual(self.store.load(self.user.pk).day.tolist(), [(date(2024, 1, 5) - date(1970, 1, 1)).days])
+
+        # Moved to another day of the month: same rollup totals, and no local discard (its
+        # on-commit callback is not run, as if the edit came from another process)
+        old = Transaction.objects.get(pk=expense.pk)
+        expense.date = datetime(2024, 1, 20)
+        expense.save()
+        rollups.RollupDelta().updated(old, expense).apply()
+        self.assertEqual(self.store.load(self.user.pk).day.tolist(), [(date(2024, 1, 20) - date(1970, 1, 1)).days])
+
+    def test_least_recently_loaded_snapshots_are_evicted(self):
+        store = analytics.SnapshotStore(max_users=2)
+        users = [self.user] + [User.objects.create(username=f'user{index}') for index in range(2)]
+        for index, user in enumerate(users):
+            store.load(user.pk)
+            os.utime(os.path.join(self.directory.name, str(user.pk)), (index, index))
+        self.assertEqual(sorted(os.listdir(self.directory.name)), sorted(str(user.pk) for user in users[1:]))
+        self.assertEqual(len(store.load(self.user.pk)), 0)
+
+    def test_statistics(self):
+        rates =ExchangeRates.from_rows([(self.eur.pk, self.usd.pk, date(2024, 1, 1), '2')])
+        self.add(Expense, '30', date(2024, 2, 10), self.food)
+        self.add(Expense, '15', date(2024, 2, 20), self.rent, self.eur)  # $30
+        self.add(Expense, '60', date(2024, 3, 1), self.food)
+        self.add(Expense, '10', date(2024, 3, 2))
+        self.add(Income, '500', date(2024, 3, 1))
+        self.add(Expense, '99', date(2023, 12, 31), self.food)
+        stats = analytics.UserAnalytics(
+            self.store.load(self.user.pk), rates, self.usd.pk, date(2024, 3, 10), {self.eur.pk: 'EUR'}
+        )
+        self.assertEqual(stats.missing, [])
+        
+        monthly = stats.monthly_totals(3)
+        self.assertEqual(monthly['months'], [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)])
+        self.assertEqual(monthly['expense'].tolist(), [0, 60, 70])
+        self.assertEqual(monthly['net'].tolist(), [0, -60, 430])
+        
+        self.assertEqual(stats.daily_spend(10).tolist(), [60, 10, 0, 0, 0, 0, 0, 0, 0, 0])
+        self.assertAlmostEqual(stats.moving_average(window=10, days=1)[0], 7.0)
+        self.assertAlmostEqual(stats.moving_average(window=30, days=1)[0], 130 / 30)
+        
+        shares = stats.category_shares(2)
+        self.assertEqual(shares['categories'].tolist(), [self.food.pk, self.rent.pk, analytics.NO_CATEGORY])
+        self.assertEqual(shares['totals'].tolist(), [[30, 30, 0], [60, 0, 10]])
+        self.assertAlmostEqual(shares['shares'][1][0], 60 / 70)
+        
+        forecast = stats.forecast(trailing_days=10)
+        self.assertEqual(forecast['month'], date(2024, 3, 1))
+        self.assertEqual(forecast['spent'], 70)
+        self.assertAlmostEqual(forecast['projected'], 70 + 7.0 * 21)
+        
+        no_rates = analytics.UserAnalytics(
+            self.store.load(self.user.pk), ExchangeRates({}), self.usd.pk, date(2024, 3, 10), {self.eur.pk: 'EUR'}
+        )
+        self.assertEqual(no_rates.missing, ['EUR'])
+        self.assertEqual(no_rates.monthly_totals(2)['expense'].tolist(), [30, 70])
+
+
+class RecurrenceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='rec', telegram_id=1)
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$', is_default=True)
+        self.category = Category.objects.create(user=self.user, name='Rent')
+    
+    def rule(self, frequency, start, cron=''):
+        return RecurringRule.objects.create(
+            user=self.user, kind=Transaction.EXPENSE, amount=Decimal('1200'), currency=self.currency,
+            category=self.category, frequency=frequency, cron=cron, start=start, next_run=start,
+        )
+    
+    def test_schedules(self):
+        monthly = RecurringRule(frequency=RecurringRule.MONTHLY, start=datetime(2023, 1, 31, 9))
+        self.assertEqual(recurrence.next_after(monthly, datetime(2023, 1, 31, 9)), datetime(2023, 2, 28, 9))
+        self.assertEqual(recurrence.next_after(monthly, datetime(2023, 2, 28, 9)), datetime(2023, 3, 31, 9))
+        self.assertEqual(recurrence.next_after(monthly, datetime(2022, 6, 1)), datetime(2023, 1, 31, 9))
+        weekly = RecurringRule(frequency=RecurringRule.WEEKLY, start=datetime(2024, 1, 1, 8))
+        self.assertEqual(recurrence.next_after(weekly, datetime(2024, 1, 10)), datetime(2024, 1, 15, 8))
+        # Weekdays at 9:00, from a Friday afternoon
+        weekdays = recurrence.Cron('0 9 * * 1-5')
+        self.assertEqual(weekdays.next_after(datetime(2024, 3, 1, 15)), datetime(2024, 3, 4, 9))
+        # Both day fields restricted: the 1st of the month or any Sunday (7 is Sunday too)
+        either = recurrence.Cron('30 12 1 * 7')
+        self.assertEqual(either.next_after(datetime(2024, 3, 1, 13)), datetime(2024, 3, 3, 12, 30))
+        self.assertEqual(recurrence.Cron('0 0 29 2 *').next_after(datetime(2024, 3, 1)), datetime(2028, 2, 29))
+        # A stepped `*` still leaves the day field unrestricted: odd days that are Mondays
+        self.assertEqual(recurrence.Cron('0 9 */2 * 1').next_after(datetime(2024, 3, 1, 10)), datetime(2024, 3, 11, 9))
+        # 5/10 is the 5th, 15th and 25th
+        self.assertEqual(sorted(recurrence.Cron('0 0 5/10 * *').days), [5, 15, 25])
+        self.assertEqual(recurrence.Cron('0 0 5/10 * *').next_after(datetime(2024, 3, 6)), datetime(2024, 3, 15))
+        for invalid in ('* * *', '60 * * * *', '0 0 30 2 *'):
+            with self.assertRaises(ValueError):
+                recurrence.first_run(RecurringRule.CRON, invalid, datetime(2024, 1, 1))
+    
+    def test_record_due_catches_up_once(self):
+        monthly = self.rule(RecurringRule.MONTHLY, datetime(2024, 1, 31, 9))
+        daily = self.rule(RecurringRule.DAILY, datetime(2024, 4, 10, 7))
+        now = datetime(2024, 4, 15, 12)
+        
+        result = recurrence.record_due(now, max_occurrences=4)
+        self.assertEqual(result['created'], 7)
+        self.assertEqual({fired['rule_id']: fired['count'] for fired in result['fired']}, {monthly.pk: 3, daily.pk: 4})
+        self.assertEqual(
+            list(Transaction.objects.filter(description='', amount=1200).order_by('date').values_list('date', flat=True)[:3]),
+            [datetime(2024, 1, 31, 9), datetime(2024, 2, 29, 9), datetime(2024, 3, 31, 9)],
+        )
+        self.assertEqual(rollups.verify(), [])
+        monthly.refresh_from_db()
+        self.assertEqual((monthly.last_run, monthly.next_run), (datetime(2024, 3, 31, 9), datetime(2024, 4, 30, 9)))
+        
+        # The daily rule was capped at four occurrences and is still due
+        result = recurrence.record_due(now, max_occurrences=4)
+        self.assertEqual([(fired['rule_id'], fired['count']) for fired in result['fired']], [(daily.pk, 2)])
+        self.assertEqual(recurrence.record_due(now)['created'], 0)
+        self.assertEqual(Transaction.objects.count(), 9)
+    
+    def test_monthly_rule_created_at_month_end_keeps_its_day(self):
+        rule = recurrence.create_rule(
+            self.user.pk, Transaction.EXPENSE, Decimal('1200'), self.currency.pk, self.category.pk,
+            RecurringRule.MONTHLY, now=datetime(2026, 1, 31, 9, 0, 42),
+        )
+        self.assertEqual((rule.start, rule.next_run), (datetime(2026, 1, 31, 9), datetime(2026, 2, 28, 9)))
+
+        recurrence.record_due(datetime(2026, 5, 1))
+        self.assertEqual(
+            list(Transaction.objects.order_by('date').values_list('date', flat=True)),
+            [datetime(2026, 2, 28, 9), datetime(2026, 3, 31, 9), datetime(2026, 4, 30, 9)],
+        )
+        rule.refresh_from_db()
+        self.assertEqual(rule.next_run, datetime(2026, 5, 31, 9))
+
+    def test_skips_while_another_process_holds_the_lock(self):
+        self.rule(RecurringRule.DAILY, datetime(2024, 4, 10, 7))
+        other = connections.create_connection('default')
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_lock(%s)', [recurrence.LOCK_KEY])
+            self.assertIsNone(recurrence.record_due(datetime(2024, 4, 15)))
+            with other.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [recurrence.LOCK_KEY])
+        finally:
+            other.close()
+        self.assertEqual(recurrence.record_due(datetime(2024, 4, 15))['created'], 5)
+
+
+class RebuildRollupsCommandTest(TestCase):
+    def test_rebuild_repairs_drift(self):
+        user = User.objects.create(username='ada')
+        currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$', is_default=True)
+        category = Category.objects.create(user=user, name='Food')
+        Income.objects.create(user=user, amount=100, currency=currency)
+        Expense.objects.create(user=user, amount=10, currency=currency, category=category)
+        Expense.objects.create(user=user, amount=5, currency=currency, category=category)
+        
+        # Rows written without FinanceService are not in the rollups yet
+        self.assertEqual(len(rollups.verify()), 2)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--verify-only', stdout=StringIO())
+        
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('Rollups match the transactions', out.getvalue())
+        self.assertEqual(MonthlyRollup.objects.get(kind='expense').count, 2)
+        # Caches of the rows are told to rebuild too
+        self.assertEqual(CacheVersion.current(f'{CacheVersion.USER_TRANSACTIONS}{user.pk}'), 1)
+
+
+def plan_nodes(plan: dict):
+    """Yield every node of an `EXPLAIN (FORMAT JSON)` plan tree."""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+class QueryPlanTest(TestCase):
+    """Runs the key per-user queries through EXPLAIN over a realistic data volume.
+    
+    Fails when a query reads a transaction table (or a non-empty partition of
+    one) with a sequential scan, or sorts rows that no index selected, which
+    means it no longer matches an index. Rows gathered from several
+    partitions are sorted after their index scans: with a default partition,
+    Postgres cannot return them in index order across partitions.
+    """
+    USERS = 25
+    ROWS_PER_USER = 1000
+    SCANNED_TABLES = (Transaction._meta.db_table, MonthlyRollup._meta.db_table)
+    WORDS = ['coffee', 'groceries', 'rent', 'taxi', 'lunch', 'salary', 'refund', 'gym', 'books', 'pharmacy',
+             'cinema', 'fuel', 'bakery', 'internet', 'phone', 'gift', 'parking', 'dentist', 'flowers', 'shoes']
+    
+    @classmethod
+    def setUpTestData(cls):
+        partitions.ensure_partitions(first=date(2023, 1, 1))
+        rng = random.Random(42)
+        currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$', is_default=True)
+        start = datetime(2023, 1, 1)
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(cls.USERS)])
+        for user in users:
+            categories = Category.objects.bulk_create([Category(user=user, name=f'Category {i}') for i in range(10)])
+            rows = [
+                (rng.random() < 0.2, dict(
+                    user=user, currency=currency, category=rng.choice(categories),
+                    amount=rng.randint(1, 50000) / 100, date=start + timedelta(minutes=rng.randint(0, 1051200)),
+                    import_hash=f'{user.pk}-{i}', description=' '.join(rng.sample(cls.WORDS, 2)),
+                ))
+                for i in range(cls.ROWS_PER_USER)
+            ]
+            Income.objects.bulk_create([Income(**fields) for is_income, fields in rows if is_income])
+            Expense.objects.bulk_create([Expense(**fields) for is_income, fields in rows if not is_income])
+        rollups.rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute(
+                "SELECT relname FROM pg_class WHERE relkind = 'r' AND relname LIKE %s AND reltuples <= 0",
+                [f'{Transaction._meta.db_table}%'],
+            )
+            cls.empty_partitions = {row[0] for row in cursor.fetchall()}
+        cls.user = users[len(users) // 2]
+        cls.category = cls.user.categories.first()
+    
+    def assertUsesIndexes(self, queryset):
+        plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        for node in plan_nodes(plan):
+            with self.subTest(query=str(queryset.query)[:200], node=node['Node Type']):
+                if node['Node Type'] in ('Sort', 'Incremental Sort'):
+                    self.assertIn('Append', [child['Node Type'] for child in plan_nodes(node)])
+                if node['Node Type'] == 'Seq Scan' and node['Relation Name'] not in self.empty_partitions:
+                    self.assertFalse(node['Relation Name'].startswith(self.SCANNED_TABLES), node['Relation Name'])
+    
+    def scanned_partitions(self, queryset):
+        plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        return {node['Relation Name'] for node in plan_nodes(plan) if 'Relation Name' in node}
+    
+    def test_history_page(self):
+        for model in (Transaction, Income, Expense):
+            self.assertUsesIndexes(model.objects.filter(user=self.user)[:20])
+            self.assertUsesIndexes(model.objects.filter(user=self.user).order_by('-date', '-id')[:20])
+        # Keyset pages (see api.services.history): a deep page reads no more rows than the first
+        date, pk = Transaction.objects.filter(user=self.user).order_by('date', 'id').values_list('date', 'id')[20]
+        older = Transaction.objects.filter(user=self.user, date__lte=date).exclude(date=date, id__gte=pk)
+        newer = Transaction.objects.filter(user=self.user, date__gte=date).exclude(date=date, id__lte=pk)
+        for queryset in (older.order_by('-date', '-id'), newer.order_by('date', 'id')):
+            page = queryset.values_list('id', 'kind', 'date', 'amount', 'currency__symbol', 'category__name')[:11]
+            self.assertUsesIndexes(page)
+            plan = json.loads(page.explain(format='json'))[0]['Plan']
+            self.assertNotIn('Sort', [node['Node Type'] for node in plan_nodes(plan)])
+    
+    def test_date_range(self):
+        self.assertUsesIndexes(Expense.objects.filter(
+            user=self.user, date__gte=datetime(2024, 3, 1), date__lt=datetime(2024, 4, 1)
+        ))
+    
+    def test_date_range_prunes_partitions(self):
+        queryset = Transaction.objects.filter(
+            user=self.user, date__gte=datetime(2024, 3, 1), date__lt=datetime(2024, 4, 1)
+        )
+        self.assertEqual(self.scanned_partitions(queryset), {partitions.partition_name(date(2024, 3, 1))})
+    
+    def test_category_drill_down(self):
+        self.assertUsesIndexes(Expense.objects.filter(
+            user=self.user, category=self.category, date__gte=datetime(2024, 1, 1)
+        ).order_by('date'))
+    
+    def test_monthly_summary(self):
+        self.assertUsesIndexes(MonthlyRollup.objects.filter(
+            user=self.user, month__gte=datetime(2024, 1, 1).date()
+        ).select_related('category', 'currency').order_by())
+    
+    def test_search(self):
+        query = SearchQuery(f'{self.user.pk}:D & groc:*A & cof:*A', search_type='raw', config='simple')
+        self.assertUsesIndexes(Transaction.objects.filter(user=self.user, search_vector=query).annotate(
+            rank=SearchRank(models.F('search_vector'), query)
+        ).order_by('-rank', '-date', '-id')[:11])
+    
+    def test_import_duplicate_check(self):
+        hashes = [f'{self.user.pk}-{i}' for i in range(0, 1000, 7)]
+        self.assertUsesIndexes(
+            Transaction.objects.filter(user=self.user, import_hash__in=hashes).values_list('import_hash', flat=True).order_by()
+        )
+    
+    def test_export(self):
+        self.assertUsesIndexes(Transaction.objects.filter(user=self.user).values_list(
+            'kind', 'date', 'amount', 'currency__code', 'category__name', 'description'
+        ).order_by('date', 'id'))
+
+
+class PartitionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='partitioned')
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$', is_default=True)
+    
+    def partition_of(self, obj):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT tableoid::regclass::text FROM {Transaction._meta.db_table} WHERE id = %s', [obj.pk])
+            return cursor.fetchone()[0]
+    
+    def test_rows_outside_partitions_move_when_their_month_is_created(self):
+        old = Expense.objects.create(user=self.user, amount=10, currency=self.currency, date=datetime(1999, 5, 10))
+        self.assertEqual(self.partition_of(old), partitions.DEFAULT_PARTITION)
+        
+        created = partitions.ensure_partitions(months_ahead=0)
+        
+        self.assertIn('core_transaction_p199905', created)
+        self.assertEqual(self.partition_of(old), 'core_transaction_p199905')
+        self.assertEqual(Expense.objects.get(pk=old.pk).amount, 10)
+        self.assertEqual(partitions.ensure_partitions(months_ahead=0), [])
+    
+    def test_proxies_share_the_table(self):
+        income = Income.objects.create(user=self.user, amount=100, currency=self.currency)
+        Expense.objects.bulk_create([Expense(user=self.user, amount=5, currency=self.currency)])
+        
+        self.assertEqual(income.kind, 'income')
+        self.assertEqual(list(Expense.objects.values_list('kind', flat=True)), ['expense'])
+        self.assertEqual(Income.objects.get().pk, income.pk)
+        self.assertEqual(Transaction.objects.count(), 2)
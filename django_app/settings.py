@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -158,4 +159,103 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.User'
+
+# Telegram webhook ingestion
+# "sync" processes each update before answering the webhook, "queue" validates the
+# update, hands it to the per-user worker pool and answers immediately.
+WEBHOOK_MODE = os.environ.get('WEBHOOK_MODE', 'sync')
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 8))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 100))
+# In "sync" mode, return the last Bot API call a handler makes (e.g. the menu edit)
+# as the webhook response instead of sending it separately.
+WEBHOOK_INLINE_REPLY = os.environ.get('WEBHOOK_INLINE_REPLY', 'false').lower() == 'true'
+
+# Redelivered updates are dropped if their update_id is within the last
+# WEBHOOK_DEDUP_WINDOW ids; WEBHOOK_DEDUP_PERSIST keeps the window across restarts.
+WEBHOOK_DEDUP_WINDOW = int(os.environ.get('WEBHOOK_DEDUP_WINDOW', 10000))
+WEBHOOK_DEDUP_PERSIST = os.environ.get('WEBHOOK_DEDUP_PERSIST', 'false').lower() == 'true'
+
+# Concurrent per-user workers used when replaying updates through /api/webhook/bulk
+BULK_INGEST_CONCURRENCY = int(os.environ.get('BULK_INGEST_CONCURRENCY', 8))
+
+# Logging for the FastAPI app (JSON lines written from a background thread).
+# LOG_PAYLOAD_SAMPLE_RATE=N logs the full, redacted payload of 1 in N updates; 0 disables.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_PAYLOAD_SAMPLE_RATE = int(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', 100))
+
+# In-process identity map from Telegram user id to user (LRU-bounded, TTL in seconds)
+IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE', 10000))
+IDENTITY_CACHE_TTL = float(os.environ.get('IDENTITY_CACHE_TTL', 300))
+
+# Seconds between checks of the reference data (currency) cache version
+REFERENCE_CACHE_CHECK_INTERVAL = float(os.environ.get('REFERENCE_CACHE_CHECK_INTERVAL', 5))
+
+# Maximum number of (user, category name) -> category id entries cached in process
+CATEGORY_CACHE_SIZE = int(os.environ.get('CATEGORY_CACHE_SIZE', 10000))
+
+# Rows per INSERT statement in FinanceService.bulk_create_transactions
+BULK_CREATE_CHUNK_SIZE = int(os.environ.get('BULK_CREATE_CHUNK_SIZE', 1000))
+
+# Bank statement CSV import: largest accepted file (the Bot API download limit),
+# imports running at once, and seconds between progress message edits
+STATEMENT_IMPORT_MAX_BYTES = int(os.environ.get('STATEMENT_IMPORT_MAX_BYTES', 20 * 1024 * 1024))
+STATEMENT_IMPORT_CONCURRENCY = int(os.environ.get('STATEMENT_IMPORT_CONCURRENCY', 2))
+STATEMENT_IMPORT_PROGRESS_INTERVAL = float(os.environ.get('STATEMENT_IMPORT_PROGRESS_INTERVAL', 3))
+
+# Rows fetched per round-trip from the server-side cursor when exporting transactions,
+# exports running at once (each holds a thread and a database connection), and exports
+# waiting for a thread before new ones are turned away
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+EXPORT_CONCURRENCY = int(os.environ.get('EXPORT_CONCURRENCY', 4))
+EXPORT_QUEUE_SIZE = int(os.environ.get('EXPORT_QUEUE_SIZE', 16))
+
+# Monthly partitions of the transaction table created ahead of the current month
+TRANSACTION_PARTITIONS_AHEAD = int(os.environ.get('TRANSACTION_PARTITIONS_AHEAD', 3))
+
+# Default file path or http(s) feed URL for `manage.py load_exchange_rates`
+EXCHANGE_RATES_SOURCE = os.environ.get('EXCHANGE_RATES_SOURCE', '')
+
+# Transactions per page of the History menu
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 10))
+
+# Transactions per page of /search results
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 10))
+
+# Directory of the per-user columnar snapshots used by the analytics (see core.analytics),
+# and users whose snapshots are kept there (the least recently loaded are removed)
+ANALYTICS_CACHE_DIR = os.environ.get('ANALYTICS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'finance-bot-analytics'))
+ANALYTICS_CACHE_MAX_USERS = int(os.environ.get('ANALYTICS_CACHE_MAX_USERS', 1000))
+
+# Recurring transactions (see api.services.scheduler): whether this process runs the
+# scheduler, rules recorded per transaction, and seconds between reloads of the rules
+# from the database (picks up changes made by other processes)
+RECURRING_SCHEDULER = os.environ.get('RECURRING_SCHEDULER', 'true').lower() == 'true'
+RECURRING_BATCH_SIZE = int(os.environ.get('RECURRING_BATCH_SIZE', 100))
+RECURRING_REFRESH_INTERVAL = float(os.environ.get('RECURRING_REFRESH_INTERVAL', 300))
+
+# Broadcasts and notifications (see api.services.broadcast): messages per second overall
+# (Telegram allows about 30) and to one chat (about 1), requests in flight, recipients
+# read per chunk, and seconds without progress after which a broadcast left running by a
+# stopped process is resumed on startup
+BROADCAST_RATE = float(os.environ.get('BROADCAST_RATE', 25))
+BROADCAST_CHAT_RATE = float(os.environ.get('BROADCAST_CHAT_RATE', 1))
+BROADCAST_CONCURRENCY = int(os.environ.get('BROADCAST_CONCURRENCY', 10))
+BROADCAST_CHUNK_SIZE = int(os.environ.get('BROADCAST_CHUNK_SIZE', 500))
+BROADCAST_LEASE = float(os.environ.get('BROADCAST_LEASE', 300))
+
+# Bot API HTTP clients (see api.services.bot_request). Interactive replies and bulk sends
+# (broadcasts, notifications, exports, imports) use separate connection pools so a
+# broadcast cannot starve replies. Pool sizes, idle connections kept open (default: the
+# pool size) and seconds they are kept, HTTP version ('2' needs `pip install "httpx[http2]"`),
+# connect/read/write timeouts, and seconds to wait for a free connection in each pool
+BOT_HTTP_POOL_SIZE = int(os.environ.get('BOT_HTTP_POOL_SIZE', 32))
+BOT_HTTP_BULK_POOL_SIZE = int(os.environ.get('BOT_HTTP_BULK_POOL_SIZE', 16))
+BOT_HTTP_KEEPALIVE_CONNECTIONS = int(os.environ['BOT_HTTP_KEEPALIVE_CONNECTIONS']) if os.environ.get('BOT_HTTP_KEEPALIVE_CONNECTIONS') else None
+BOT_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('BOT_HTTP_KEEPALIVE_EXPIRY', 30))
+BOT_HTTP_VERSION = os.environ.get('BOT_HTTP_VERSION', '1.1')
+BOT_HTTP_CONNECT_TIMEOUT = float(os.environ.get('BOT_HTTP_CONNECT_TIMEOUT', 5))
+BOT_HTTP_READ_TIMEOUT = float(os.environ.get('BOT_HTTP_READ_TIMEOUT', 5))
+BOT_HTTP_WRITE_TIMEOUT = float(os.environ.get('BOT_HTTP_WRITE_TIMEOUT', 5))
+BOT_HTTP_POOL_TIMEOUT = float(os.environ.get('BOT_HTTP_POOL_TIMEOUT', 1))
+BOT_HTTP_BULK_POOL_TIMEOUT = float(os.environ.get('BOT_HTTP_BULK_POOL_TIMEOUT', 10))